@@ -2,12 +2,15 @@ import torch
 from abc import abstractmethod
 from numpy import inf
 from logger import TensorboardWriter
+from utils import is_main_process, unwrap_model, CheckpointWriter, load_checkpoint
 
 
 class BaseTrainer:
     """
     Base class for all trainers
     """
+    amp_dtypes = {'fp32': None, 'bf16': torch.bfloat16, 'fp16': torch.float16}
+
     def __init__(self, model, criterion, metric_ftns, optimizer, config):
         self.config = config
         self.logger = config.get_logger('trainer', config['trainer']['verbosity'])
@@ -35,12 +38,33 @@ class BaseTrainer:
             if self.early_stop <= 0:
                 self.early_stop = inf
 
+        # mixed precision, the parameters and the optimizer state stay in fp32
+        self.precision = cfg_trainer.get('precision', 'fp32')
+        assert self.precision in self.amp_dtypes, \
+            "precision must be one of {}.".format(list(self.amp_dtypes))
+        self.amp_dtype = self.amp_dtypes[self.precision]
+        device_type = next(model.parameters()).device.type
+        # fp16 gradients need loss scaling not to underflow, bf16 ones have the range of fp32
+        self.scaler = torch.amp.GradScaler(device_type) if self.precision == 'fp16' else None
+
         self.start_epoch = 1
 
         self.checkpoint_dir = config.save_dir
+        # checkpoints are written in the background, keeping the last `keep_last` (all by default)
+        # and the `keep_best` best ones
+        self.checkpoint_writer = None
+        if is_main_process():
+            self.checkpoint_writer = CheckpointWriter(self.checkpoint_dir,
+                                                      keep_last=cfg_trainer.get('keep_last'),
+                                                      keep_best=cfg_trainer.get('keep_best', 0),
+                                                      mode=self.mnt_mode, logger=self.logger)
 
         # setup visualization writer instance
-        self.writer = TensorboardWriter(config.log_dir, self.logger, cfg_trainer['tensorboard'])
+        self.writer = TensorboardWriter(config.log_dir, self.logger, cfg_trainer['tensorboard'] and is_main_process(),
+                                        rates=cfg_trainer.get('tensorboard_rates'))
+
+        # functions called with the epoch and its log after every epoch, training stops if one returns True
+        self.epoch_callbacks = []
 
         if config.resume is not None:
             self._resume_checkpoint(config.resume)
@@ -58,6 +82,14 @@ class BaseTrainer:
         """
         Full training logic
         """
+        try:
+            self._train()
+        finally:
+            self.writer.close()
+            if self.checkpoint_writer is not None:
+                self.checkpoint_writer.close()
+
+    def _train(self):
         not_improved_count = 0
         for epoch in range(self.start_epoch, self.epochs + 1):
             result = self._train_epoch(epoch)
@@ -96,32 +128,39 @@ class BaseTrainer:
                     break
 
             if epoch % self.save_period == 0:
-                self._save_checkpoint(epoch, save_best=best)
+                self._save_checkpoint(epoch, save_best=best, log=log)
 
-    def _save_checkpoint(self, epoch, save_best=False):
+            if any([callback(epoch, log) for callback in self.epoch_callbacks]):
+                self.logger.info('Training stopped at epoch {}.'.format(epoch))
+                break
+
+    def _save_checkpoint(self, epoch, save_best=False, log=None):
         """
-        Saving checkpoints
+        Saving checkpoints, in the background
 
         :param epoch: current epoch number
+        :param save_best: if True, link the saved checkpoint to 'model_best.pth'
         :param log: logging information of the epoch
-        :param save_best: if True, rename the saved checkpoint to 'model_best.pth'
         """
-        arch = type(self.model).__name__
+        # every process holds the same weights, only the main one saves them
+        if not is_main_process():
+            return
+        model = unwrap_model(self.model)
+        arch = type(model).__name__
+        score = log.get(self.mnt_metric) if self.mnt_mode != 'off' and log is not None else None
         state = {
             'arch': arch,
             'epoch': epoch,
-            'state_dict': self.model.state_dict(),
+            'state_dict': model.state_dict(),
             'optimizer': self.optimizer.state_dict(),
             'monitor_best': self.mnt_best,
-            'config': self.config
+            'score': score,
+            'precision': self.precision,
+            'scaler': self.scaler.state_dict() if self.scaler is not None else None,
+            # plain dict, so that the checkpoint loads with weights_only
+            'config': self.config.config
         }
-        filename = str(self.checkpoint_dir / 'checkpoint-epoch{}.pth'.format(epoch))
-        torch.save(state, filename)
-        self.logger.info("Saving checkpoint: {} ...".format(filename))
-        if save_best:
-            best_path = str(self.checkpoint_dir / 'model_best.pth')
-            torch.save(state, best_path)
-            self.logger.info("Saving current best: model_best.pth ...")
+        self.checkpoint_writer.save(state, epoch, score=score, best=save_best)
 
     def _resume_checkpoint(self, resume_path):
         """
@@ -131,7 +170,7 @@ class BaseTrainer:
         """
         resume_path = str(resume_path)
         self.logger.info("Loading checkpoint: {} ...".format(resume_path))
-        checkpoint = torch.load(resume_path)
+        checkpoint = load_checkpoint(resume_path, map_location=None)
         self.start_epoch = checkpoint['epoch'] + 1
         self.mnt_best = checkpoint['monitor_best']
 
@@ -139,7 +178,7 @@ class BaseTrainer:
         if checkpoint['config']['arch'] != self.config['arch']:
             self.logger.warning("Warning: Architecture configuration given in config file is different from that of "
                                 "checkpoint. This may yield an exception while state_dict is being loaded.")
-        self.model.load_state_dict(checkpoint['state_dict'])
+        unwrap_model(self.model).load_state_dict(checkpoint['state_dict'])
 
         # load optimizer state from checkpoint only when optimizer type is not changed.
         if checkpoint['config']['optimizer']['type'] != self.config['optimizer']['type']:
@@ -148,4 +187,10 @@ class BaseTrainer:
         else:
             self.optimizer.load_state_dict(checkpoint['optimizer'])
 
+        if checkpoint.get('precision', 'fp32') != self.precision:
+            self.logger.warning("Warning: Precision given in config file ({}) is different from that of checkpoint "
+                                "({}).".format(self.precision, checkpoint.get('precision', 'fp32')))
+        elif self.scaler is not None and checkpoint.get('scaler') is not None:
+            self.scaler.load_state_dict(checkpoint['scaler'])
+
         self.logger.info("Checkpoint loaded. Resume training from epoch {}".format(self.start_epoch))
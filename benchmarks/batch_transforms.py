@@ -0,0 +1,58 @@
+"""
+Compares the per-clip LogMelSpectrogram with the batched BatchLogMelSpectrogram.
+
+Run from the repository root:
+    python -m benchmarks.batch_transforms
+"""
+import argparse
+import time
+import torch
+from datasets.transforms import LogMelSpectrogram, BatchLogMelSpectrogram
+
+
+def timeit(ftn, repeats):
+    ftn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        ftn()
+    return (time.perf_counter() - start) / repeats
+
+
+def main(args):
+    torch.manual_seed(0)
+    transform_args = {
+        'sample_rate': args.sample_rate,
+        'audio_length': args.audio_length,
+        'n_fft': args.n_fft,
+        'hop_length': args.hop_length
+    }
+    per_sample = LogMelSpectrogram(**transform_args)
+    batched = BatchLogMelSpectrogram(**transform_args)
+
+    print('{:>10s} {:>14s} {:>14s} {:>8s}'.format('batch size', 'per-clip (ms)', 'batched (ms)', 'speedup'))
+    for batch_size in args.batch_sizes:
+        waveforms = torch.randn(batch_size, args.sample_rate * args.audio_length)
+
+        def run_per_sample():
+            return torch.stack([per_sample(w) for w in waveforms]).unsqueeze(1)
+
+        def run_batched():
+            return batched(waveforms.unsqueeze(1))
+
+        assert torch.allclose(run_per_sample(), run_batched(), atol=1e-3)
+
+        per_sample_time = timeit(run_per_sample, args.repeats)
+        batched_time = timeit(run_batched, args.repeats)
+        print('{:>10d} {:>14.1f} {:>14.1f} {:>7.2f}x'.format(
+            batch_size, 1000 * per_sample_time, 1000 * batched_time, per_sample_time / batched_time))
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description='Per-clip vs batched log-mel spectrogram')
+    args.add_argument('--batch_sizes', default=[16, 64, 256], type=int, nargs='+')
+    args.add_argument('--repeats', default=5, type=int)
+    args.add_argument('--sample_rate', default=16000, type=int)
+    args.add_argument('--audio_length', default=8, type=int)
+    args.add_argument('--n_fft', default=2048, type=int)
+    args.add_argument('--hop_length', default=512, type=int)
+    main(args.parse_args())
@@ -0,0 +1,96 @@
+"""
+Compares fixed-length training with length-bucketed batches and packed LSTM sequences,
+reporting the forward FLOPs and the wall-clock time of one training epoch.
+
+Run from the repository root, e.g.:
+    python -m benchmarks.bucketing -c emodb_config.json
+"""
+import argparse
+import copy
+import time
+import torch
+import torch.nn as nn
+from torch.nn.utils.rnn import PackedSequence
+import datasets.datasets as module_data
+import datasets.transforms as module_transforms
+from data_loader import DataLoader, unpack_batch
+from model.loss import nll_loss
+from model.model import SpeechEmotionModel
+from utils import read_json
+
+
+class FlopCounter:
+    """
+    Counts the multiply-accumulate FLOPs of the Conv2d, LSTM and Linear layers of a model
+    """
+    def __init__(self, model):
+        self.flops = 0
+        self.handles = []
+        for module in model.modules():
+            if isinstance(module, (nn.Conv2d, nn.LSTM, nn.Linear)):
+                self.handles.append(module.register_forward_hook(self._hook))
+
+    def _hook(self, module, inputs, output):
+        if isinstance(module, nn.Conv2d):
+            k = module.kernel_size[0] * module.kernel_size[1] * module.in_channels // module.groups
+            self.flops += 2 * k * output.numel()
+        elif isinstance(module, nn.LSTM):
+            x = inputs[0]
+            steps = x.data.shape[0] if isinstance(x, PackedSequence) else x.shape[0] * x.shape[1]
+            self.flops += 2 * 4 * module.hidden_size * (module.input_size + module.hidden_size) * steps
+        else:
+            self.flops += 2 * module.in_features * output.numel()
+
+    def remove(self):
+        for handle in self.handles:
+            handle.remove()
+
+
+def run_epoch(model, data_loader):
+    optimizer = torch.optim.Adam(model.parameters())
+    counter = FlopCounter(model)
+    model.train()
+    start = time.perf_counter()
+    for batch in data_loader:
+        data, target, lengths = unpack_batch(batch, 'cpu')
+        optimizer.zero_grad()
+        loss = nll_loss(model(data, lengths), target)
+        loss.backward()
+        optimizer.step()
+    elapsed = time.perf_counter() - start
+    counter.remove()
+    return elapsed, counter.flops
+
+
+def main(args):
+    config = read_json(args.config)
+    torch.manual_seed(0)
+    model = SpeechEmotionModel(**config['arch']['args'])
+
+    results = {}
+    for bucketing in [False, True]:
+        transforms_args = dict(config['transforms']['args'], variable_length=bucketing)
+        transforms = module_transforms.LogMelSpectrogram(**transforms_args)
+        dataset = getattr(module_data, config['dataset']['type'])(
+            config['dataset']['args']['root_dir'],
+            transforms=transforms,
+            training=True
+        )
+        data_loader = DataLoader(dataset, config['data_loader']['batch_size'], shuffle=True,
+                                 validation_split=0.0, bucketing=bucketing)
+        results[bucketing] = run_epoch(copy.deepcopy(model), data_loader)
+
+    print('{:>10s} {:>12s} {:>14s}'.format('mode', 'epoch (s)', 'fwd GFLOPs'))
+    for bucketing, name in [(False, 'fixed'), (True, 'bucketed')]:
+        elapsed, flops = results[bucketing]
+        print('{:>10s} {:>12.2f} {:>14.2f}'.format(name, elapsed, flops / 1e9))
+    (fixed_time, fixed_flops), (bucket_time, bucket_flops) = results[False], results[True]
+    print('saving: {:.1f}% wall-clock, {:.1f}% FLOPs'.format(
+        100 * (1 - bucket_time / fixed_time), 100 * (1 - bucket_flops / fixed_flops)))
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description='Fixed-length vs length-bucketed training epoch')
+    args.add_argument('-c', '--config', default='emodb_config.json', type=str,
+                      help='config file path (default: emodb_config.json)')
+    main(args.parse_args())
@@ -0,0 +1,91 @@
+"""
+Synthetic corpora with the file layouts of EMO-DB and EMOVO, so that the datasets, the training and the
+benchmarks can be run without the real recordings. Clips are noise plus a tone whose pitch depends on the
+emotion, so that models can learn something from them. Generation is deterministic for a given seed.
+
+Run from the repository root, e.g.:
+    python -m benchmarks.corpora data/synthetic
+"""
+import os
+import wave
+import argparse
+from pathlib import Path
+import numpy as np
+
+
+EMODB_SPEAKERS = ['03', '08', '09', '10', '11', '12', '13', '14', '15', '16']
+EMODB_TEXTS = ['a01', 'a02', 'a04', 'a05', 'a07', 'b01', 'b02', 'b03', 'b09', 'b10']
+EMODB_EMOTIONS = 'WLEAFTN'
+
+EMOVO_ACTORS = ['m1', 'm2', 'm3', 'f1', 'f2', 'f3']
+EMOVO_EMOTIONS = ['dis', 'gio', 'pau', 'rab', 'sor', 'tri', 'neu']
+EMOVO_SENTENCES = ['b1', 'b2', 'b3', 'l1', 'l2', 'l3', 'l4', 'n1', 'n2', 'n3', 'n4', 'n5', 'd1', 'd2']
+
+
+def write_wav(path, samples, sample_rate):
+    """
+    Writes float samples in [-1, 1] as a mono 16-bit wav file
+    """
+    pcm = (np.clip(samples, -1, 1) * 32767).astype('<i2')
+    with wave.open(str(path), 'wb') as handle:
+        handle.setnchannels(1)
+        handle.setsampwidth(2)
+        handle.setframerate(sample_rate)
+        handle.writeframes(pcm.tobytes())
+
+
+def synthetic_clip(rng, emotion, seconds, sample_rate):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 120.0 * 2 ** (emotion / 3)
+    return 0.3 * np.sin(2 * np.pi * pitch * t) + 0.05 * rng.standard_normal(len(t))
+
+
+def make_emodb(root_dir, n_clips=535, durations=(1.5, 4.0), sample_rate=16000, seed=0):
+    """
+    Writes `n_clips` files named like EMO-DB's, <speaker><text><emotion><version>.wav, in `root_dir`
+
+    :return: Path of the directory to give to the EMODB dataset.
+    """
+    rng = np.random.default_rng(seed)
+    root_dir = Path(root_dir)
+    root_dir.mkdir(parents=True, exist_ok=True)
+    written = set()
+    for i in range(n_clips):
+        speaker = EMODB_SPEAKERS[i % len(EMODB_SPEAKERS)]
+        text = EMODB_TEXTS[i // len(EMODB_SPEAKERS) % len(EMODB_TEXTS)]
+        emotion = int(rng.integers(len(EMODB_EMOTIONS)))
+        # versions a, b, c, ... tell apart the takes of the same speaker, text and emotion
+        version = 0
+        while (speaker, text, emotion, version) in written:
+            version += 1
+        written.add((speaker, text, emotion, version))
+        name = '{}{}{}{}.wav'.format(speaker, text, EMODB_EMOTIONS[emotion], chr(ord('a') + version))
+        write_wav(root_dir / name, synthetic_clip(rng, emotion, rng.uniform(*durations), sample_rate), sample_rate)
+    return root_dir
+
+
+def make_emovo(root_dir, durations=(1.5, 4.0), sample_rate=48000, seed=0):
+    """
+    Writes the 588 files of EMOVO, <actor>/<emotion>-<actor>-<sentence>.wav, in `root_dir`
+
+    :return: Path of the directory to give to the EMOVO dataset.
+    """
+    rng = np.random.default_rng(seed)
+    root_dir = Path(root_dir)
+    for actor in EMOVO_ACTORS:
+        os.makedirs(root_dir / actor, exist_ok=True)
+        for emotion, emotion_name in enumerate(EMOVO_EMOTIONS):
+            for sentence in EMOVO_SENTENCES:
+                path = root_dir / actor / '{}-{}-{}.wav'.format(emotion_name, actor, sentence)
+                write_wav(path, synthetic_clip(rng, emotion, rng.uniform(*durations), sample_rate), sample_rate)
+    return root_dir
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description='Synthetic EMO-DB and EMOVO corpora')
+    args.add_argument('output', type=str, help='directory the emodb and emovo folders are written to')
+    args.add_argument('--emodb_clips', default=535, type=int, help='number of EMO-DB clips (default: 535)')
+    args.add_argument('--seed', default=0, type=int)
+    args = args.parse_args()
+    print(make_emodb(Path(args.output) / 'emodb', n_clips=args.emodb_clips, seed=args.seed))
+    print(make_emovo(Path(args.output) / 'emovo', seed=args.seed))
@@ -0,0 +1,74 @@
+"""
+Compares the CPU latency of the eager, TorchScript and ONNX Runtime versions of the fused model.
+
+Run from the repository root, e.g.:
+    python -m benchmarks.export
+    python -m benchmarks.export --resume saved/models/EMODB/<timestamp>/model_best.pth
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import torch
+import model.model as module_arch
+from export import build_inference_model, export
+from runtime import EmotionRecognizer
+from utils import read_json, load_checkpoint
+
+
+def timeit(ftn, repeats):
+    ftn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        ftn()
+    return (time.perf_counter() - start) / repeats
+
+
+def main(args):
+    torch.manual_seed(0)
+    if args.resume is not None:
+        checkpoint = load_checkpoint(args.resume)
+        config = checkpoint['config']
+        model = getattr(module_arch, config['arch']['type'])(**config['arch']['args'])
+        model.load_state_dict(checkpoint['state_dict'])
+    else:
+        config = read_json(args.config)
+        model = getattr(module_arch, config['arch']['type'])(**config['arch']['args'])
+    transforms_args = config['transforms']['args']
+    fused = build_inference_model(model, transforms_args)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        export(fused, transforms_args, config['arch']['args']['emotions'], Path(tmp_dir) / 'model', onnx=True)
+        runtimes = {
+            'eager': None,
+            'torchscript': EmotionRecognizer(Path(tmp_dir) / 'model.pt'),
+            'onnxruntime': EmotionRecognizer(Path(tmp_dir) / 'model.onnx')
+        }
+
+        print('latency per batch (ms)')
+        print('{:>10s} {:>12s} {:>12s} {:>12s}'.format('batch size', *runtimes))
+        for batch_size in args.batch_sizes:
+            batch = np.random.randn(batch_size, runtimes['torchscript'].n_samples).astype(np.float32) * 0.1
+            times = []
+            for name, runtime in runtimes.items():
+                if runtime is None:
+                    def run():
+                        with torch.inference_mode():
+                            return fused(torch.from_numpy(batch)).numpy()
+                else:
+                    def run():
+                        return runtime.predict(batch)
+                times.append(1000 * timeit(run, args.repeats))
+            print('{:>10d} {:>12.1f} {:>12.1f} {:>12.1f}'.format(batch_size, *times))
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description='Eager vs TorchScript vs ONNX Runtime latency')
+    args.add_argument('-c', '--config', default='emodb_config.json', type=str,
+                      help='config file path, for a randomly initialized model (default: emodb_config.json)')
+    args.add_argument('-r', '--resume', default=None, type=str,
+                      help='path to a checkpoint (default: None)')
+    args.add_argument('--batch_sizes', default=[1, 64], type=int, nargs='+')
+    args.add_argument('--repeats', default=10, type=int)
+    main(args.parse_args())
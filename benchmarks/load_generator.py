@@ -0,0 +1,93 @@
+"""
+Load generator for serve.py: keeps a number of concurrent keep-alive connections sending audio files,
+then reports throughput, client-side latencies and the server metrics.
+
+Start the server, then run from the repository root, e.g.:
+    python serve.py --resume saved/models/EMODB/<timestamp>/model_best.pth
+    python -m benchmarks.load_generator --concurrency 64 --requests 2000
+"""
+import io
+import json
+import time
+import wave
+import array
+import random
+import asyncio
+import argparse
+from pathlib import Path
+import numpy as np
+
+
+def synthetic_wav(seconds, sample_rate=16000):
+    samples = array.array('h', (random.randint(-3000, 3000) for _ in range(int(seconds * sample_rate))))
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as handle:
+        handle.setnchannels(1)
+        handle.setsampwidth(2)
+        handle.setframerate(sample_rate)
+        handle.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+async def request(reader, writer, host, method, target, body=b''):
+    writer.write('{} {} HTTP/1.1\r\nHost: {}\r\nContent-Length: {}\r\n\r\n'.format(
+        method, target, host, len(body)).encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        key, value = line.decode('latin-1').split(':', 1)
+        headers[key.strip().lower()] = value.strip()
+    content = await reader.readexactly(int(headers['content-length']))
+    return status, json.loads(content)
+
+
+async def client(host, port, bodies, counter, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    while counter[0] > 0:
+        counter[0] -= 1
+        start = time.perf_counter()
+        status, _ = await request(reader, writer, host, 'POST', '/predict', random.choice(bodies))
+        if status == 200:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors.append(status)
+    writer.close()
+
+
+async def run(args):
+    if args.files:
+        bodies = [Path(f).read_bytes() for f in args.files]
+    else:
+        bodies = [synthetic_wav(random.uniform(1.5, 8)) for _ in range(32)]
+
+    counter, latencies, errors = [args.requests], [], []
+    start = time.perf_counter()
+    await asyncio.gather(*[client(args.host, args.port, bodies, counter, latencies, errors)
+                           for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    print('requests:   {} ({} errors)'.format(len(latencies) + len(errors), len(errors)))
+    print('throughput: {:.1f} requests/s'.format(len(latencies) / elapsed))
+    print('latency:    p50 {:.1f} ms, p99 {:.1f} ms'.format(np.percentile(latencies, 50),
+                                                           np.percentile(latencies, 99)))
+
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    _, metrics = await request(reader, writer, args.host, 'GET', '/metrics')
+    writer.close()
+    print('server:     {}'.format(json.dumps(metrics)))
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description='Load generator for the inference server')
+    args.add_argument('files', nargs='*', type=str,
+                      help='audio files to send (default: synthetic clips)')
+    args.add_argument('--host', default='127.0.0.1', type=str)
+    args.add_argument('--port', default=8000, type=int)
+    args.add_argument('--concurrency', default=32, type=int)
+    args.add_argument('--requests', default=1000, type=int)
+    asyncio.run(run(args.parse_args()))
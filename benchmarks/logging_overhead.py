@@ -0,0 +1,64 @@
+"""
+Measures the training loop overhead of tensorboard logging, timing the same epochs with
+logging off and on (with the sampling rates of the config, or with every rate set to 1).
+
+Run from the repository root, e.g.:
+    python -m benchmarks.logging_overhead -c emodb_config.json --epochs 3
+"""
+import argparse
+import copy
+import tempfile
+import time
+import torch
+from parse_config import ConfigParser
+from train import build_trainer
+from utils import read_json
+
+
+def run(config, tensorboard, rates, epochs, save_dir, run_id):
+    config = copy.deepcopy(config)
+    config['trainer'].update({
+        'epochs': epochs,
+        'save_dir': save_dir,
+        'save_period': epochs + 1,
+        'verbosity': 0,
+        'tensorboard': tensorboard
+    })
+    if rates is not None:
+        config['trainer']['tensorboard_rates'] = rates
+    torch.manual_seed(0)
+    trainer = build_trainer(ConfigParser(config, run_id=run_id))
+
+    times = []
+    for epoch in range(1, epochs + 1):
+        start = time.perf_counter()
+        trainer._train_epoch(epoch)
+        times.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    trainer.writer.close()
+    close_time = time.perf_counter() - start
+    # the first epoch includes the warm-up of the kernels
+    mean_time = sum(times[1:]) / (epochs - 1) if epochs > 1 else times[0]
+    return mean_time, close_time
+
+
+def main(args):
+    config = read_json(args.config)
+    modes = [
+        ('off', False, None),
+        ('on, config rates', True, None),
+        ('on, all rates 1', True, {'scalar': 1, 'image': 1, 'histogram': 1})
+    ]
+    print('{:>18s} {:>16s} {:>16s}'.format('logging', 'epoch time (s)', 'final flush (s)'))
+    with tempfile.TemporaryDirectory() as save_dir:
+        for i, (name, tensorboard, rates) in enumerate(modes):
+            epoch_time, close_time = run(config, tensorboard, rates, args.epochs, save_dir, str(i))
+            print('{:>18s} {:>16.2f} {:>16.2f}'.format(name, epoch_time, close_time))
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description='Training loop time with tensorboard logging off and on')
+    args.add_argument('-c', '--config', default='emodb_config.json', type=str,
+                      help='config file path (default: emodb_config.json)')
+    args.add_argument('--epochs', default=3, type=int)
+    main(args.parse_args())
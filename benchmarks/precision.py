@@ -0,0 +1,57 @@
+"""
+Trains the same model in fp32 and bf16 (and optionally fp16) autocast, reporting the mean
+epoch time and the final validation accuracy of each precision.
+
+Run from the repository root, e.g.:
+    python -m benchmarks.precision -c emodb_config.json --epochs 5
+"""
+import argparse
+import copy
+import tempfile
+import time
+import torch
+from parse_config import ConfigParser
+from train import build_trainer
+from utils import read_json
+
+
+def run(config, precision, epochs, save_dir):
+    config = copy.deepcopy(config)
+    config['trainer'].update({
+        'precision': precision,
+        'epochs': epochs,
+        'save_dir': save_dir,
+        'save_period': epochs + 1,
+        'verbosity': 0,
+        'tensorboard': False
+    })
+    torch.manual_seed(0)
+    trainer = build_trainer(ConfigParser(config, run_id=precision))
+
+    times = []
+    for epoch in range(1, epochs + 1):
+        start = time.perf_counter()
+        log = trainer._train_epoch(epoch)
+        times.append(time.perf_counter() - start)
+    # the first epoch includes the warm-up of the kernels
+    mean_time = sum(times[1:]) / (epochs - 1) if epochs > 1 else times[0]
+    return mean_time, log.get('val_accuracy', float('nan'))
+
+
+def main(args):
+    config = read_json(args.config)
+    print('{:>10s} {:>16s} {:>14s}'.format('precision', 'epoch time (s)', 'val_accuracy'))
+    with tempfile.TemporaryDirectory() as save_dir:
+        for precision in args.precisions:
+            epoch_time, accuracy = run(config, precision, args.epochs, save_dir)
+            print('{:>10s} {:>16.2f} {:>14.4f}'.format(precision, epoch_time, accuracy))
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description='fp32 vs bf16 vs fp16 autocast training')
+    args.add_argument('-c', '--config', default='emodb_config.json', type=str,
+                      help='config file path (default: emodb_config.json)')
+    args.add_argument('--epochs', default=3, type=int)
+    args.add_argument('--precisions', default=['fp32', 'bf16'], nargs='+',
+                      choices=['fp32', 'bf16', 'fp16'])
+    main(args.parse_args())
@@ -0,0 +1,78 @@
+"""
+Import time of the entry points, measured with `python -X importtime` in fresh interpreters, failing when one
+exceeds its budget or imports a dependency it should not load at startup. Budgets are in milliseconds on top of
+`import torch`, which every entry point but the runtime pays anyway, so that they hold across machines.
+
+Run from the repository root, e.g.:
+    python -m benchmarks.startup --repeats 5 --budget 400
+"""
+import re
+import sys
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# dependencies that are only needed once their feature is used (image logging, tensorboard, ...)
+LAZY_MODULES = ['torchvision', 'pandas', 'torch.utils.tensorboard', 'tensorboardX', 'matplotlib']
+# entry points and the modules they must not import: inference ones do not load the training code,
+# the runtime does not load torch
+ENTRY_POINTS = {
+    'train': LAZY_MODULES,
+    'test': LAZY_MODULES + ['trainer'],
+    'predict': LAZY_MODULES + ['trainer'],
+    'serve': LAZY_MODULES + ['trainer'],
+    'runtime': LAZY_MODULES + ['torch', 'torchaudio']
+}
+IMPORT_LINE = re.compile(r'import time:\s+\d+ \|\s+(\d+) \|( +)(\S+)')
+
+
+def import_time(module):
+    """
+    :return: Tuple (total import time in milliseconds, set of the modules imported)
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)], cwd=str(ROOT),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    total, imported = 0, set()
+    for match in IMPORT_LINE.finditer(result.stderr):
+        imported.add(match.group(3))
+        # top level imports hold the time of the ones they trigger
+        if len(match.group(2)) == 1:
+            total += int(match.group(1))
+    return total / 1000, imported
+
+
+def median_import_time(module, repeats):
+    times, imported = [], set()
+    for _ in range(repeats):
+        time, imported = import_time(module)
+        times.append(time)
+    return statistics.median(times), imported
+
+
+def main(args):
+    baseline, _ = median_import_time('torch', args.repeats)
+    print('{:10s} {:>10s} {:>12s}  {}'.format('module', 'time (ms)', 'over torch', 'status'))
+    print('{:10s} {:>10.0f} {:>12s}'.format('torch', baseline, '-'))
+
+    failed = False
+    for module, forbidden in ENTRY_POINTS.items():
+        time, imported = median_import_time(module, args.repeats)
+        loaded = [name for name in forbidden if name in imported]
+        over = time - baseline
+        problems = ['imports ' + ', '.join(loaded)] if loaded else []
+        if over > args.budget:
+            problems.append('OVER BUDGET')
+        failed = failed or bool(problems)
+        print('{:10s} {:>10.0f} {:>+12.0f}  {}'.format(module, time, over, '; '.join(problems)))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description='Import time of the entry points, against a budget')
+    args.add_argument('--repeats', default=3, type=int)
+    args.add_argument('--budget', default=400.0, type=float,
+                      help='largest import time on top of import torch, in milliseconds (default: 400)')
+    sys.exit(main(args.parse_args()))
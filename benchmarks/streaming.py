@@ -0,0 +1,65 @@
+"""
+Measures the real-time factor of the streaming recognizer over a long synthetic signal.
+
+Run from the repository root, e.g.:
+    python -m benchmarks.streaming --hours 1
+    python -m benchmarks.streaming --resume saved/models/EMODB/<timestamp>/model_best.pth
+"""
+import argparse
+import resource
+import time
+import torch
+import model.model as module_arch
+from model.streaming import StreamingEmotionRecognizer
+from utils import read_json, load_checkpoint
+
+
+def main(args):
+    torch.manual_seed(0)
+    if args.resume is not None:
+        checkpoint = load_checkpoint(args.resume)
+        config = checkpoint['config']
+        model = getattr(module_arch, config['arch']['type'])(**config['arch']['args'])
+        model.load_state_dict(checkpoint['state_dict'])
+    else:
+        config = read_json(args.config)
+        model = getattr(module_arch, config['arch']['type'])(**config['arch']['args'])
+
+    transforms_args = config['transforms']['args']
+    recognizer = StreamingEmotionRecognizer(
+        model,
+        sample_rate=transforms_args['sample_rate'],
+        n_fft=transforms_args['n_fft'],
+        hop_length=transforms_args['hop_length']
+    )
+
+    sample_rate = transforms_args['sample_rate']
+    chunk_samples = int(args.chunk_seconds * sample_rate)
+    n_chunks = int(args.hours * 3600 / args.chunk_seconds)
+
+    n_windows = 0
+    processing = 0.0
+    for i in range(n_chunks):
+        # noise with a slowly changing amplitude, generated on the fly to keep memory bounded
+        chunk = 0.1 * (1 + 0.5 * torch.sin(torch.tensor(i / 100.0))) * torch.randn(chunk_samples)
+        start = time.perf_counter()
+        n_windows += len(recognizer.process(chunk))
+        processing += time.perf_counter() - start
+
+    audio_seconds = n_chunks * args.chunk_seconds
+    print('audio:            {:.0f} s'.format(audio_seconds))
+    print('processing:       {:.1f} s'.format(processing))
+    print('real-time factor: {:.4f}'.format(processing / audio_seconds))
+    print('posteriors:       {} (one per {:.2f} s)'.format(n_windows, recognizer.window_seconds))
+    print('peak RSS:         {:.0f} MiB'.format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description='Streaming inference real-time factor')
+    args.add_argument('-c', '--config', default='emodb_config.json', type=str,
+                      help='config file path, for a randomly initialized model (default: emodb_config.json)')
+    args.add_argument('-r', '--resume', default=None, type=str,
+                      help='path to a checkpoint (default: None)')
+    args.add_argument('--hours', default=1.0, type=float)
+    args.add_argument('--chunk_seconds', default=0.5, type=float)
+    main(args.parse_args())
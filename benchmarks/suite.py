@@ -0,0 +1,217 @@
+"""
+Benchmark suite run on synthetic EMO-DB and EMOVO corpora: dataset throughput, log-mel spectrogram,
+model forward and backward passes, a training epoch and test.py end to end. Results are saved as JSON,
+and compared with a baseline, failing when a metric regresses by more than a threshold.
+
+Run from the repository root, e.g.:
+    python -m benchmarks.suite run -o results.json
+    python -m benchmarks.suite compare baseline.json results.json --threshold 10
+"""
+import sys
+import copy
+import json
+import time
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+import torch
+from benchmarks.corpora import make_emodb, make_emovo
+from datasets.datasets import EMODB, EMOVO
+from datasets.transforms import LogMelSpectrogram
+from model.loss import nll_loss
+from model.model import SpeechEmotionModel
+from utils import read_json
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def median_time(ftn, repeats, warmup=1):
+    for _ in range(warmup):
+        ftn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        ftn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+class Results:
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, name, value, unit, higher_is_better):
+        self.metrics[name] = {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+        print('{:40s} {:>12.3f} {}'.format(name, value, unit), flush=True)
+
+
+def bench_datasets(results, data_dir, emodb_config, emovo_config, n_items, repeats):
+    for name, dataset_cls, root, config in [('emodb', EMODB, data_dir / 'emodb', emodb_config),
+                                            ('emovo', EMOVO, data_dir / 'emovo', emovo_config)]:
+        dataset = dataset_cls(str(root), transforms=LogMelSpectrogram(**config['transforms']['args']))
+        n = min(n_items, len(dataset))
+
+        def load():
+            for idx in range(n):
+                dataset[idx]
+        results.add('{}_getitem'.format(name), n / median_time(load, repeats), 'clips/s', True)
+
+
+def bench_logmel(results, data_dir, config, repeats):
+    dataset = EMODB(str(data_dir / 'emodb'))
+    waveforms = [dataset.load(idx) for idx in range(min(32, len(dataset)))]
+    transform = LogMelSpectrogram(**config['transforms']['args'])
+
+    def run():
+        for waveform, sample_rate in waveforms:
+            transform(waveform, sample_rate)
+    results.add('logmel', 1000 * median_time(run, repeats) / len(waveforms), 'ms/clip', False)
+
+
+def bench_model(results, config, batch_sizes, repeats):
+    transforms_args = config['transforms']['args']
+    n_samples = transforms_args['sample_rate'] * transforms_args['audio_length']
+    input_shape = LogMelSpectrogram(**transforms_args)(torch.zeros(n_samples)).shape
+    model = SpeechEmotionModel(**config['arch']['args'])
+    for batch_size in batch_sizes:
+        data = torch.randn(batch_size, 1, *input_shape)
+        target = torch.randint(config['arch']['args']['emotions'], (batch_size,))
+
+        def forward():
+            with torch.no_grad():
+                model(data)
+
+        def forward_backward():
+            model.zero_grad()
+            nll_loss(model(data), target).backward()
+
+        model.eval()
+        results.add('forward_bs{}'.format(batch_size), 1000 * median_time(forward, repeats), 'ms', False)
+        model.train()
+        results.add('forward_backward_bs{}'.format(batch_size), 1000 * median_time(forward_backward, repeats),
+                    'ms', False)
+
+
+def bench_training(results, data_dir, config, save_dir):
+    # imported here, as train.py seeds the random generators when imported
+    from parse_config import ConfigParser
+    from train import build_trainer
+
+    config = copy.deepcopy(config)
+    config['dataset']['args']['root_dir'] = str(data_dir / 'emodb')
+    config['trainer'].update({
+        'epochs': 1,
+        'save_dir': str(save_dir),
+        'save_period': 1,
+        'verbosity': 0,
+        'tensorboard': False
+    })
+    config_parser = ConfigParser(config, run_id='suite')
+    trainer = build_trainer(config_parser)
+    start = time.perf_counter()
+    trainer.train()
+    results.add('trainer_epoch', time.perf_counter() - start, 's', False)
+
+    # test.py end to end, in a new process as it would be run
+    checkpoint = config_parser.save_dir / 'checkpoint-epoch1.pth'
+    start = time.perf_counter()
+    subprocess.run([sys.executable, 'test.py', '--resume', str(checkpoint)], cwd=str(ROOT), check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    results.add('test_end_to_end', time.perf_counter() - start, 's', False)
+
+
+def run(args):
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(args.seed)
+    emodb_config = read_json(ROOT / 'emodb_config.json')
+    emovo_config = read_json(ROOT / 'emovo_config.json')
+    results = Results()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = Path(args.data_dir) if args.data_dir is not None else Path(tmp_dir) / 'data'
+        if not (data_dir / 'emodb').is_dir():
+            make_emodb(data_dir / 'emodb', n_clips=args.emodb_clips, seed=args.seed)
+        if not (data_dir / 'emovo').is_dir():
+            make_emovo(data_dir / 'emovo', seed=args.seed)
+
+        bench_datasets(results, data_dir, emodb_config, emovo_config, args.items, args.repeats)
+        bench_logmel(results, data_dir, emodb_config, args.repeats)
+        bench_model(results, emodb_config, args.batch_sizes, args.repeats)
+        bench_training(results, data_dir, emodb_config, Path(tmp_dir) / 'saved')
+
+    output = {
+        'metadata': {
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'threads': torch.get_num_threads(),
+            'seed': args.seed,
+            'emodb_clips': args.emodb_clips
+        },
+        'metrics': results.metrics
+    }
+    with open(args.output, 'wt') as handle:
+        json.dump(output, handle, indent=4)
+    print('Results saved to {}'.format(args.output))
+
+
+def compare(args):
+    """
+    :return: Exit code, 1 if a metric of the baseline regressed by more than the threshold, or is missing
+    """
+    with open(args.baseline, 'rt') as handle:
+        baseline = json.load(handle)['metrics']
+    with open(args.results, 'rt') as handle:
+        results = json.load(handle)['metrics']
+
+    failed = False
+    print('{:40s} {:>12s} {:>12s} {:>9s}'.format('metric', 'baseline', 'current', 'change'))
+    for name, old in baseline.items():
+        if name not in results:
+            print('{:40s} {:>12.3f} {:>12s} {:>9s}  MISSING'.format(name, old['value'], '-', '-'))
+            failed = True
+            continue
+        new = results[name]['value']
+        change = 100 * (new - old['value']) / old['value'] if old['value'] else 0.0
+        # a positive change is a slowdown for times, a negative one for throughputs
+        regression = -change if old['higher_is_better'] else change
+        status = 'REGRESSION' if regression > args.threshold else ''
+        failed = failed or bool(status)
+        print('{:40s} {:>12.3f} {:>12.3f} {:>+8.1f}%  {}'.format(name, old['value'], new, change, status))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark suite on synthetic corpora')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_args = commands.add_parser('run', help='run the benchmarks and save the results')
+    run_args.add_argument('-o', '--output', default='benchmark_results.json', type=str,
+                          help='results file (default: benchmark_results.json)')
+    run_args.add_argument('--data_dir', default=None, type=str,
+                          help='directory of the synthetic corpora, generated if missing (default: temporary)')
+    run_args.add_argument('--emodb_clips', default=200, type=int)
+    run_args.add_argument('--items', default=64, type=int, help='clips loaded per dataset measurement')
+    run_args.add_argument('--batch_sizes', default=[1, 16, 64], type=int, nargs='+')
+    run_args.add_argument('--repeats', default=3, type=int)
+    run_args.add_argument('--threads', default=None, type=int,
+                          help='number of torch threads, fix it for comparable results (default: torch default)')
+    run_args.add_argument('--seed', default=0, type=int)
+
+    compare_args = commands.add_parser('compare', help='compare results with a baseline')
+    compare_args.add_argument('baseline', type=str)
+    compare_args.add_argument('results', type=str)
+    compare_args.add_argument('--threshold', default=10.0, type=float,
+                              help='largest accepted regression, in percent (default: 10)')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    else:
+        sys.exit(compare(args))
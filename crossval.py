@@ -0,0 +1,193 @@
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+import datasets.transforms as module_transforms
+import datasets.datasets as module_data
+import datasets.audio_store as module_audio_store
+import datasets.cache as module_cache
+import model.loss as module_loss
+import model.metric as module_metric
+from data_loader import DataLoader
+from parse_config import ConfigParser
+from train import SEED, build_trainer
+from test import evaluate
+from utils import write_json, load_checkpoint
+
+
+def speaker_folds(speakers, n_folds=None):
+    """
+    Splits the clips into folds of whole speakers, balancing the number of clips of the folds
+
+    :param speakers: Speaker of every clip.
+    :param n_folds: Number of folds, None for one fold per speaker (leave-one-speaker-out).
+    :return: List of (speakers, indices) of the clips held out in every fold.
+    """
+    speakers = np.asarray(speakers)
+    names, counts = np.unique(speakers, return_counts=True)
+    n_folds = len(names) if n_folds is None else n_folds
+    assert 2 <= n_folds <= len(names), \
+        'the number of folds must be between 2 and the number of speakers ({}).'.format(len(names))
+
+    # largest speakers first, each one to the fold with the fewest clips so far
+    groups = [[] for _ in range(n_folds)]
+    sizes = [0] * n_folds
+    for i in sorted(range(len(names)), key=lambda i: (-counts[i], names[i])):
+        fold = sizes.index(min(sizes))
+        groups[fold].append(str(names[i]))
+        sizes[fold] += counts[i]
+    return [(sorted(group), np.flatnonzero(np.isin(speakers, group)).tolist()) for group in groups]
+
+
+def setup_dataset(config):
+    """
+    Builds the whole corpus once, decoded and feature-cached if configured, to be shared by every fold
+
+    :return: Tuple (dataset, batch_transforms, speakers)
+    """
+    transforms = config.init_obj('transforms', module_transforms)
+    transforms, batch_transforms = module_transforms.split_transforms(transforms)
+    # the whole corpus, with the other arguments of the dataset, e.g. its manifest
+    dataset_args = {key: value for key, value in config['dataset']['args'].items()
+                    if key not in ['root_dir', 'training']}
+    dataset = getattr(module_data, config['dataset']['type'])(
+        config['dataset']['args']['root_dir'],
+        transforms=transforms,
+        training=None,
+        **dataset_args
+    )
+    assert hasattr(dataset, 'get_speaker'), \
+        'cross-validation needs the speaker of every clip, {} does not provide it.'.format(type(dataset).__name__)
+    speakers = [dataset.get_speaker(idx) for idx in range(len(dataset))]
+    if config.get('audio_store') is not None:
+        dataset = config.init_obj('audio_store', module_audio_store, dataset)
+    if config.get('feature_cache') is not None:
+        dataset = config.init_obj('feature_cache', module_cache, dataset, config['transforms'])
+    return dataset, batch_transforms, speakers
+
+
+def _init_worker(threads):
+    torch.set_num_threads(threads)
+
+
+def run_fold(config, run_id, fold, speakers, train_idx, test_idx, dataset, batch_transforms):
+    """
+    Trains on the training speakers, then tests the best model on the held-out ones
+
+    :return: Dict with the test log of the fold.
+    """
+    torch.manual_seed(SEED)
+    np.random.seed(SEED)
+    config = ConfigParser(config, run_id=run_id)
+    logger = config.get_logger('crossval')
+    logger.info('Fold {}: testing on speakers {}'.format(fold, ', '.join(speakers)))
+
+    trainer = build_trainer(config, dataset=module_data.Subset(dataset, train_idx),
+                            batch_transforms=batch_transforms)
+    trainer.train()
+
+    model = trainer.model
+    best_path = config.save_dir / 'model_best.pth'
+    if best_path.is_file():
+        model.load_state_dict(load_checkpoint(best_path, map_location=trainer.device)['state_dict'])
+    model.eval()
+
+    data_loader = DataLoader(
+        dataset=module_data.Subset(dataset, test_idx),
+        batch_size=config['data_loader']['batch_size'],
+        shuffle=False,
+        validation_split=0.0,
+        bucketing=config['data_loader'].get('bucketing', False)
+    )
+    loss_fn = getattr(module_loss, config['loss'])
+    metric_fns = [getattr(module_metric, met) for met in config['metrics']]
+    log, class_log = evaluate(model, data_loader, loss_fn, metric_fns, trainer.device, batch_transforms)
+    return {
+        'fold': fold,
+        'speakers': speakers,
+        'n_train': len(train_idx),
+        'n_test': len(test_idx),
+        'test': log,
+        'test_class': class_log
+    }
+
+
+def aggregate(results):
+    """
+    Mean and standard deviation over the folds of every test metric, and mean over the folds of every
+    per-class score
+    """
+    report = {}
+    for key in results[0]['test']:
+        values = np.array([result['test'][key] for result in results])
+        report[key] = {'mean': float(values.mean()), 'std': float(values.std())}
+    for key in results[0]['test_class']:
+        values = np.array([result['test_class'][key] for result in results])
+        report['class_' + key] = values.mean(0).tolist()
+    return report
+
+
+def main(config, args):
+    logger = config.get_logger('crossval')
+
+    dataset, batch_transforms, speakers = setup_dataset(config)
+    folds = speaker_folds(speakers, None if args.folds == 'loso' else int(args.folds))
+    jobs = min(args.jobs if args.jobs is not None else os.cpu_count(), len(folds))
+    threads = args.threads if args.threads is not None else max(1, os.cpu_count() // jobs)
+    logger.info('{} folds over {} speakers, {} at a time with {} threads each'.format(
+        len(folds), len(set(speakers)), jobs, threads))
+
+    # every fold is a run of its own, in a subdirectory of this one
+    run_id = config.save_dir.name
+    all_idx = np.arange(len(dataset))
+    results = []
+    # spawned processes, as forking a process which already ran torch may deadlock; tensors in
+    # shared memory (e.g. the audio store) are passed to them without copies
+    context = mp.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context, initializer=_init_worker,
+                             initargs=(threads,)) as executor:
+        futures = []
+        for fold, (fold_speakers, test_idx) in enumerate(folds):
+            train_idx = np.setdiff1d(all_idx, test_idx).tolist()
+            futures.append(executor.submit(run_fold, config.config, os.path.join(run_id, 'fold{}'.format(fold)),
+                                           fold, fold_speakers, train_idx, test_idx, dataset, batch_transforms))
+        for future in as_completed(futures):
+            result = future.result()
+            logger.info('Fold {} ({}): {}'.format(result['fold'], ', '.join(result['speakers']), result['test']))
+            results.append(result)
+
+    results.sort(key=lambda result: result['fold'])
+    report = {'folds': results, 'aggregate': aggregate(results)}
+    write_json(report, config.save_dir / 'crossval.json')
+
+    logger.info('    {:>5s} {:20s} {:>6s} {}'.format('fold', 'speakers', 'clips', ' '.join(
+        '{:>12s}'.format(key) for key in results[0]['test'])))
+    for result in results:
+        logger.info('    {:>5d} {:20s} {:>6d} {}'.format(result['fold'], ','.join(result['speakers'])[:20],
+                                                       result['n_test'], ' '.join(
+            '{:>12.4f}'.format(value) for value in result['test'].values())))
+    logger.info('    {:>5s} {:20s} {:>6s} {}'.format('mean', '', '', ' '.join(
+        '{:>5.4f}±{:<6.4f}'.format(report['aggregate'][key]['mean'], report['aggregate'][key]['std'])
+        for key in results[0]['test'])))
+    logger.info('Report saved to {}'.format(config.save_dir / 'crossval.json'))
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description='PyTorch Template')
+    args.add_argument('-c', '--config', default=None, type=str,
+                      help='config file path (default: None)')
+    args.add_argument('-r', '--resume', default=None, type=str,
+                      help='path to a checkpoint whose config is used, folds are trained from scratch (default: None)')
+    args.add_argument('-d', '--device', default=None, type=str,
+                      help='indices of GPUs to enable (default: all)')
+    args.add_argument('--folds', default='loso', type=str,
+                      help='number of speaker folds, or loso for leave-one-speaker-out (default: loso)')
+    args.add_argument('--jobs', default=None, type=int,
+                      help='number of folds run at the same time (default: number of CPUs)')
+    args.add_argument('--threads', default=None, type=int,
+                      help='torch threads of every fold (default: number of CPUs / jobs)')
+
+    config = ConfigParser.from_args(args)
+    main(config, args.parse_args())
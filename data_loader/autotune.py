@@ -0,0 +1,54 @@
+import os
+import time
+from itertools import islice
+from utils import inf_loop
+from .data_loader import DataLoader
+
+
+def autotune_loader(dataset, loader_args, n_batches=200, warmup=10, worker_counts=None,
+                    prefetch_factors=(2, 4, 8), logger=None):
+    """
+    Times the data loader under different worker and prefetch settings, on the current machine
+
+    :param dataset: Dataset to be loaded.
+    :param loader_args: Dict of the data loader arguments, as in the 'data_loader' config block.
+    :param n_batches: Number of batches timed for each setting, after the warm-up ones.
+    :param warmup: Number of batches loaded before timing, covering the workers start-up. The batches the workers
+        may have prefetched in the meantime are skipped too, so that only the steady state is timed.
+    :param worker_counts: Worker counts to try. Default: 0 and powers of two up to the number of CPUs.
+    :param prefetch_factors: Prefetch factors to try with multi-process loading.
+    :return: Dict of the fastest settings, to update the 'data_loader' config block with.
+    """
+    if worker_counts is None:
+        n_cpus = os.cpu_count()
+        worker_counts = [0] + [2 ** i for i in range(n_cpus.bit_length()) if 2 ** i <= n_cpus]
+
+    candidates = []
+    for num_workers in worker_counts:
+        if num_workers == 0:
+            candidates.append({'num_workers': 0})
+        else:
+            candidates.extend({'num_workers': num_workers, 'persistent_workers': True, 'prefetch_factor': prefetch}
+                              for prefetch in prefetch_factors)
+
+    best, best_rate = None, 0
+    for settings in candidates:
+        data_loader = DataLoader(dataset, **dict(loader_args, **settings))
+        batches = inf_loop(data_loader)
+        prefetched = settings['num_workers'] * settings.get('prefetch_factor', 0)
+        for _ in islice(batches, warmup + prefetched):
+            pass
+        start = time.perf_counter()
+        for _ in islice(batches, n_batches):
+            pass
+        rate = n_batches / (time.perf_counter() - start)
+        del batches, data_loader
+
+        if logger is not None:
+            logger.info('    {}: {:.1f} batches/s'.format(settings, rate))
+        if rate > best_rate:
+            best, best_rate = settings, rate
+
+    if logger is not None:
+        logger.info('Fastest data loader settings: {}'.format(best))
+    return best
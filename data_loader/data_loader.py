@@ -1,30 +1,98 @@
 import numpy as np
-from torch.utils.data import DataLoader as TorchDataLoader
+import torch
+import torch.distributed as dist
+from torch.utils.data import DataLoader as TorchDataLoader, IterableDataset
+from torch.utils.data.distributed import DistributedSampler
 from torch.utils.data.dataloader import default_collate
-from torch.utils.data.sampler import SubsetRandomSampler
+from torch.utils.data.sampler import Sampler, SubsetRandomSampler
 
 
 class DataLoader(TorchDataLoader):
     """
     Base class for all data loaders
     """
-    def __init__(self, dataset, batch_size, shuffle, validation_split, collate_fn=default_collate):
+    def __init__(self, dataset, batch_size, shuffle, validation_split, collate_fn=default_collate, bucketing=False,
+                 num_workers=0, pin_memory=False, persistent_workers=False, prefetch_factor=2):
         self.validation_split = validation_split
         self.shuffle = shuffle
+        self.bucketing = bucketing
+
+        # settings shared by the training and validation loaders,
+        # worker-only options are rejected by torch when loading in the main process
+        self.worker_kwargs = {
+            'num_workers': num_workers,
+            'pin_memory': pin_memory
+        }
+        if num_workers > 0:
+            self.worker_kwargs.update({
+                'persistent_workers': persistent_workers,
+                'prefetch_factor': prefetch_factor
+            })
 
         self.batch_idx = 0
         self.n_samples = len(dataset)
 
+        if isinstance(dataset, IterableDataset):
+            # streamed datasets shuffle and shard themselves, and hold their own validation split
+            assert not bucketing, 'bucketing needs the durations of a map-style dataset.'
+            self.sampler, self.valid_sampler = None, None
+            self.valid_dataset = dataset.validation() if validation_split else None
+            self.init_kwargs = {
+                'batch_size': batch_size,
+                'collate_fn': collate_fn,
+                **self.worker_kwargs
+            }
+            super().__init__(dataset, **self.init_kwargs)
+            return
+
         self.sampler, self.valid_sampler = self._split_sampler(self.validation_split)
+        self.distributed = dist.is_available() and dist.is_initialized()
+
+        if self.bucketing:
+            # batches of clips with similar durations, padded to the longest one
+            durations = np.array([dataset.get_duration(idx) for idx in range(len(dataset))])
+            train_idx = self.sampler.indices if self.sampler is not None else np.arange(len(dataset))
+            valid_idx = self.valid_sampler.indices if self.valid_sampler is not None else None
+            # every process of a distributed run buckets its own shard, drawn again at every epoch
+            sharding = {'num_replicas': dist.get_world_size(), 'rank': dist.get_rank()} if self.distributed else {}
+            self.batch_sampler = BucketBatchSampler(durations, batch_size, train_idx, shuffle=shuffle, **sharding)
+            if valid_idx is not None:
+                self.valid_sampler = BucketBatchSampler(durations, batch_size, valid_idx, shuffle=False, pad=False,
+                                                        **sharding)
+            self.n_samples = self.batch_sampler.num_samples
+            self.init_kwargs = {
+                'dataset': dataset,
+                'collate_fn': pad_collate,
+                **self.worker_kwargs
+            }
+            super().__init__(batch_sampler=self.batch_sampler, **self.init_kwargs)
+            return
+
+        if self.distributed:
+            # every process reads its own shard of the training and validation splits
+            train_idx = self.sampler.indices if self.sampler is not None else np.arange(len(dataset))
+            self.sampler = DistributedSubsetSampler(train_idx, shuffle=self.shuffle or self.sampler is not None)
+            if self.valid_sampler is not None:
+                self.valid_sampler = DistributedSubsetSampler(self.valid_sampler.indices, shuffle=False, pad=False)
+            self.shuffle = False
+            self.n_samples = len(self.sampler)
 
         self.init_kwargs = {
             'dataset': dataset,
             'batch_size': batch_size,
             'shuffle': self.shuffle,
-            'collate_fn': collate_fn
+            'collate_fn': collate_fn,
+            **self.worker_kwargs
         }
         super().__init__(sampler=self.sampler, **self.init_kwargs)
 
+    def __len__(self):
+        if isinstance(self.dataset, IterableDataset) and hasattr(self.dataset, 'worker_lengths'):
+            # every worker batches its own clips, ending with a partial batch of its own
+            batch_size = self.init_kwargs['batch_size']
+            return sum(-(-n // batch_size) for n in self.dataset.worker_lengths(max(1, self.num_workers)))
+        return super().__len__()
+
     def _split_sampler(self, split):
         if split == 0.0:
             return None, None
@@ -54,7 +122,154 @@ class DataLoader(TorchDataLoader):
         return train_sampler, valid_sampler
 
     def split_validation(self):
-        if self.valid_sampler is None:
+        if isinstance(self.dataset, IterableDataset):
+            return TorchDataLoader(self.valid_dataset, **self.init_kwargs) if self.valid_dataset is not None else None
+        elif self.valid_sampler is None:
             return None
+        elif self.bucketing:
+            return TorchDataLoader(batch_sampler=self.valid_sampler, **self.init_kwargs)
         else:
             return TorchDataLoader(sampler=self.valid_sampler, **self.init_kwargs)
+
+
+class DistributedSubsetSampler(DistributedSampler):
+    """DistributedSampler over a subset of the dataset indices, e.g.
+    the training or validation split, to be called with `set_epoch` at
+    the start of every epoch when shuffling.
+
+    Args:
+        indices (array): Indices of the dataset to shard.
+        shuffle (boolean, optional): Whether to shuffle the indices at
+            every epoch. Default: True
+        pad (boolean, optional): Whether to repeat some indices so
+            that every process gets the same number of them, which
+            training needs to keep the processes in step. Validation
+            does not, and is exact without padding. Default: True
+        seed (int, optional): Shuffling seed, the same in every
+            process. Default: 0
+    """
+    def __init__(self, indices, shuffle=True, pad=True, seed=0):
+        self.indices = np.asarray(indices)
+        super().__init__(self.indices, shuffle=shuffle, seed=seed)
+        if not pad:
+            self.total_size = len(self.indices)
+            self.num_samples = len(range(self.rank, self.total_size, self.num_replicas))
+
+    def __iter__(self):
+        for i in super().__iter__():
+            yield int(self.indices[i])
+
+
+class BucketBatchSampler(Sampler):
+    """Yields batches of indices of clips with similar durations.
+
+    The indices are shuffled and split into pools of `pool_size`
+    batches, each pool is sorted by duration and cut into batches, and
+    the order of the batches is shuffled again. In a distributed run,
+    every process buckets its own shard of the indices, which are
+    shuffled again at every epoch, as by DistributedSampler, when
+    `set_epoch` is called at the start of every epoch.
+
+    Args:
+        durations (array): Duration of every clip of the dataset.
+        batch_size (int): Number of clips per batch.
+        indices (array, optional): Indices of the dataset to sample
+            from. Default: all
+        shuffle (boolean, optional): Whether to shuffle the batches at
+            every epoch. Default: True
+        pool_size (int, optional): Number of batches sorted together.
+            Default: 50
+        num_replicas (int, optional): Number of processes sharing the
+            indices. Default: 1
+        rank (int, optional): Rank of this process. Default: 0
+        pad (boolean, optional): Whether to repeat some indices so
+            that every process gets the same number of them, see
+            DistributedSubsetSampler. Default: True
+        seed (int, optional): Sharding seed, the same in every process.
+            Default: 0
+    """
+    def __init__(self, durations, batch_size, indices=None, shuffle=True, pool_size=50, num_replicas=1, rank=0,
+                 pad=True, seed=0):
+        self.durations = np.asarray(durations)
+        self.batch_size = batch_size
+        self.indices = np.arange(len(self.durations)) if indices is None else np.asarray(indices)
+        self.shuffle = shuffle
+        self.pool_size = pool_size
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.pad = pad
+        self.seed = seed
+        self.epoch = 0
+        if pad:
+            self.num_samples = -(-len(self.indices) // num_replicas)
+        else:
+            self.num_samples = len(range(rank, len(self.indices), num_replicas))
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _shard(self):
+        """
+        Indices of this process, the same permutation of the indices being split between the processes
+        """
+        if self.num_replicas == 1:
+            return self.indices
+        indices = self.indices
+        if self.shuffle:
+            indices = np.random.default_rng(self.seed + self.epoch).permutation(indices)
+        if self.pad:
+            indices = np.resize(indices, self.num_samples * self.num_replicas)
+        return indices[self.rank::self.num_replicas]
+
+    def __iter__(self):
+        indices = self._shard()
+        if self.shuffle:
+            indices = np.random.permutation(indices)
+            pool = self.batch_size * self.pool_size
+        else:
+            pool = max(1, len(indices))
+
+        batches = []
+        for start in range(0, len(indices), pool):
+            pool_idx = indices[start:start + pool]
+            pool_idx = pool_idx[np.argsort(self.durations[pool_idx], kind='stable')]
+            batches.extend(pool_idx[i:i + self.batch_size] for i in range(0, len(pool_idx), self.batch_size))
+
+        if self.shuffle:
+            batches = [batches[i] for i in np.random.permutation(len(batches))]
+        for batch in batches:
+            yield batch.tolist()
+
+    def __len__(self):
+        return (self.num_samples + self.batch_size - 1) // self.batch_size
+
+
+def pad_collate(batch):
+    """
+    Collates log-mel spectrograms of different lengths, padding the last dimension to the longest one in the batch
+    with the minimum of each clip, i.e. silence, as when the waveforms are padded with zeros
+
+    :return: Tuple (data, lengths, target), lengths holds the unpadded length of each clip
+    """
+    data, target = zip(*batch)
+    lengths = torch.tensor([x.shape[-1] for x in data])
+    padded = data[0].new_empty(len(data), *data[0].shape[:-1], int(lengths.max()))
+    for i, x in enumerate(data):
+        padded[i, ..., :x.shape[-1]] = x
+        padded[i, ..., x.shape[-1]:] = x.min()
+    return padded, lengths, default_collate(target)
+
+
+def unpack_batch(batch, device):
+    """
+    Moves a batch to the device
+
+    :return: Tuple (data, target, lengths), lengths is None for fixed-length batches
+    """
+    if len(batch) == 3:
+        data, lengths, target = batch
+        lengths = lengths.to(device)
+    else:
+        data, target = batch
+        lengths = None
+    return data.to(device), target.to(device), lengths
@@ -0,0 +1,178 @@
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+import torch
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from torch.utils.data import Dataset
+from utils import is_main_process
+
+
+class SharedAudioStore(Dataset):
+    """Decoded waveforms of a whole dataset, stored in a single
+    contiguous tensor shared by all the data loader workers.
+
+    The corpus is decoded once, in parallel, and concatenated; each
+    item is then a zero-copy slice of the shared tensor, located by an
+    offsets index, so no file is opened or decoded during training.
+    The transforms of the wrapped dataset are still applied per item.
+
+    When stored in a file, the offsets are saved next to it along with
+    a fingerprint of the size and modification time of every clip, and
+    the file is reused as long as the clips do not change. Only the
+    main process of a distributed run writes it.
+
+    Args:
+        dataset (Dataset): Dataset to be stored, it must implement
+            `load(idx)`, `get_label(idx)` and `get_path(idx)`.
+        path (string, optional): File in which the waveforms are
+            stored and memory-mapped, if None they are kept in shared
+            memory instead. Default: None
+        num_workers (int, optional): Number of processes decoding the
+            corpus. Default: number of CPUs
+    """
+    def __init__(self, dataset, path=None, num_workers=None):
+        self.dataset = dataset
+        self.transforms = dataset.transforms
+        self.path = Path(path).with_suffix('.npy') if path is not None else None
+        self.index_path = self.path.with_suffix('.json') if path is not None else None
+        num_workers = num_workers if num_workers is not None else os.cpu_count()
+        self.labels = [dataset.get_label(idx) for idx in range(len(dataset))]
+        # opened lazily, so that each data loader worker maps the file on its own
+        self._waveforms = None
+
+        fingerprint = _fingerprint(dataset) if self.path is not None else None
+        if fingerprint is not None and self._load_index(fingerprint):
+            return
+
+        clips = list(_load_all(dataset, num_workers))
+        self.sample_rates = np.array([sample_rate for _, sample_rate in clips])
+        self.offsets = np.cumsum([0] + [len(waveform) for waveform, _ in clips])
+
+        waveforms = np.concatenate([waveform for waveform, _ in clips])
+        del clips
+        if self.path is None or not is_main_process():
+            # the other processes of a distributed run keep what they decoded, should the file not match
+            self.path = None
+            self._waveforms = torch.from_numpy(waveforms).share_memory_()
+        else:
+            self._save(waveforms, fingerprint)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        data = self.waveforms[self.offsets[idx]:self.offsets[idx + 1]]
+        sample_rate = int(self.sample_rates[idx])
+
+        # apply transforms, if needed
+        if self.transforms is not None:
+            data = self.transforms(data, sample_rate)
+
+        data = torch.unsqueeze(data, 0)
+
+        return (data, self.labels[idx])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.path is not None:
+            state['_waveforms'] = None
+        return state
+
+    @property
+    def waveforms(self):
+        if self._waveforms is None:
+            # copy-on-write map, the pages stay shared between workers unless written to
+            waveforms = np.load(self.path, mmap_mode='c')
+            self._waveforms = torch.from_numpy(waveforms)
+        return self._waveforms
+
+    def get_path(self, idx):
+        return self.dataset.get_path(idx)
+
+    def get_label(self, idx):
+        return self.labels[idx]
+
+    def get_duration(self, idx):
+        return (self.offsets[idx + 1] - self.offsets[idx]) / self.sample_rates[idx]
+
+    def get_speaker(self, idx):
+        return self.dataset.get_speaker(idx)
+
+    def _load_index(self, fingerprint):
+        """
+        Reads the offsets of the stored waveforms, if they are those of the same clips
+
+        :return: Whether the stored file can be reused.
+        """
+        if not self.index_path.is_file() or not self.path.is_file():
+            return False
+        with self.index_path.open('rt') as handle:
+            index = json.load(handle)
+        if index['fingerprint'] != fingerprint or \
+                len(np.load(self.path, mmap_mode='r')) != index['offsets'][-1]:
+            return False
+        self.offsets = np.array(index['offsets'])
+        self.sample_rates = np.array(index['sample_rates'])
+        return True
+
+    def _save(self, waveforms, fingerprint):
+        """
+        Writes the waveforms and then their index, each aside and renamed, so that processes which already map
+        the previous file keep reading it
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        index = {'fingerprint': fingerprint, 'offsets': self.offsets.tolist(),
+                 'sample_rates': self.sample_rates.tolist()}
+        _write_aside(self.path, lambda handle: np.save(handle, waveforms))
+        _write_aside(self.index_path, lambda handle: handle.write(json.dumps(index).encode()))
+
+
+def _write_aside(path, write):
+    """
+    Writes the file under a unique temporary name with the given function of the open handle, then renames it
+    """
+    handle, tmp_path = tempfile.mkstemp(dir=str(path.parent), suffix='.tmp')
+    with os.fdopen(handle, 'wb') as handle:
+        write(handle)
+    os.replace(tmp_path, str(path))
+
+
+def _fingerprint(dataset):
+    """
+    Hash of the path, size and modification time of every clip of the dataset, in order
+    """
+    digest = hashlib.sha1()
+    for idx in range(len(dataset)):
+        path = os.path.abspath(dataset.get_path(idx))
+        stat = os.stat(path)
+        digest.update('{}|{}|{}\n'.format(path, stat.st_size, stat.st_mtime_ns).encode())
+    return digest.hexdigest()
+
+
+def _load_all(dataset, num_workers):
+    """
+    Yields (waveform, sample rate) of every clip of the dataset, decoded in a process pool
+    """
+    indices = range(len(dataset))
+    if num_workers <= 1:
+        _init_worker(dataset)
+        yield from map(_load_item, indices)
+        return
+
+    chunksize = max(1, len(indices) // (4 * num_workers))
+    with ProcessPoolExecutor(num_workers, initializer=_init_worker, initargs=(dataset,)) as executor:
+        yield from executor.map(_load_item, indices, chunksize=chunksize)
+
+# dataset of the process pool workers
+_worker_dataset = None
+
+def _init_worker(dataset):
+    global _worker_dataset
+    _worker_dataset = dataset
+
+def _load_item(idx):
+    waveform, sample_rate = _worker_dataset.load(idx)
+    return waveform.numpy().astype(np.float32), sample_rate
@@ -0,0 +1,172 @@
+import os
+import json
+import hashlib
+import numpy as np
+import torch
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from torch.utils.data import Dataset
+
+
+class FeatureCache(Dataset):
+    """Persistent, memory-mapped cache of the transformed clips of a
+    dataset.
+
+    Every clip is decoded and transformed only once, in parallel, and
+    stored, flattened, in a single memory-mapped array along with its
+    offset and shape, so that clips of different lengths can be cached
+    too. Later epochs and test runs read the features straight from the
+    map. The cache directory is keyed by a hash of the transforms
+    configuration and of the `version` of the transforms, and every
+    entry records the modification time and size of its source file, so
+    stale entries are rebuilt automatically.
+
+    Args:
+        dataset (Dataset): Dataset to be cached, it must implement
+            `get_path(idx)`.
+        transforms_config (dict): `transforms` block of the
+            configuration used to build the dataset transforms.
+        cache_dir (string): Root directory of the cache.
+        num_workers (int, optional): Number of processes computing the
+            missing features. Default: number of CPUs
+    """
+    def __init__(self, dataset, transforms_config, cache_dir, num_workers=None):
+        self.dataset = dataset
+        self.num_workers = num_workers if num_workers is not None else os.cpu_count()
+
+        version = getattr(getattr(dataset, 'transforms', None), 'version', 0)
+        key = hashlib.sha1(json.dumps({'transforms': transforms_config, 'version': version},
+                                      sort_keys=True).encode()).hexdigest()[:16]
+        self.cache_dir = Path(cache_dir) / key
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.features_path = self.cache_dir / 'features.npy'
+        self.index_path = self.cache_dir / 'index.json'
+
+        entries = self._build()
+        paths = [os.path.abspath(dataset.get_path(idx)) for idx in range(len(dataset))]
+        self.offsets = [entries[path]['offset'] for path in paths]
+        self.shapes = [tuple(entries[path]['shape']) for path in paths]
+        self.labels = [entries[path]['label'] for path in paths]
+
+        # opened lazily, so that each data loader worker maps the file on its own
+        self._features = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, idx):
+        offset, shape = self.offsets[idx], self.shapes[idx]
+        data = np.array(self.features[offset:offset + int(np.prod(shape))]).reshape(shape)
+        return (torch.from_numpy(data), self.labels[idx])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_features'] = None
+        return state
+
+    @property
+    def features(self):
+        if self._features is None:
+            self._features = np.load(self.features_path, mmap_mode='r')
+        return self._features
+
+    def get_path(self, idx):
+        return self.dataset.get_path(idx)
+
+    def get_label(self, idx):
+        return self.labels[idx]
+
+    def get_duration(self, idx):
+        return self.dataset.get_duration(idx)
+
+    def get_speaker(self, idx):
+        return self.dataset.get_speaker(idx)
+
+    def _build(self):
+        """
+        Computes the features of missing or stale clips and stores them in the cache
+
+        :return: Dict of the cache entries, indexed by absolute path of the clip
+        """
+        index = {'dtype': None, 'size': 0, 'entries': {}}
+        if self.index_path.is_file() and self.features_path.is_file():
+            with self.index_path.open('rt') as handle:
+                index = json.load(handle)
+        entries = index['entries']
+
+        stale = {}
+        for idx in range(len(self.dataset)):
+            path = os.path.abspath(self.dataset.get_path(idx))
+            stat = os.stat(path)
+            entry = entries.get(path)
+            if entry is None or entry['mtime'] != stat.st_mtime_ns or entry['size'] != stat.st_size:
+                stale[idx] = (path, stat)
+        if not stale:
+            return entries
+
+        features = np.load(self.features_path, mmap_mode='r+') if index['size'] > 0 else None
+        for idx, data, label in self._compute(list(stale)):
+            if index['dtype'] is None:
+                index['dtype'] = str(data.dtype)
+            path, stat = stale[idx]
+            # entries keep their place if the size of their features did not change, others are appended
+            entry = entries.get(path)
+            if entry is not None and int(np.prod(entry['shape'])) == data.size:
+                offset = entry['offset']
+            else:
+                offset = index['size']
+                index['size'] += data.size
+            if features is None or index['size'] > len(features):
+                features = self._resize(features, max(index['size'], 2 * len(features) if features is not None else 0),
+                                        index['dtype'])
+            features[offset:offset + data.size] = data.ravel()
+            entries[path] = {'offset': offset, 'shape': list(data.shape), 'mtime': stat.st_mtime_ns,
+                             'size': stat.st_size, 'label': label}
+        features.flush()
+        del features
+
+        tmp_path = self.index_path.with_suffix('.tmp')
+        with tmp_path.open('wt') as handle:
+            json.dump(index, handle)
+        os.replace(tmp_path, self.index_path)
+        return entries
+
+    def _compute(self, indices):
+        """
+        Yields (index, features, label) of the given dataset items, computed in a process pool
+        """
+        if self.num_workers <= 1 or len(indices) == 1:
+            for idx in indices:
+                data, label = self.dataset[idx]
+                yield idx, data.numpy(), int(label)
+            return
+
+        chunksize = max(1, len(indices) // (4 * self.num_workers))
+        with ProcessPoolExecutor(self.num_workers, initializer=_init_worker, initargs=(self.dataset,)) as executor:
+            yield from executor.map(_compute_item, indices, chunksize=chunksize)
+
+    def _resize(self, features, size, dtype):
+        """
+        Grows the feature map to the given number of elements, keeping its content, and opens it for writing
+        """
+        tmp_path = self.features_path.with_suffix('.tmp')
+        resized = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=(size,))
+        if features is not None:
+            resized[:len(features)] = features
+        resized.flush()
+        del resized
+        os.replace(tmp_path, self.features_path)
+        return np.load(self.features_path, mmap_mode='r+')
+
+
+# dataset of the process pool workers
+_worker_dataset = None
+
+def _init_worker(dataset):
+    global _worker_dataset
+    _worker_dataset = dataset
+    torch.set_num_threads(1)
+
+def _compute_item(idx):
+    data, label = _worker_dataset[idx]
+    return idx, data.numpy(), int(label)
@@ -4,83 +4,134 @@ import torch
 from torch.utils import data
 import torchaudio
 from torch.utils.data import Dataset
+from .manifest import load_manifest
+from .shards import ShardedDataset
 
 
 class EMODB(Dataset):
     """EMODB: German emotional speech database
 
+    The clips are listed by the manifest of the corpus, built on first
+    use, in the order of their file names.
+
     Args:
         root_dir (string): Root directory of the wav files of the
             dataset.
         transforms (object, optional): Callable class with all
             transforms to be performed. Default: None
         training (boolean, optional): True for training set, False
-            for validation set. Default: True
+            for validation set, None for the whole dataset.
+            Default: True
+        manifest (string, optional): Manifest file of the corpus.
+            Default: manifest.npz in the root directory, or in the
+            user cache directory if the root is read-only
     """
-    def __init__(self, root_dir, transforms=None, training=True):
+    emotions = {k: i for i, k in enumerate([
+        'W',  # Ärger (Wut) - anger
+        'L',  # Langeweile  - boredom
+        'E',  # Ekel        - disgust
+        'A',  # Angst       - anxiety/fear
+        'F',  # Freude      - happiness
+        'T',  # Trauer      - sadness
+        'N',  #             - neutral version
+    ])}
+
+    def __init__(self, root_dir, transforms=None, training=True, manifest=None):
         self.root_dir = root_dir
         self.transforms = transforms
-        self.emotions = {k: i for i, k in enumerate([
-            'W',  # Ärger (Wut) - anger
-            'L',  # Langeweile  - boredom
-            'E',  # Ekel        - disgust
-            'A',  # Angst       - anxiety/fear
-            'F',  # Freude      - happiness
-            'T',  # Trauer      - sadness
-            'N',  #             - neutral version
-        ])}
-        self.filenames = os.listdir(self.root_dir)
-        delimiter = int(len(self.filenames) * .8)  # delimiter between training and validation
+        self.manifest = load_manifest(root_dir, self.parse, manifest)
+        delimiter = int(len(self.manifest) * .8)  # delimiter between training and validation
         if training:
-            self.filenames = self.filenames[:delimiter]
-        else:
-            self.filenames = self.filenames[delimiter:]
+            self.manifest = self.manifest.select(slice(None, delimiter))
+        elif training is not None:
+            self.manifest = self.manifest.select(slice(delimiter, None))
+
+    @classmethod
+    def parse(cls, path):
+        """
+        :return: Tuple (label, speaker) of the clip at the relative path, None if it is not a clip of the corpus
+        """
+        name = os.path.basename(path)
+        if len(name) < 7 or name[-6] not in cls.emotions:
+            return None
+        # xx___.wav -> xx is the speaker code, _x_.wav -> x is the emotion code
+        return cls.emotions[name[-6]], name[:2]
 
     def __len__(self):
-        return len(self.filenames)
+        return len(self.manifest)
 
-    def __getitem__(self, idx):
+    def get_path(self, idx):
+        return os.path.join(self.root_dir, self.manifest['path'][idx])
+
+    def get_duration(self, idx):
+        return float(self.manifest['duration'][idx])
+
+    def get_label(self, idx):
+        return self.manifest['label'][idx]
+
+    def get_speaker(self, idx):
+        return str(self.manifest['speaker'][idx])
+
+    def load(self, idx):
         # load wave file
-        path = os.path.join(self.root_dir, self.filenames[idx])
-        data, _ = torchaudio.load(path)
+        data, sample_rate = torchaudio.load(self.get_path(idx))
 
         # to mono
-        data = torch.mean(data, 0)
+        return torch.mean(data, 0), sample_rate
+
+    def __getitem__(self, idx):
+        data, sample_rate = self.load(idx)
 
         # apply transforms, if needed
         if self.transforms is not None:
-            data = self.transforms(data)
+            data = self.transforms(data, sample_rate)
 
         data = torch.unsqueeze(data, 0)
 
-        # parse filename to get emotion
-        emotion = self.emotions[path[-6]]  # _x_.wav -> x is the emotion code
-
-        return (data, emotion)
+        return (data, self.get_label(idx))
 
 class EMOVO(Dataset):
     """EMOVO: Italian emotional speech database
 
+    The clips are listed by the manifest of the corpus, built on first
+    use, in the order of their paths.
+
     Args:
         root_dir (string): Root directory of the dataset.
         transforms (object, optional): Callable class with all
             transforms to be performed. Default: None
         training (boolean, optional): True for training set, False
-            for validation set. Default: True
+            for validation set, None for the whole dataset.
+            Default: True
+        manifest (string, optional): Manifest file of the corpus.
+            Default: manifest.npz in the root directory, or in the
+            user cache directory if the root is read-only
     """
-    def __init__(self, root_dir, transforms=None, training=True):
+    emotions = [
+        'disgusto',   # disgust
+        'gioia',      # happiness
+        'paura',      # fear
+        'rabbia',     # anger
+        'sorpresa',   # surprise
+        'tristezza',  # sadness
+        'neutrale',   # neutral
+    ]
+    sentence_types = [
+        'b1', 'b2', 'b3',              # brevi - short
+        'l1', 'l2', 'l3', 'l4',        # lunghe - long
+        'n1', 'n2', 'n3', 'n4', 'n5',  # nonsense
+        'd1', 'd2',                    # domande - questions
+    ]
+
+    def __init__(self, root_dir, transforms=None, training=True, manifest=None):
         self.root_dir = root_dir
         self.transforms = transforms
-        self.emotions = [
-            'disgusto',   # disgust
-            'gioia',      # happiness
-            'paura',      # fear
-            'rabbia',     # anger
-            'sorpresa',   # surprise
-            'tristezza',  # sadness
-            'neutrale',   # neutral
-        ]
-        if training:
+        if training is None:
+            self.actors = [
+                'm1', 'm2', 'm3', # male
+                'f1', 'f2', 'f3', # female
+            ]
+        elif training:
             self.actors = [
                 'm1', 'm2', 'm3', # male
                 'f1', 'f2', # female
@@ -89,39 +140,114 @@ class EMOVO(Dataset):
             self.actors = [
                 'f3'
             ]
-        self.per_actor = 98
-        self.sentence_types = [
-            'b1', 'b2', 'b3',              # brevi - short
-            'l1', 'l2', 'l3', 'l4',        # lunghe - long
-            'n1', 'n2', 'n3', 'n4', 'n5',  # nonsense
-            'd1', 'd2',                    # domande - questions
-        ]
+        self.manifest = load_manifest(root_dir, self.parse, manifest)
+        self.manifest = self.manifest.select(np.isin(self.manifest['speaker'], self.actors))
+
+    @classmethod
+    def parse(cls, path):
+        """
+        :return: Tuple (label, speaker) of the clip at the relative path, None if it is not a clip of the corpus
+        """
+        # <emotion>-<actor>-<sentence type>.wav
+        parts = os.path.splitext(os.path.basename(path))[0].split('-')
+        labels = [emotion[:3] for emotion in cls.emotions]
+        if len(parts) != 3 or parts[0] not in labels:
+            return None
+        return labels.index(parts[0]), parts[1]
 
     def __len__(self):
-        return self.per_actor * len(self.actors)
+        return len(self.manifest)
+
+    def get_path(self, idx):
+        return os.path.join(self.root_dir, self.manifest['path'][idx])
+
+    def get_duration(self, idx):
+        return float(self.manifest['duration'][idx])
+
+    def get_label(self, idx):
+        return self.manifest['label'][idx]
+
+    def get_speaker(self, idx):
+        return str(self.manifest['speaker'][idx])
+
+    def load(self, idx):
+        # load wave file
+        data, sample_rate = torchaudio.load(self.get_path(idx))
+
+        # to mono
+        return torch.mean(data, 0), sample_rate
 
     def __getitem__(self, idx):
-        actor_idx = idx // self.per_actor
-        emotion_idx = idx % self.per_actor // len(self.sentence_types)
-        sentence_type_idx = idx % self.per_actor % len(self.sentence_types)
+        data, sample_rate = self.load(idx)
 
+        # apply transforms, if needed
+        if self.transforms is not None:
+            data = self.transforms(data, sample_rate)
+
+        data = torch.unsqueeze(data, 0)
+
+        return (data, self.get_label(idx))
+
+
+class Subset(data.Subset):
+    """Subset of a dataset at the given indices, which keeps the
+    metadata of the clips.
+
+    Args:
+        dataset (Dataset): Dataset implementing `get_path`,
+            `get_label` and `get_duration`.
+        indices (sequence): Indices of the dataset in the subset.
+    """
+    def get_path(self, idx):
+        return self.dataset.get_path(self.indices[idx])
+
+    def get_label(self, idx):
+        return self.dataset.get_label(self.indices[idx])
+
+    def get_duration(self, idx):
+        return self.dataset.get_duration(self.indices[idx])
+
+
+class AudioFiles(Dataset):
+    """Unlabelled audio files, e.g. for inference
+
+    Args:
+        paths (list): Paths of the audio files.
+        transforms (object, optional): Callable class with all
+            transforms to be performed. Default: None
+        skip_errors (boolean, optional): If True, files that cannot be
+            decoded yield None instead of raising. Default: False
+    """
+    def __init__(self, paths, transforms=None, skip_errors=False):
+        self.paths = list(paths)
+        self.transforms = transforms
+        self.skip_errors = skip_errors
+
+    def __len__(self):
+        return len(self.paths)
+
+    def get_path(self, idx):
+        return self.paths[idx]
+
+    def load(self, idx):
         # load wave file
-        path = os.path.join(self.root_dir, self.actors[actor_idx],
-            '{}-{}-{}.wav'.format(
-                self.emotions[emotion_idx][:3],
-                self.actors[actor_idx],
-                self.sentence_types[sentence_type_idx]
-            )
-        )
-        data, _ = torchaudio.load(path)
+        data, sample_rate = torchaudio.load(self.get_path(idx))
 
         # to mono
-        data = torch.mean(data, 0)
+        return torch.mean(data, 0), sample_rate
+
+    def __getitem__(self, idx):
+        try:
+            data, sample_rate = self.load(idx)
+        except RuntimeError:
+            if not self.skip_errors:
+                raise
+            return (None, idx)
 
         # apply transforms, if needed
         if self.transforms is not None:
-            data = self.transforms(data)
+            data = self.transforms(data, sample_rate)
 
         data = torch.unsqueeze(data, 0)
 
-        return (data, np.int64(emotion_idx))
+        return (data, idx)
@@ -0,0 +1,184 @@
+"""
+Columnar index of the clips of a corpus, so that datasets start without listing the corpus directory or opening
+any audio file.
+
+Run from the repository root to build or update the index of a corpus, e.g.:
+    python -m datasets.manifest data/emodb/wav --dataset EMODB
+"""
+import os
+import hashlib
+import argparse
+import tempfile
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import torchaudio
+
+MANIFEST_NAME = 'manifest.npz'
+
+
+class Manifest:
+    """Index of the clips of a corpus, one array per column: path
+    (relative to the corpus root), label, speaker, sample rate,
+    channels, frames and duration, along with the size and modification
+    time of the files when their header was probed.
+
+    It is stored as a single .npz file, with the rows sorted by path so
+    that the order of the clips does not depend on the file system.
+
+    Args:
+        columns (dict): Arrays of the columns, all of the same length.
+    """
+    columns = ['path', 'label', 'speaker', 'sample_rate', 'channels', 'frames', 'duration', 'size', 'mtime']
+    dtypes = {'path': str, 'label': np.int64, 'speaker': str, 'sample_rate': np.int32, 'channels': np.int16,
+              'frames': np.int64, 'duration': np.float64, 'size': np.int64, 'mtime': np.int64}
+
+    def __init__(self, columns):
+        self.data = {name: np.asarray(columns[name], dtype=self.dtypes[name]) for name in self.columns}
+
+    def __len__(self):
+        return len(self.data['path'])
+
+    def __getitem__(self, name):
+        return self.data[name]
+
+    def select(self, mask):
+        """
+        :return: Manifest of the rows where the mask is True
+        """
+        return Manifest({name: column[mask] for name, column in self.data.items()})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls({name: arrays[name] for name in cls.columns})
+
+    def save(self, path):
+        # written aside under a unique name and renamed, so that readers never see a partial file, even with
+        # several processes saving it at once
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        handle, tmp_path = tempfile.mkstemp(dir=str(path.parent), suffix='.tmp')
+        with os.fdopen(handle, 'wb') as handle:
+            np.savez(handle, **self.data)
+        os.replace(tmp_path, str(path))
+
+    @classmethod
+    def build(cls, root_dir, parse, path=None, num_workers=None):
+        """
+        Indexes the wav files of the corpus, probing the header of the new and modified ones in parallel and
+        reusing the rows of the existing manifest for the others, then saves it
+
+        :param parse: Function of the relative path of a clip returning its (label, speaker), or None for files
+            which are not clips of the corpus.
+        :param path: Manifest file, default is given by `default_path`.
+        :return: Tuple (manifest, number of probed files)
+        """
+        root_dir = Path(root_dir)
+        path = Path(path) if path is not None else default_path(root_dir)
+        num_workers = num_workers if num_workers is not None else os.cpu_count()
+
+        previous = {}
+        if path.is_file():
+            old = cls.load(path)
+            previous = {str(old['path'][i]): i for i in range(len(old))}
+
+        rows, stale = [], []
+        for relative_path in _scan(root_dir):
+            parsed = parse(relative_path)
+            if parsed is None:
+                continue
+            stat = os.stat(root_dir / relative_path)
+            row = {'path': relative_path, 'label': parsed[0], 'speaker': parsed[1],
+                   'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+            i = previous.get(relative_path)
+            if i is not None and old['size'][i] == stat.st_size and old['mtime'][i] == stat.st_mtime_ns:
+                row.update(sample_rate=old['sample_rate'][i], channels=old['channels'][i], frames=old['frames'][i])
+            else:
+                stale.append(row)
+            rows.append(row)
+
+        for row, (sample_rate, channels, frames) in zip(stale, _probe_all(
+                [str(root_dir / row['path']) for row in stale], num_workers)):
+            row.update(sample_rate=sample_rate, channels=channels, frames=frames)
+        for row in rows:
+            row['duration'] = row['frames'] / row['sample_rate']
+
+        manifest = cls({name: [row[name] for row in rows] for name in cls.columns})
+        if stale or len(rows) != len(previous):
+            manifest.save(path)
+        return manifest, len(stale)
+
+
+def default_path(root_dir):
+    """
+    Manifest file of a corpus: manifest.npz in its root, unless the root has none and cannot be written to, e.g. a
+    read-only mount, in which case it is kept in the user cache directory, under a name given by the root path
+    """
+    path = Path(root_dir) / MANIFEST_NAME
+    if path.is_file() or os.access(str(root_dir), os.W_OK):
+        return path
+    cache_dir = Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'speech-emotion-recognition'
+    key = hashlib.sha1(str(Path(root_dir).resolve()).encode()).hexdigest()[:16]
+    return cache_dir / 'manifests' / '{}.npz'.format(key)
+
+
+def load_manifest(root_dir, parse, path=None, num_workers=None):
+    """
+    Loads the manifest of the corpus, building it if it does not exist yet.
+
+    An existing manifest is not checked against the corpus: clips added, removed or modified since it was built,
+    and changes to `parse` (labels and speakers are stored in the manifest), are only seen once it is built again,
+    e.g. with `python -m datasets.manifest`.
+    """
+    path = Path(path) if path is not None else default_path(root_dir)
+    if path.is_file():
+        return Manifest.load(path)
+    return Manifest.build(root_dir, parse, path, num_workers)[0]
+
+
+def _scan(root_dir):
+    """
+    Relative paths, with forward slashes, of the wav files under the root directory, sorted
+    """
+    paths = []
+    for directory, _, filenames in os.walk(root_dir):
+        relative_dir = Path(directory).relative_to(root_dir)
+        paths.extend((relative_dir / name).as_posix() for name in filenames if name.lower().endswith('.wav'))
+    return sorted(paths)
+
+
+def _probe_all(paths, num_workers):
+    """
+    Yields (sample rate, channels, frames) of every file, read from its header without decoding it
+    """
+    if num_workers <= 1 or len(paths) < 2 * num_workers:
+        yield from map(_probe, paths)
+        return
+
+    chunksize = max(1, len(paths) // (4 * num_workers))
+    with ProcessPoolExecutor(num_workers) as executor:
+        yield from executor.map(_probe, paths, chunksize=chunksize)
+
+
+def _probe(path):
+    info = torchaudio.info(path)
+    return info.sample_rate, info.num_channels, info.num_frames
+
+
+if __name__ == '__main__':
+    # imported here, as the datasets import this module
+    import datasets.datasets as module_data
+
+    args = argparse.ArgumentParser(description='Builds or updates the manifest of a corpus')
+    args.add_argument('root_dir', type=str, help='root directory of the corpus')
+    args.add_argument('--dataset', required=True, type=str, choices=['EMODB', 'EMOVO'])
+    args.add_argument('-o', '--output', default=None, type=str,
+                      help='manifest file (default: manifest.npz in the root directory, if writable)')
+    args.add_argument('--num_workers', default=None, type=int,
+                      help='processes probing the files (default: number of CPUs)')
+    args = args.parse_args()
+
+    manifest, n_probed = Manifest.build(args.root_dir, getattr(module_data, args.dataset).parse, args.output,
+                                        args.num_workers)
+    print('{} clips, {} probed, {:.1f} hours'.format(len(manifest), n_probed, manifest['duration'].sum() / 3600))
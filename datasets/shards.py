@@ -0,0 +1,333 @@
+"""
+Sharded tar archives of a corpus, streamed with sequential reads instead of one small file open per clip.
+
+A shard directory holds shard-<split>-<n>.tar archives, each clip being a <key>.wav member (the original file,
+not re-encoded) followed by a <key>.json member with its label, speaker and duration, and an index.json listing
+the shards of every split and their number of clips.
+
+Run from the repository root to pack the training and validation splits of a corpus, e.g.:
+    python -m datasets.shards data/emodb/wav data/emodb-shards --dataset EMODB --shard_size 1000
+"""
+import io
+import os
+import json
+import random
+import tarfile
+import argparse
+from pathlib import Path
+import numpy as np
+import torch
+import torch.distributed as dist
+import torchaudio
+from torch.utils.data import IterableDataset, get_worker_info
+
+INDEX_NAME = 'index.json'
+
+
+class ShardWriter:
+    """Packs clips into tar shards of at most `shard_size` clips and
+    `max_bytes` bytes of audio.
+
+    Args:
+        output_dir (string): Directory of the shards.
+        split (string): Name of the split, e.g. 'train' or 'valid'.
+        shard_size (int, optional): Largest number of clips of a
+            shard. Default: 1000
+        max_bytes (int, optional): Largest size of the audio files of
+            a shard, in bytes. Default: None, no limit
+    """
+    def __init__(self, output_dir, split, shard_size=1000, max_bytes=None):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.split = split
+        self.shard_size = shard_size
+        self.max_bytes = max_bytes
+        self.shards = []
+        self.tar = None
+        self.count = 0
+        self.size = 0
+
+    def write(self, key, audio, metadata):
+        """
+        :param audio: Bytes of the audio file.
+        :param metadata: Dict with the label of the clip, and any other field.
+        """
+        full = self.count >= self.shard_size or \
+            (self.max_bytes is not None and self.count > 0 and self.size + len(audio) > self.max_bytes)
+        if self.tar is None or full:
+            self._next_shard()
+        self._add(key + '.wav', audio)
+        self._add(key + '.json', json.dumps(metadata).encode())
+        self.count += 1
+        self.size += len(audio)
+
+    def close(self):
+        """
+        :return: List of dicts with the name and number of clips of every shard
+        """
+        self._close_shard()
+        return self.shards
+
+    def _add(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def _next_shard(self):
+        self._close_shard()
+        name = 'shard-{}-{:06d}.tar'.format(self.split, len(self.shards))
+        # written aside and renamed once complete
+        self.tar = tarfile.open(self.output_dir / (name + '.tmp'), 'w')
+        self.shards.append({'name': name, 'count': 0})
+        self.count = 0
+        self.size = 0
+
+    def _close_shard(self):
+        if self.tar is None:
+            return
+        self.tar.close()
+        self.tar = None
+        name = self.shards[-1]['name']
+        os.replace(self.output_dir / (name + '.tmp'), self.output_dir / name)
+        self.shards[-1]['count'] = self.count
+
+
+def write_shards(dataset, output_dir, split, shard_size=1000, max_bytes=None, seed=0):
+    """
+    Packs the clips of a dataset into shards, in a random order so that shards mix speakers and emotions
+
+    :param dataset: Dataset implementing `get_path` and `get_label`, and optionally `get_speaker` and
+        `get_duration`, whose files are copied as they are.
+    :return: List of dicts with the name and number of clips of every shard
+    """
+    order = np.random.default_rng(seed).permutation(len(dataset))
+    writer = ShardWriter(output_dir, split, shard_size, max_bytes)
+    for i, idx in enumerate(order):
+        idx = int(idx)
+        metadata = {'label': int(dataset.get_label(idx)), 'path': os.path.basename(dataset.get_path(idx))}
+        if hasattr(dataset, 'get_speaker'):
+            metadata['speaker'] = dataset.get_speaker(idx)
+        if hasattr(dataset, 'get_duration'):
+            metadata['duration'] = dataset.get_duration(idx)
+        with open(dataset.get_path(idx), 'rb') as handle:
+            writer.write('{:09d}'.format(i), handle.read(), metadata)
+    return writer.close()
+
+
+class ShardedDataset(IterableDataset):
+    """Clips streamed from the tar shards of a corpus.
+
+    The shards are read one after the other, in an order shuffled at
+    every epoch when training, and the clips are shuffled within a
+    buffer of `shuffle_buffer` clips. Every data loader worker, of
+    every process of a distributed run, reads its own shards, or its
+    own part of the clips of a shard when there are fewer shards than
+    workers. In a distributed run, every process yields the same number
+    of clips, so that they stay in step: a worker with fewer clips than
+    its share goes over them again, in another order, and one with more
+    leaves some out, different ones at every epoch.
+
+    Args:
+        root_dir (string): Directory of the shards and of their index.
+        transforms (object, optional): Callable class with all
+            transforms to be performed. Default: None
+        training (boolean, optional): True for the training shards,
+            False for the validation ones, None for all of them.
+            Default: True
+        shuffle_buffer (int, optional): Number of clips shuffled
+            together, 0 to read them in order. Default: 1000, 0 when
+            not training
+        seed (int, optional): Shuffling seed, the same in every
+            process. Default: 0
+    """
+    def __init__(self, root_dir, transforms=None, training=True, shuffle_buffer=1000, seed=0):
+        self.root_dir = root_dir
+        self.transforms = transforms
+        self.training = training
+        self.shuffle_buffer = shuffle_buffer if training else 0
+        self.seed = seed
+        self.epoch = 1
+
+        with open(os.path.join(root_dir, INDEX_NAME), 'rt') as handle:
+            index = json.load(handle)
+        splits = ['train'] if training else ['valid'] if training is not None else ['train', 'valid']
+        self.shards = [shard for split in splits for shard in index['splits'][split]]
+        self.n_clips = sum(shard['count'] for shard in self.shards)
+
+    def validation(self):
+        """
+        :return: Dataset of the validation shards, with the same transforms
+        """
+        return ShardedDataset(self.root_dir, self.transforms, training=False, seed=self.seed)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        if self._pad():
+            # clips of every process, which are then all the same number
+            return self.n_clips // dist.get_world_size()
+        return self.n_clips
+
+    def worker_lengths(self, n_workers):
+        """
+        :return: Number of clips yielded by every data loader worker of this process in the coming epoch, each of
+            them batching its own clips
+        """
+        rank, world_size = _rank()
+        shards = self._order()
+        lengths = []
+        for worker in range(n_workers):
+            n_own = self._assign(shards, rank * n_workers + worker, world_size * n_workers)[3]
+            lengths.append(self._quota(worker, n_workers) if self._pad() and n_own > 0 else n_own)
+        return lengths
+
+    def __iter__(self):
+        rank, world_size = _rank()
+        worker_info = get_worker_info()
+        worker, n_workers = (worker_info.id, worker_info.num_workers) if worker_info is not None else (0, 1)
+        reader, n_readers = rank * n_workers + worker, world_size * n_workers
+
+        own_shards, part, n_parts, n_own = self._assign(self._order(), reader, n_readers)
+        rng = random.Random(self.seed + self.epoch * n_readers + reader)
+        # workers copied once and reused (persistent workers) move on to the next epoch by themselves
+        self.epoch += 1
+
+        def read():
+            clips = self._read([shard['name'] for shard in own_shards], part, n_parts)
+            return _shuffle(clips, self.shuffle_buffer, rng) if self.shuffle_buffer > 1 else clips
+
+        if not self._pad():
+            clips = read()
+        elif n_own > 0:
+            # the clips of the process are split between its workers, each reader going over its own clips,
+            # shuffled, as many times as needed to reach its share
+            clips = _take(_repeat(read), self._quota(worker, n_workers))
+        else:
+            return
+
+        for audio, label in clips:
+            data, sample_rate = torchaudio.load(io.BytesIO(audio))
+
+            # to mono
+            data = torch.mean(data, 0)
+
+            # apply transforms, if needed
+            if self.transforms is not None:
+                data = self.transforms(data, sample_rate)
+
+            data = torch.unsqueeze(data, 0)
+
+            yield (data, np.int64(label))
+
+    def _pad(self):
+        return bool(self.training) and _is_distributed() and dist.get_world_size() > 1
+
+    def _order(self):
+        # the same shard order in every process and worker, each reading its own part of it
+        shards = list(self.shards)
+        if self.training:
+            random.Random(self.seed + self.epoch).shuffle(shards)
+        return shards
+
+    def _quota(self, worker, n_workers):
+        """
+        Number of clips yielded by the worker when padding, its share of the clips of the process
+        """
+        n_clips = len(self)
+        return n_clips // n_workers + (worker < n_clips % n_workers)
+
+    @staticmethod
+    def _assign(shards, reader, n_readers):
+        """
+        :return: Tuple (shards, part, number of parts, number of clips) read by the reader, which keeps the clips of
+            the shards whose index is `part` modulo the number of parts
+        """
+        if n_readers <= len(shards):
+            own_shards, part, n_parts = shards[reader::n_readers], 0, 1
+        else:
+            # more readers than shards, the readers of a shard split its clips
+            own_shards = [shards[reader % len(shards)]]
+            part, n_parts = reader // len(shards), len(range(reader % len(shards), n_readers, len(shards)))
+        return own_shards, part, n_parts, sum(len(range(part, shard['count'], n_parts)) for shard in own_shards)
+
+    def _read(self, shards, part=0, n_parts=1):
+        """
+        Yields (audio bytes, label) of the clips of the shards, read sequentially, keeping only the clips whose
+        index in their shard is `part` modulo `n_parts`
+        """
+        for name in shards:
+            with tarfile.open(os.path.join(self.root_dir, name), 'r|') as tar:
+                audio, i = None, 0
+                for member in tar:
+                    if i % n_parts != part:
+                        i += member.name.endswith('.json')
+                        continue
+                    data = tar.extractfile(member).read()
+                    if member.name.endswith('.json'):
+                        yield audio, json.loads(data)['label']
+                        i += 1
+                    else:
+                        audio = data
+
+
+def _is_distributed():
+    return dist.is_available() and dist.is_initialized()
+
+
+def _rank():
+    return (dist.get_rank(), dist.get_world_size()) if _is_distributed() else (0, 1)
+
+
+def _repeat(make_iterable):
+    while True:
+        yield from make_iterable()
+
+
+def _take(iterable, n):
+    for i, item in enumerate(iterable):
+        if i >= n:
+            return
+        yield item
+
+
+def _shuffle(iterable, size, rng):
+    """
+    Yields the items in a random order, each one being drawn from a buffer of the next `size` items
+    """
+    buffer = []
+    for item in iterable:
+        if len(buffer) < size:
+            buffer.append(item)
+            continue
+        i = rng.randrange(size)
+        yield buffer[i]
+        buffer[i] = item
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+if __name__ == '__main__':
+    # imported here, as the datasets may import this module
+    import datasets.datasets as module_data
+
+    args = argparse.ArgumentParser(description='Packs the training and validation splits of a corpus into tar shards')
+    args.add_argument('root_dir', type=str, help='root directory of the corpus')
+    args.add_argument('output_dir', type=str, help='directory of the shards')
+    args.add_argument('--dataset', required=True, type=str, choices=['EMODB', 'EMOVO'])
+    args.add_argument('--shard_size', default=1000, type=int, help='largest number of clips of a shard (default: 1000)')
+    args.add_argument('--max_mb', default=None, type=float,
+                      help='largest size of the audio of a shard, in megabytes (default: no limit)')
+    args.add_argument('--seed', default=0, type=int)
+    args = args.parse_args()
+
+    dataset_cls = getattr(module_data, args.dataset)
+    max_bytes = int(args.max_mb * 2 ** 20) if args.max_mb is not None else None
+    index = {'dataset': args.dataset, 'splits': {}}
+    for split, training in [('train', True), ('valid', False)]:
+        shards = write_shards(dataset_cls(args.root_dir, training=training), args.output_dir, split,
+                              args.shard_size, max_bytes, args.seed)
+        index['splits'][split] = shards
+        print('{}: {} clips in {} shards'.format(split, sum(shard['count'] for shard in shards), len(shards)))
+    with open(os.path.join(args.output_dir, INDEX_NAME), 'wt') as handle:
+        json.dump(index, handle, indent=4)
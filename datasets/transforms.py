@@ -1,7 +1,47 @@
 import torch
+import torch.nn.functional as F
 from torchaudio.transforms import Resample, MelSpectrogram, AmplitudeToDB
 
 
+# resampling transforms, indexed by (orig_freq, new_freq)
+_resamplers = {}
+
+def resample(waveform, orig_freq, new_freq):
+    """Resamples the waveform from orig_freq to new_freq.
+
+    The polyphase kernel is built once per pair of rates and reused for
+    all the following clips, nothing is done if the rates match.
+    """
+    if orig_freq is None or orig_freq == new_freq:
+        return waveform
+    key = (orig_freq, new_freq)
+    if key not in _resamplers:
+        _resamplers[key] = Resample(orig_freq=orig_freq, new_freq=new_freq)
+    return _resamplers[key](waveform)
+
+
+def fix_length(waveform, length):
+    """Cuts or zero-pads the last dimension of the waveform to the
+    given number of samples.
+    """
+    if waveform.shape[-1] >= length:
+        return waveform[..., :length]
+    return F.pad(waveform, (0, length - waveform.shape[-1]))
+
+
+def split_transforms(transforms):
+    """Splits the transforms into the stage performed on each clip by
+    the dataset and the stage performed on each collated batch.
+
+    Returns:
+        tuple: Per-clip transforms and batch transforms, the latter is
+            None when all the work is done per clip.
+    """
+    if hasattr(transforms, 'sample_transforms'):
+        return transforms.sample_transforms, transforms
+    return transforms, None
+
+
 class LogMelSpectrogram(object):
     """Returns the log-mel spectrogram of the resampled audio clip.
 
@@ -15,18 +55,33 @@ class LogMelSpectrogram(object):
         n_fft (int): Size of FFT for the spectrogram. Default: 2048
         hop_length (int, optional): Length of hop between STFT windows.
             Default: 512
+        variable_length (boolean, optional): If True, shorter clips are
+            not padded, so that they can be batched with clips of
+            similar length only. Default: False
+
+    The native sample rate of the clip can be passed along with it, if
+    it is omitted the clip is assumed to be at `sample_rate` already.
+
+    `version` is bumped whenever the output changes for the same
+    arguments, so that cached features are computed again.
     """
-    def __init__(self, sample_rate, audio_length, n_fft, hop_length):
+    version = 1
+
+    def __init__(self, sample_rate, audio_length, n_fft, hop_length, variable_length=False):
         self.sample_rate = sample_rate
         self.audio_length = audio_length
         self.n_fft = n_fft
         self.hop_length = hop_length
+        self.variable_length = variable_length
 
-    def __call__(self, waveform):
-        waveform = Resample(new_freq=self.sample_rate)(waveform)
+    def __call__(self, waveform, sample_rate=None):
+        waveform = resample(waveform, sample_rate, self.sample_rate)
 
         # cut or pad audio clip
-        waveform.resize_(self.sample_rate * self.audio_length)
+        if self.variable_length:
+            waveform = waveform[..., :self.sample_rate * self.audio_length]
+        else:
+            waveform = fix_length(waveform, self.sample_rate * self.audio_length)
 
         mel_spec = MelSpectrogram(
             sample_rate=self.sample_rate,
@@ -41,3 +96,225 @@ class LogMelSpectrogram(object):
         log_mel_spec = AmplitudeToDB()(mel_spec)
 
         return log_mel_spec
+
+
+class FixedLengthWaveform(object):
+    """Returns the resampled audio clip, cut or padded with zeros to a
+    fixed length.
+
+    Args:
+        sample_rate (int): Sample rate to which the audio clip will be
+            resampled.
+        audio_length (int): Length in seconds of the audio clip.
+    """
+    version = 1
+
+    def __init__(self, sample_rate, audio_length):
+        self.sample_rate = sample_rate
+        self.audio_length = audio_length
+
+    def __call__(self, waveform, sample_rate=None):
+        waveform = resample(waveform, sample_rate, self.sample_rate)
+        return fix_length(waveform, self.sample_rate * self.audio_length)
+
+
+class BatchLogMelSpectrogram(torch.nn.Module):
+    """Returns the log-mel spectrograms of a batch of audio clips.
+
+    The dataset only resamples the clips and brings them to a fixed
+    length (see `sample_transforms`), the spectrograms of the whole
+    collated batch are then computed with a single STFT, reusing the
+    same window and mel filterbank.
+
+    Args:
+        sample_rate (int): Sample rate to which the audio clips will be
+            resampled.
+        audio_length (int): Length in seconds of the audio clips, longer
+            clips will be cut and shorter ones padded with zeros.
+        n_fft (int): Size of FFT for the spectrogram.
+        hop_length (int): Length of hop between STFT windows.
+    """
+    def __init__(self, sample_rate, audio_length, n_fft, hop_length):
+        super().__init__()
+        self.sample_transforms = FixedLengthWaveform(sample_rate, audio_length)
+        self.mel_spectrogram = MelSpectrogram(
+            sample_rate=sample_rate,
+            n_fft=n_fft,
+            hop_length=hop_length,
+        )
+        self.amplitude_to_db = AmplitudeToDB()
+
+    def forward(self, waveforms):
+        mel_spec = self.mel_spectrogram(waveforms)
+        mel_spec = torch.nan_to_num(mel_spec, 1e-5)
+        return self.amplitude_to_db(mel_spec)
+
+
+class BatchAugment(object):
+    """Augments a collated batch of log-mel spectrograms, of shape
+    (batch, channels, n_mels, frames), for training only.
+
+    Every augmentation draws the parameters of all the clips of the
+    batch at once and is applied with whole-batch tensor operations:
+    additive noise at a random SNR, time warping, frequency and time
+    masking (SpecAugment) and mixup.
+
+    Args:
+        noise_p (float, optional): Probability of adding noise to a
+            clip. Default: 0
+        noise_snr (list, optional): Range of the signal-to-noise ratio
+            of the noise, in dB. Default: [10, 30]
+        time_warp (int, optional): Largest shift, in frames, of the
+            warping point, 0 disables it. Default: 0
+        freq_masks (int, optional): Number of frequency masks per clip.
+            Default: 0
+        freq_mask_width (int, optional): Largest width of a frequency
+            mask, in mel bins. Default: 15
+        time_masks (int, optional): Number of time masks per clip.
+            Default: 0
+        time_mask_width (int, optional): Largest width of a time mask,
+            in frames. Default: 20
+        mixup_alpha (float, optional): Parameter of the Beta
+            distribution of the mixup weight, 0 disables it.
+            Default: 0
+        mixup_p (float, optional): Probability of mixing up a batch.
+            Default: 1
+
+    Noise is added to the mel power spectrum, as white noise whose
+    power is drawn per bin, so that it works on the spectrograms
+    computed per clip as well as on the ones computed per batch. Masks
+    are filled with the mean of the clip. Mixup uses one weight per
+    batch, so that the loss is the weighted sum of the criterion for
+    both targets, whatever the criterion.
+
+    With clips of different lengths, padded to the longest one, the
+    lengths in frames are passed along: warping points, masks and means
+    only cover the frames of each clip, and its padding is left as it
+    is. A clip mixed up with a longer one takes its length.
+    """
+    def __init__(self, noise_p=0.0, noise_snr=(10, 30), time_warp=0, freq_masks=0, freq_mask_width=15,
+                 time_masks=0, time_mask_width=20, mixup_alpha=0.0, mixup_p=1.0):
+        self.noise_p = noise_p
+        self.noise_snr = noise_snr
+        self.time_warp = time_warp
+        self.freq_masks = freq_masks
+        self.freq_mask_width = freq_mask_width
+        self.time_masks = time_masks
+        self.time_mask_width = time_mask_width
+        self.mixup_alpha = mixup_alpha
+        self.mixup_p = mixup_p
+
+    def __call__(self, data, target, lengths=None):
+        """
+        Args:
+            lengths (Tensor, optional): Number of frames of every clip,
+                None if they all fill the batch. Default: None
+
+        Returns:
+            tuple: Augmented data, lengths of its clips (None if not
+                given), and (mixed in target, weight of the original
+                target) when the batch is mixed up, else None.
+        """
+        if lengths is None:
+            lengths = torch.full((data.shape[0],), data.shape[3], device=data.device)
+            given = False
+        else:
+            given = True
+        if self.noise_p > 0:
+            data = self.add_noise(data, lengths)
+        if self.time_warp > 0:
+            data = self.warp_time(data, lengths)
+        if self.freq_masks > 0:
+            data = self.mask(data, lengths, 2, self.freq_masks, self.freq_mask_width)
+        if self.time_masks > 0:
+            data = self.mask(data, lengths, 3, self.time_masks, self.time_mask_width)
+        mix = None
+        if self.mixup_alpha > 0 and float(torch.rand(1)) < self.mixup_p:
+            data, lengths, mix = self.mixup(data, target, lengths)
+        return data, lengths if given else None, mix
+
+    def add_noise(self, data, lengths):
+        batch_size = data.shape[0]
+        low, high = self.noise_snr
+        snr = torch.empty(batch_size, device=data.device).uniform_(low, high)
+        applied = torch.rand(batch_size, device=data.device) < self.noise_p
+
+        # dB to power, as computed by AmplitudeToDB
+        power = torch.pow(10.0, data / 10)
+        valid = _valid_frames(data, lengths)
+        signal_power = _mean(power, valid).view(-1)
+        noise_power = torch.where(applied, signal_power / torch.pow(10.0, snr / 10), torch.zeros_like(snr))
+        noise = torch.empty_like(power).exponential_() * noise_power.view(-1, 1, 1, 1) * valid
+        return 10 * torch.log10(torch.clamp(power + noise, min=1e-10))
+
+    def warp_time(self, data, lengths):
+        """
+        Moves a random point of the time axis of every clip by a random number of frames, stretching the part
+        before it and squeezing the part after it, or the other way around
+        """
+        batch_size, channels, n_mels, frames = data.shape
+        end = (lengths.view(batch_size, 1) - 1).float()
+        # clips too short to be warped get a zero width, and are left as they are
+        width = torch.minimum(torch.full_like(end, self.time_warp), torch.div(end, 2, rounding_mode='floor') - 1)
+        width = torch.clamp(width, min=0)
+        if not (width >= 1).any():
+            return data
+        # points in (width, end - width) and shifts in [-width, width], for the whole batch, so that the warped
+        # point stays strictly within the clip
+        rand = torch.rand(batch_size, 2, device=data.device)
+        point = width + 1 + torch.floor(rand[:, :1] * (end - 2 * width - 1))
+        shift = torch.floor(rand[:, 1:] * (2 * width + 1)) - width
+        warped = point + shift
+
+        # source frame of every output frame, piecewise linear through (warped, point) up to the last frame of
+        # the clip, the padding and the clips too short staying in place
+        t = torch.arange(frames, device=data.device, dtype=torch.float32).expand(batch_size, frames)
+        source = torch.where(t < warped, t * point / warped, point + (t - warped) * (end - point) / (end - warped))
+        source = torch.where((t > end) | (width < 1), t, source)
+
+        # bilinear resampling of the time axis only
+        x = (2 * source / (frames - 1) - 1).view(batch_size, 1, frames, 1).expand(batch_size, n_mels, frames, 1)
+        y = torch.linspace(-1, 1, n_mels, device=data.device).view(1, n_mels, 1, 1).expand(batch_size, n_mels,
+                                                                                             frames, 1)
+        grid = torch.cat([x, y], dim=3).to(data.dtype)
+        return F.grid_sample(data, grid, mode='bilinear', align_corners=True)
+
+    def mask(self, data, lengths, dim, n_masks, max_width):
+        """
+        Fills `n_masks` bands of random widths, up to `max_width`, of the dimension with the mean of each clip,
+        within the frames of the clip along the time axis
+        """
+        batch_size, size = data.shape[0], data.shape[dim]
+        # number of bins, or of frames, of every clip
+        sizes = lengths.view(batch_size, 1) if dim == 3 else torch.full((batch_size, 1), size, device=data.device)
+        widths = torch.randint(0, min(max_width, size) + 1, (batch_size, n_masks), device=data.device)
+        widths = torch.minimum(widths, sizes)
+        starts = (torch.rand(batch_size, n_masks, device=data.device) * (sizes - widths + 1)).long()
+
+        positions = torch.arange(size, device=data.device).view(1, 1, size)
+        masked = ((positions >= starts.unsqueeze(2)) & (positions < (starts + widths).unsqueeze(2))).any(dim=1)
+        shape = [batch_size, 1, 1, 1]
+        shape[dim] = size
+        return torch.where(masked.view(shape), _mean(data, _valid_frames(data, lengths)), data)
+
+    def mixup(self, data, target, lengths):
+        weight = float(torch.distributions.Beta(self.mixup_alpha, self.mixup_alpha).sample())
+        perm = torch.randperm(data.shape[0], device=data.device)
+        lengths = torch.maximum(lengths, lengths[perm])
+        return weight * data + (1 - weight) * data[perm], lengths, (target[perm], weight)
+
+
+def _valid_frames(data, lengths):
+    """
+    Mask of the frames of every clip of a batch, of shape (batch, 1, 1, frames)
+    """
+    frames = torch.arange(data.shape[3], device=data.device)
+    return (frames.view(1, -1) < lengths.view(-1, 1)).to(data.dtype).view(data.shape[0], 1, 1, -1)
+
+
+def _mean(data, valid):
+    """
+    Mean of every clip of a batch over its frames, of shape (batch, 1, 1, 1)
+    """
+    count = torch.clamp(valid.sum(dim=(1, 2, 3), keepdim=True), min=1) * data.shape[1] * data.shape[2]
+    return (data * valid).sum(dim=(1, 2, 3), keepdim=True) / count
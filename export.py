@@ -0,0 +1,129 @@
+import json
+import argparse
+from pathlib import Path
+import torch
+import torch.nn as nn
+from torchaudio.transforms import MelSpectrogram
+import model.model as module_arch
+from parse_config import ConfigParser
+from utils import load_checkpoint
+
+
+class LogMelFrontEnd(nn.Module):
+    """Log-mel spectrogram of a batch of fixed-length waveforms, matching
+    LogMelSpectrogram, written with the real-valued STFT so that it can be
+    traced and exported to ONNX.
+
+    Args:
+        sample_rate (int): Sample rate of the waveforms.
+        n_fft (int): Size of FFT for the spectrogram.
+        hop_length (int): Length of hop between STFT windows.
+    """
+    def __init__(self, sample_rate, n_fft, hop_length):
+        super().__init__()
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        mel_spectrogram = MelSpectrogram(sample_rate=sample_rate, n_fft=n_fft, hop_length=hop_length)
+        self.register_buffer('window', torch.hann_window(n_fft))
+        self.register_buffer('filterbank', mel_spectrogram.mel_scale.fb)
+
+    def forward(self, waveforms):
+        # the real-valued STFT output is the only one supported by the ONNX exporter
+        spec = torch.stft(waveforms, self.n_fft, self.hop_length, window=self.window,
+                          center=True, pad_mode='reflect', return_complex=False)
+        power = spec.pow(2).sum(-1)
+        mel_spec = torch.matmul(power.transpose(1, 2), self.filterbank).transpose(1, 2)
+        log_mel_spec = 10.0 * torch.log10(torch.clamp(mel_spec, min=1e-10))
+        return log_mel_spec.unsqueeze(1)
+
+
+class InferenceModel(nn.Module):
+    """
+    Front end and model fused together: fixed-length waveforms (batch, samples) in, class probabilities out
+    """
+    def __init__(self, model, sample_rate, n_fft, hop_length):
+        super().__init__()
+        self.front_end = LogMelFrontEnd(sample_rate, n_fft, hop_length)
+        self.model = model
+
+    def forward(self, waveforms):
+        return torch.exp(self.model(self.front_end(waveforms)))
+
+
+def build_inference_model(model, transforms_args):
+    """
+    Fuses the log-mel front end described by the transforms arguments with the model, in eval mode
+    """
+    fused = InferenceModel(model, transforms_args['sample_rate'], transforms_args['n_fft'],
+                           transforms_args['hop_length'])
+    return fused.eval()
+
+
+def export(fused, transforms_args, emotions, output, onnx=False):
+    """
+    Saves the fused model as TorchScript (and ONNX), along with a metadata file read by the runtime
+
+    :return: List of the written paths
+    """
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    n_samples = transforms_args['sample_rate'] * transforms_args['audio_length']
+    example = torch.zeros(2, n_samples)
+
+    with torch.no_grad():
+        scripted = torch.jit.trace(fused, example)
+    scripted = torch.jit.freeze(scripted)
+    script_path = output.with_suffix('.pt')
+    scripted.save(str(script_path))
+    paths = [script_path]
+
+    if onnx:
+        onnx_path = output.with_suffix('.onnx')
+        torch.onnx.export(fused, example, str(onnx_path), opset_version=17,
+                          input_names=['waveforms'], output_names=['probabilities'],
+                          dynamic_axes={'waveforms': {0: 'batch'}, 'probabilities': {0: 'batch'}})
+        paths.append(onnx_path)
+
+    metadata_path = output.with_suffix('.json')
+    with metadata_path.open('wt') as handle:
+        json.dump({
+            'sample_rate': transforms_args['sample_rate'],
+            'n_samples': n_samples,
+            'emotions': emotions
+        }, handle, indent=4)
+    paths.append(metadata_path)
+    return paths
+
+
+def main(config, args):
+    logger = config.get_logger('export')
+
+    # build model architecture
+    model = config.init_obj('arch', module_arch)
+
+    logger.info('Loading checkpoint: {} ...'.format(config.resume))
+    checkpoint = load_checkpoint(config.resume)
+    model.load_state_dict(checkpoint['state_dict'])
+
+    fused = build_inference_model(model, config['transforms']['args'])
+    output = args.output if args.output is not None else Path(config.resume).with_suffix('')
+    for path in export(fused, config['transforms']['args'], config['arch']['args']['emotions'], output,
+                       onnx=args.onnx):
+        logger.info('Saved {}'.format(path))
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description='PyTorch Template')
+    args.add_argument('-c', '--config', default=None, type=str,
+                      help='config file path (default: None)')
+    args.add_argument('-r', '--resume', default=None, type=str,
+                      help='path to checkpoint (default: None)')
+    args.add_argument('-d', '--device', default=None, type=str,
+                      help='indices of GPUs to enable (default: all)')
+    args.add_argument('-o', '--output', default=None, type=str,
+                      help='output path, without extension (default: next to the checkpoint)')
+    args.add_argument('--onnx', action='store_true',
+                      help='also export to ONNX (default: off)')
+
+    config = ConfigParser.from_args(args)
+    main(config, args.parse_args())
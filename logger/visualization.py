@@ -1,11 +1,27 @@
+import time
+import queue
 import importlib
-from datetime import datetime
+import threading
+import torch
 
 
 class TensorboardWriter():
-    def __init__(self, log_dir, logger, enabled):
+    """
+    Tensorboard writer logging each tag at most at its sampling rate, and serializing the summaries in a
+    background thread.
+
+    :param rates: Dict of logging periods, by tag or by kind ('scalar', 'image', 'histogram', ...), tags
+        taking precedence: scalars are logged every `rate` steps, the other kinds once every `rate` epochs.
+    :param max_queue: Number of summaries waiting to be written, after which new ones are dropped.
+    :param close_timeout: Seconds `close` waits for the queued summaries to be written.
+    """
+    step_kinds = {'scalar', 'scalars'}
+    default_rates = {'scalar': 1, 'image': 1, 'histogram': 1}
+
+    def __init__(self, log_dir, logger, enabled, rates=None, max_queue=100, close_timeout=60):
         self.writer = None
         self.selected_module = ""
+        self.logger = logger
 
         if enabled:
             log_dir = str(log_dir)
@@ -28,24 +44,96 @@ class TensorboardWriter():
                 logger.warning(message)
 
         self.step = 0
+        self.epoch = 1
         self.mode = ''
+        self.rates = dict(self.default_rates, **(rates or {}))
+        self.logged = {}
+        self.dropped = 0
+        self.failed_tags = set()
+        self.close_timeout = close_timeout
 
         self.tb_writer_ftns = {
             'add_scalar', 'add_scalars', 'add_image', 'add_images', 'add_audio',
             'add_text', 'add_histogram', 'add_pr_curve', 'add_embedding'
         }
         self.tag_mode_exceptions = {'add_histogram', 'add_embedding'}
-        self.timer = datetime.now()
+        self.timer = (0, time.perf_counter())
+
+        self.queue = None
+        if self.writer is not None:
+            self.queue = queue.Queue(maxsize=max_queue)
+            self.thread = threading.Thread(target=self._run, name='tensorboard-writer', daemon=True)
+            self.thread.start()
 
     def set_step(self, step, mode='train'):
         self.mode = mode
         self.step = step
+        if self.writer is None:
+            return
         if step == 0:
-            self.timer = datetime.now()
-        else:
-            duration = datetime.now() - self.timer
-            self.add_scalar('steps_per_sec', 1 / duration.total_seconds())
-            self.timer = datetime.now()
+            self.timer = (0, time.perf_counter())
+        elif self.due('steps_per_sec', 'scalar'):
+            # average over the steps since the last logged value
+            last_step, last_time = self.timer
+            now = time.perf_counter()
+            if step > last_step and now > last_time:
+                self.add_scalar('steps_per_sec', (step - last_step) / (now - last_time))
+            self.timer = (step, now)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def due(self, tag, kind):
+        """
+        Whether a summary of the tag would be logged now, to skip preparing the ones which would not
+        """
+        if self.writer is None:
+            return False
+        rate = self.rates.get(tag, self.rates.get(kind, 1))
+        if not rate:
+            return False
+        if kind in self.step_kinds:
+            return self.step % rate == 0
+        # once per epoch, every `rate` epochs
+        return (self.epoch - 1) % rate == 0 and self.logged.get((tag, self.mode)) != self.epoch
+
+    def close(self):
+        """
+        Writes the queued summaries and closes the writer
+        """
+        if self.queue is not None:
+            try:
+                if self.thread.is_alive():
+                    self.queue.put(None, timeout=self.close_timeout)
+                    self.thread.join(self.close_timeout)
+            except queue.Full:
+                pass
+            if self.thread.is_alive():
+                self.logger.warning("Warning: the tensorboard writer did not finish within {} s, the remaining "
+                                    "summaries are lost.".format(self.close_timeout))
+            self.queue = None
+            self.writer.close()
+            if self.dropped:
+                self.logger.warning("Warning: {} tensorboard summaries were dropped, the writer could not keep "
+                                    "up.".format(self.dropped))
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.writer.flush()
+                return
+            add_data, tag, data, step, args, kwargs = item
+            try:
+                if callable(data):
+                    data = data()
+                add_data(tag, data, step, *args, **kwargs)
+            except Exception as error:
+                # a failing summary is skipped, reported once per tag, and the others are still written
+                if tag not in self.failed_tags:
+                    self.failed_tags.add(tag)
+                    self.logger.warning("Warning: tensorboard summary '{}' could not be written: {}".format(
+                        tag, error))
 
     def __getattr__(self, name):
         """
@@ -53,16 +141,28 @@ class TensorboardWriter():
             return add_data() methods of tensorboard with additional information (step, tag) added.
         Otherwise:
             return a blank function handle that does nothing
+
+        The summaries are only logged when due, then written in the background: data may be a function
+        returning the data, so that e.g. images are only prepared when they are logged. Tensors updated in place
+        afterwards (e.g. parameters) must be copied by the caller.
         """
         if name in self.tb_writer_ftns:
             add_data = getattr(self.writer, name, None)
+            kind = name[len('add_'):]
 
             def wrapper(tag, data, *args, **kwargs):
-                if add_data is not None:
-                    # add mode(train/valid) tag
-                    if name not in self.tag_mode_exceptions:
-                        tag = '{}/{}'.format(tag, self.mode)
-                    add_data(tag, data, self.step, *args, **kwargs)
+                if add_data is None or not self.due(tag, kind):
+                    return
+                self.logged[(tag, self.mode)] = self.epoch
+                if torch.is_tensor(data):
+                    data = data.detach()
+                # add mode(train/valid) tag
+                if name not in self.tag_mode_exceptions:
+                    tag = '{}/{}'.format(tag, self.mode)
+                try:
+                    self.queue.put_nowait((add_data, tag, data, self.step, args, kwargs))
+                except queue.Full:
+                    self.dropped += 1
             return wrapper
         else:
             # default action for returning methods defined in this class, set_step() for instance.
@@ -5,16 +5,13 @@ def accuracy(output, target):
     with torch.no_grad():
         pred = torch.argmax(output, dim=1)
         assert pred.shape[0] == len(target)
-        correct = 0
-        correct += torch.sum(pred == target).item()
-    return correct / len(target)
+        correct = torch.sum(pred == target)
+    return correct.double() / len(target)
 
 
 def top_k_acc(output, target, k=2):
     with torch.no_grad():
         pred = torch.topk(output, k, dim=1)[1]
         assert pred.shape[0] == len(target)
-        correct = 0
-        for i in range(k):
-            correct += torch.sum(pred[:, i] == target).item()
-    return correct / len(target)
+        correct = torch.sum(pred == target.unsqueeze(1))
+    return correct.double() / len(target)
@@ -3,6 +3,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 from torch.nn.modules.linear import Linear
 from torch.nn.modules.rnn import LSTM
+from torch.nn.utils.rnn import pack_padded_sequence
 from base import BaseModel
 
 
@@ -35,13 +36,34 @@ class SpeechEmotionModel(BaseModel):
         self.lstm = nn.LSTM(128, 32, batch_first=True)
         self.fc = nn.Linear(32, emotions)
 
-    def forward(self, x):
+        # number of input frames per LSTM time step
+        self.time_reduction = 1
+        for module in self.convolutions:
+            if isinstance(module, nn.MaxPool2d):
+                self.time_reduction *= module.stride
+
+    def forward(self, x, lengths=None):
+        """
+        :param x: Batch of log-mel spectrograms, shaped (batch, 1, n_mels, frames)
+        :param lengths: Optional number of valid (unpadded) frames of each clip
+        """
+        # shorter inputs would not last a single LSTM time step
+        if x.shape[-1] < self.time_reduction:
+            x = F.pad(x, (0, self.time_reduction - x.shape[-1]))
+
         x = self.convolutions(x)
 
         x = self.flatten(x)
         x = torch.swapaxes(x, 1, 2)
-        x, _ = self.lstm(x)
-        x = x[:, -1, :]
+        if lengths is None:
+            x, _ = self.lstm(x)
+            x = x[:, -1, :]
+        else:
+            # the last hidden state of the packed sequence is the one of the last valid time step
+            lengths = torch.clamp(lengths // self.time_reduction, 1, x.shape[1])
+            x = pack_padded_sequence(x, lengths.cpu(), batch_first=True, enforce_sorted=False)
+            _, (x, _) = self.lstm(x)
+            x = x[-1]
         x = self.fc(x)
 
         return F.log_softmax(x, dim=1)
@@ -0,0 +1,76 @@
+import torch
+import torch.nn as nn
+from torch.ao.quantization import QuantStub, DeQuantStub, fuse_modules, get_default_qconfig, prepare, convert, \
+    quantize_dynamic
+
+
+def prepare_static(model, backend='x86'):
+    """
+    Fuses every Conv2d with the following BatchNorm2d and inserts observers in the convolutional stack, in place
+
+    The stack is wrapped between a QuantStub and a DeQuantStub, so that the forward pass of the model is unchanged.
+    The model must be in eval mode; it has then to be run on calibration data before calling `convert_quantized`.
+    """
+    convolutions = model.convolutions
+    pairs = [[str(i), str(i + 1)] for i in range(len(convolutions) - 1)
+             if isinstance(convolutions[i], nn.Conv2d) and isinstance(convolutions[i + 1], nn.BatchNorm2d)]
+    convolutions = fuse_modules(convolutions, pairs)
+
+    model.convolutions = nn.Sequential(QuantStub(), *convolutions, DeQuantStub())
+    model.convolutions.qconfig = get_default_qconfig(backend)
+    torch.backends.quantized.engine = backend
+    prepare(model.convolutions, inplace=True)
+    return model
+
+
+def convert_quantized(model):
+    """
+    Converts the calibrated convolutional stack to static int8, and the LSTM and Linear layers to dynamic int8,
+    in place
+    """
+    convert(model.convolutions, inplace=True)
+    quantize_dynamic(model, {nn.LSTM, nn.Linear}, dtype=torch.qint8, inplace=True)
+    return model
+
+
+def quantize(model, calibration_batches, backend='x86'):
+    """
+    Post-training int8 quantization of a SpeechEmotionModel, in place
+
+    :param calibration_batches: Iterable of (data, lengths) the static quantization ranges are calibrated on.
+    """
+    model.eval()
+    prepare_static(model, backend)
+    with torch.no_grad():
+        for data, lengths in calibration_batches:
+            model(data, lengths)
+    return convert_quantized(model)
+
+
+def quantized_structure(model, backend='x86'):
+    """
+    Gives a float model the structure of its quantized version, so that a quantized state dict can be loaded
+    """
+    model.eval()
+    prepare_static(model, backend)
+    return convert_quantized(model)
+
+
+def activation_qparams(model):
+    """
+    Output scales and zero points of the quantized modules which keep them outside of their state dict (e.g. ELU)
+    """
+    return {name: (float(module.scale), int(module.zero_point)) for name, module in model.named_modules()
+            if hasattr(module, 'scale') and 'scale' not in module.state_dict()}
+
+
+def load_quantized(model, checkpoint, backend='x86'):
+    """
+    Restores a quantized model saved as its state dict and activation quantization parameters
+    """
+    model = quantized_structure(model, backend)
+    model.load_state_dict(checkpoint['state_dict'])
+    modules = dict(model.named_modules())
+    for name, (scale, zero_point) in checkpoint['activation_qparams'].items():
+        modules[name].scale, modules[name].zero_point = scale, zero_point
+    return model
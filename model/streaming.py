@@ -0,0 +1,105 @@
+import torch
+import torch.nn.functional as F
+from torchaudio.transforms import MelSpectrogram, AmplitudeToDB
+from datasets.transforms import resample
+
+
+class StreamingEmotionRecognizer:
+    """Runs a SpeechEmotionModel over an audio stream of any length,
+    chunk by chunk, with bounded memory.
+
+    The log-mel spectrogram is computed incrementally: the start of the
+    stream is reflect-padded as by the centered STFT used in training,
+    and the samples not covered by a complete STFT window are carried
+    over to the next chunk, so frames are identical to those of a
+    single STFT over the whole stream, but for the last ones. Every
+    `window_frames` new frames go through the convolutions on their
+    own, and the LSTM state is carried across windows, emitting one
+    emotion posterior per window.
+
+    Args:
+        model (SpeechEmotionModel): Trained model.
+        sample_rate (int): Sample rate of the model input.
+        n_fft (int): Size of FFT for the spectrogram.
+        hop_length (int): Length of hop between STFT windows.
+        window_frames (int, optional): Number of spectrogram frames per
+            posterior, a multiple of the model time reduction. Default:
+            the model time reduction
+        input_sample_rate (int, optional): Sample rate of the stream,
+            chunks are resampled independently when it differs from
+            `sample_rate`. Default: `sample_rate`
+    """
+    def __init__(self, model, sample_rate, n_fft, hop_length, window_frames=None, input_sample_rate=None):
+        self.model = model.eval()
+        self.device = next(model.parameters()).device
+        self.sample_rate = sample_rate
+        self.input_sample_rate = input_sample_rate if input_sample_rate is not None else sample_rate
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.window_frames = window_frames if window_frames is not None else model.time_reduction
+        assert self.window_frames % model.time_reduction == 0, \
+            "window_frames must be a multiple of the model time reduction ({}).".format(model.time_reduction)
+
+        self.mel_spectrogram = MelSpectrogram(
+            sample_rate=sample_rate,
+            n_fft=n_fft,
+            hop_length=hop_length,
+            center=False
+        ).to(self.device)
+        self.amplitude_to_db = AmplitudeToDB()
+        self.reset()
+
+    @property
+    def window_seconds(self):
+        return self.window_frames * self.hop_length / self.sample_rate
+
+    def reset(self):
+        """
+        Starts a new stream
+        """
+        self.samples = torch.zeros(0, device=self.device)
+        self.padded = False
+        self.frames = torch.zeros(self.mel_spectrogram.n_mels, 0, device=self.device)
+        self.state = None
+
+    @torch.no_grad()
+    def process(self, chunk):
+        """
+        Feeds a chunk of the stream
+
+        :param chunk: 1-D tensor with the new samples.
+        :return: Tensor of shape (windows, emotions) with the posteriors of the windows completed by the chunk,
+            possibly empty.
+        """
+        chunk = resample(chunk.to(self.device), self.input_sample_rate, self.sample_rate)
+        self.samples = torch.cat([self.samples, chunk])
+
+        if not self.padded and len(self.samples) > self.n_fft // 2:
+            # the start of the stream reflected, as by the centered STFT used in training
+            self.samples = torch.cat([self.samples[1:self.n_fft // 2 + 1].flip(0), self.samples])
+            self.padded = True
+
+        if self.padded and len(self.samples) >= self.n_fft:
+            n_frames = 1 + (len(self.samples) - self.n_fft) // self.hop_length
+            mel_spec = self.mel_spectrogram(self.samples[:(n_frames - 1) * self.hop_length + self.n_fft])
+            log_mel_spec = self.amplitude_to_db(torch.nan_to_num(mel_spec, 1e-5))
+            self.samples = self.samples[n_frames * self.hop_length:]
+            self.frames = torch.cat([self.frames, log_mel_spec], dim=1)
+
+        posteriors = []
+        while self.frames.shape[1] >= self.window_frames:
+            posteriors.append(self._step(self.frames[:, :self.window_frames]))
+            self.frames = self.frames[:, self.window_frames:]
+        if not posteriors:
+            return torch.empty(0, self.model.fc.out_features)
+        return torch.stack(posteriors).cpu()
+
+    def _step(self, window):
+        x = self.model.convolutions(window[None, None])
+
+        x = self.model.flatten(x)
+        x = torch.swapaxes(x, 1, 2)
+        x, self.state = self.model.lstm(x, self.state)
+        x = self.model.fc(x[:, -1, :])
+
+        return F.softmax(x, dim=1)[0]
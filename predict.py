@@ -0,0 +1,202 @@
+import os
+import csv
+import json
+import glob
+import argparse
+from functools import partial
+from pathlib import Path
+import torch
+from torch.utils.data import DataLoader as TorchDataLoader
+from torch.utils.data.dataloader import default_collate
+from tqdm import tqdm
+import datasets.transforms as module_transforms
+import datasets.datasets as module_data
+import model.model as module_arch
+from data_loader import pad_collate, unpack_batch
+from parse_config import ConfigParser
+from utils import load_checkpoint
+
+
+AUDIO_EXTENSIONS = {'.wav', '.flac', '.ogg', '.mp3'}
+
+
+def list_inputs(inputs):
+    """
+    Lists the audio files given as directories, glob patterns or manifests
+
+    A manifest is a .txt file with one path per line, or a .csv/.jsonl file with a 'path' field, relative paths
+    being relative to the manifest itself.
+    """
+    paths = []
+    for item in inputs:
+        item = Path(item)
+        if item.is_dir():
+            paths.extend(sorted(str(p) for p in item.rglob('*') if p.suffix.lower() in AUDIO_EXTENSIONS))
+        elif item.is_file() and item.suffix.lower() not in AUDIO_EXTENSIONS:
+            paths.extend(str(item.parent / p) for p in _read_manifest(item))
+        elif item.is_file():
+            paths.append(str(item))
+        else:
+            paths.extend(sorted(glob.glob(str(item), recursive=True)))
+    return paths
+
+def _read_manifest(fname):
+    with fname.open('rt') as handle:
+        if fname.suffix == '.csv':
+            return [row['path'] for row in csv.DictReader(handle)]
+        elif fname.suffix == '.jsonl':
+            return [json.loads(line)['path'] for line in handle if line.strip()]
+        return [line.strip() for line in handle if line.strip()]
+
+
+class PredictionWriter:
+    """
+    Appends per-file predictions to a JSONL or CSV file, skipping the files already predicted by a previous run.
+    Files which failed are tried again, their new row following the error one.
+    """
+    def __init__(self, fname, n_classes):
+        self.fname = Path(fname)
+        self.format = 'csv' if self.fname.suffix == '.csv' else 'jsonl'
+        self.fields = ['path', 'prediction'] + ['prob_{}'.format(i) for i in range(n_classes)] + ['error']
+        self.done = self._read_done()
+
+        new_file = not self.fname.is_file() or self.fname.stat().st_size == 0
+        self.handle = self.fname.open('at', newline='')
+        if self.format == 'csv':
+            self.csv_writer = csv.DictWriter(self.handle, fieldnames=self.fields)
+            if new_file:
+                self.csv_writer.writeheader()
+
+    def _read_done(self):
+        if not self.fname.is_file():
+            return set()
+
+        # drop the last line if an interruption left it incomplete
+        with self.fname.open('rb+') as handle:
+            content = handle.read()
+            if content and not content.endswith(b'\n'):
+                handle.truncate(content.rfind(b'\n') + 1)
+
+        with self.fname.open('rt', newline='') as handle:
+            if self.format == 'csv':
+                rows = csv.DictReader(handle)
+            else:
+                rows = (json.loads(line) for line in handle if line.strip())
+            return {row['path'] for row in rows if not row.get('error')}
+
+    def write(self, path, probabilities=None, error=None):
+        if error is not None:
+            row = {'path': path, 'error': error}
+        else:
+            row = {'path': path, 'prediction': int(probabilities.argmax())}
+            row.update({'prob_{}'.format(i): float(p) for i, p in enumerate(probabilities)})
+
+        if self.format == 'csv':
+            self.csv_writer.writerow(row)
+        elif error is not None:
+            self.handle.write(json.dumps(row) + '\n')
+        else:
+            self.handle.write(json.dumps({
+                'path': path,
+                'prediction': row['prediction'],
+                'probabilities': [float(p) for p in probabilities]
+            }) + '\n')
+
+    def flush(self):
+        self.handle.flush()
+        os.fsync(self.handle.fileno())
+
+    def close(self):
+        self.handle.close()
+
+
+def collate_skipping_failed(batch, collate_fn):
+    """
+    Collates the decoded clips of the batch, also returning the indices of the ones that could not be decoded
+    """
+    failed = [idx for data, idx in batch if data is None]
+    batch = [(data, idx) for data, idx in batch if data is not None]
+    return (collate_fn(batch) if batch else None), failed
+
+def _init_worker(worker_id):
+    # decoding workers should not compete with the model for cores
+    torch.set_num_threads(1)
+
+
+def main(config, args):
+    logger = config.get_logger('predict')
+
+    # build model architecture
+    model = config.init_obj('arch', module_arch)
+
+    logger.info('Loading checkpoint: {} ...'.format(config.resume))
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    checkpoint = load_checkpoint(config.resume, map_location=device)
+    state_dict = checkpoint['state_dict']
+    if config['n_gpu'] > 1:
+        model = torch.nn.DataParallel(model)
+    model.load_state_dict(state_dict)
+    model = model.to(device)
+    model.eval()
+
+    # setup dataset, skipping the files predicted by a previous run
+    writer = PredictionWriter(args.output, config['arch']['args']['emotions'])
+    paths = [path for path in list_inputs(args.inputs) if path not in writer.done]
+    logger.info('{} files to predict, {} already done.'.format(len(paths), len(writer.done)))
+
+    transforms = config.init_obj('transforms', module_transforms)
+    transforms, batch_transforms = module_transforms.split_transforms(transforms)
+    if batch_transforms is not None:
+        batch_transforms = batch_transforms.to(device)
+    dataset = module_data.AudioFiles(paths, transforms=transforms, skip_errors=True)
+
+    collate_fn = pad_collate if getattr(transforms, 'variable_length', False) else default_collate
+    # worker-only options are rejected by torch when loading in the main process
+    worker_kwargs = {'prefetch_factor': 4} if args.workers > 0 else {}
+    data_loader = TorchDataLoader(
+        dataset,
+        batch_size=args.batch_size,
+        shuffle=False,
+        num_workers=args.workers,
+        collate_fn=partial(collate_skipping_failed, collate_fn=collate_fn),
+        worker_init_fn=_init_worker,
+        **worker_kwargs
+    )
+
+    with torch.inference_mode():
+        for batch, failed in tqdm(data_loader):
+            for idx in failed:
+                writer.write(paths[idx], error='decoding failed')
+
+            if batch is not None:
+                data, indices, lengths = unpack_batch(batch, device)
+                if batch_transforms is not None:
+                    data = batch_transforms(data)
+                probabilities = torch.exp(model(data, lengths)).cpu()
+                for idx, p in zip(indices.tolist(), probabilities):
+                    writer.write(paths[idx], p)
+            writer.flush()
+
+    writer.close()
+    logger.info('Predictions saved to {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description='PyTorch Template')
+    args.add_argument('inputs', nargs='+', type=str,
+                      help='audio files, directories, glob patterns or manifests (.txt, .csv, .jsonl)')
+    args.add_argument('-c', '--config', default=None, type=str,
+                      help='config file path (default: None)')
+    args.add_argument('-r', '--resume', default=None, type=str,
+                      help='path to checkpoint (default: None)')
+    args.add_argument('-d', '--device', default=None, type=str,
+                      help='indices of GPUs to enable (default: all)')
+    args.add_argument('-o', '--output', default='predictions.jsonl', type=str,
+                      help='output file, .jsonl or .csv (default: predictions.jsonl)')
+    args.add_argument('--bs', '--batch_size', dest='batch_size', default=256, type=int,
+                      help='number of clips per batch (default: 256)')
+    args.add_argument('--workers', default=os.cpu_count(), type=int,
+                      help='number of decoding processes (default: number of CPUs)')
+
+    config = ConfigParser.from_args(args)
+    main(config, args.parse_args())
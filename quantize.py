@@ -0,0 +1,112 @@
+import io
+import copy
+import time
+import argparse
+from itertools import islice
+from pathlib import Path
+import torch
+import datasets.transforms as module_transforms
+import datasets.datasets as module_data
+import model.loss as module_loss
+import model.metric as module_metric
+import model.model as module_arch
+import model.quantization as module_quantization
+from data_loader import DataLoader, unpack_batch
+from parse_config import ConfigParser
+from utils import load_checkpoint
+from test import setup_data_loader, evaluate
+
+
+def calibration_batches(config, n_batches):
+    """
+    Yields (data, lengths) of the first batches of the training loader
+    """
+    transforms = config.init_obj('transforms', module_transforms)
+    transforms, batch_transforms = module_transforms.split_transforms(transforms)
+    dataset = config.init_obj('dataset', module_data, transforms=transforms)
+    data_loader = DataLoader(dataset=dataset, **config['data_loader'])
+    for batch in islice(data_loader, n_batches):
+        data, _, lengths = unpack_batch(batch, 'cpu')
+        if batch_transforms is not None:
+            data = batch_transforms(data)
+        yield data, lengths
+
+
+def model_size(model):
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+def latency(model, input_shape, batch_size, repeats=10):
+    data = torch.randn(batch_size, *input_shape)
+    with torch.no_grad():
+        model(data)  # warm-up
+        start = time.perf_counter()
+        for _ in range(repeats):
+            model(data)
+    return (time.perf_counter() - start) / repeats
+
+
+def main(config, args):
+    logger = config.get_logger('quantize')
+
+    # build model architecture
+    model = config.init_obj('arch', module_arch)
+
+    logger.info('Loading checkpoint: {} ...'.format(config.resume))
+    checkpoint = load_checkpoint(config.resume)
+    model.load_state_dict(checkpoint['state_dict'])
+    model.eval()
+
+    logger.info('Calibrating on {} training batches ...'.format(args.calibration_batches))
+    quantized = module_quantization.quantize(copy.deepcopy(model),
+                                             calibration_batches(config, args.calibration_batches),
+                                             backend=args.backend)
+
+    output = Path(args.output) if args.output is not None else \
+        Path(config.resume).with_name(Path(config.resume).stem + '-int8.pth')
+    state = dict(checkpoint, state_dict=quantized.state_dict(), optimizer=None, quantized=True,
+                 activation_qparams=module_quantization.activation_qparams(quantized), backend=args.backend)
+    torch.save(state, str(output))
+    logger.info('Saving quantized checkpoint: {} ...'.format(output))
+
+    # compare the two models on the test split
+    data_loader, batch_transforms = setup_data_loader(config)
+    loss_fn = getattr(module_loss, config['loss'])
+    metric_fns = [getattr(module_metric, met) for met in config['metrics']]
+    cpu = torch.device('cpu')
+    logs = {
+        'fp32': evaluate(model, data_loader, loss_fn, metric_fns, cpu, batch_transforms)[0],
+        'int8': evaluate(quantized, data_loader, loss_fn, metric_fns, cpu, batch_transforms)[0]
+    }
+
+    input_shape = next(iter(calibration_batches(config, 1)))[0].shape[1:]
+    for name, m in [('fp32', model), ('int8', quantized)]:
+        logs[name]['size (MB)'] = model_size(m) / 2 ** 20
+        for batch_size in [1, 64]:
+            logs[name]['latency bs={} (ms)'.format(batch_size)] = 1000 * latency(m, input_shape, batch_size)
+
+    logger.info('    {:25s} {:>12s} {:>12s} {:>12s}'.format('', 'fp32', 'int8', 'delta'))
+    for key in logs['fp32']:
+        fp32, int8 = logs['fp32'][key], logs['int8'][key]
+        logger.info('    {:25s} {:>12.4f} {:>12.4f} {:>+12.4f}'.format(key, fp32, int8, int8 - fp32))
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description='PyTorch Template')
+    args.add_argument('-c', '--config', default=None, type=str,
+                      help='config file path (default: None)')
+    args.add_argument('-r', '--resume', default=None, type=str,
+                      help='path to the fp32 checkpoint (default: None)')
+    args.add_argument('-d', '--device', default=None, type=str,
+                      help='indices of GPUs to enable (default: all)')
+    args.add_argument('-o', '--output', default=None, type=str,
+                      help='quantized checkpoint path (default: <checkpoint>-int8.pth)')
+    args.add_argument('--calibration_batches', default=10, type=int,
+                      help='number of training batches used for calibration (default: 10)')
+    args.add_argument('--backend', default='x86', type=str,
+                      help='quantized engine, x86, fbgemm or qnnpack (default: x86)')
+
+    config = ConfigParser.from_args(args)
+    main(config, args.parse_args())
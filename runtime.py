@@ -0,0 +1,120 @@
+"""
+Minimal runtime for the models saved by export.py, depending only on numpy and either
+torch (TorchScript) or onnxruntime (ONNX), without importing the training code.
+
+    from runtime import EmotionRecognizer
+    recognizer = EmotionRecognizer('saved/models/EMODB/<timestamp>/model_best.pt')
+    probabilities = recognizer.predict([waveform_1, waveform_2])
+
+It can also score wav files from the command line, starting in a fraction of the time of predict.py:
+    python runtime.py saved/models/EMODB/<timestamp>/model_best.onnx clip_1.wav clip_2.wav > predictions.jsonl
+"""
+import sys
+import json
+import wave
+import argparse
+from pathlib import Path
+import numpy as np
+
+
+class EmotionRecognizer:
+    """
+    Loads an exported model (.pt or .onnx) and its metadata file
+
+    :param path: Path of the exported model.
+    :param num_threads: Number of intra-op threads, default is decided by the backend.
+    """
+    def __init__(self, path, num_threads=None):
+        self.path = Path(path)
+        with self.path.with_suffix('.json').open('rt') as handle:
+            metadata = json.load(handle)
+        self.sample_rate = metadata['sample_rate']
+        self.n_samples = metadata['n_samples']
+        self.emotions = metadata['emotions']
+
+        if self.path.suffix == '.onnx':
+            import onnxruntime
+            options = onnxruntime.SessionOptions()
+            if num_threads is not None:
+                options.intra_op_num_threads = num_threads
+            self.session = onnxruntime.InferenceSession(str(self.path), options,
+                                                        providers=['CPUExecutionProvider'])
+            self._run = self._run_onnx
+        else:
+            import torch
+            if num_threads is not None:
+                torch.set_num_threads(num_threads)
+            self.module = torch.jit.load(str(self.path), map_location='cpu')
+            self._run = self._run_torchscript
+
+    def _run_onnx(self, batch):
+        return self.session.run(None, {'waveforms': batch})[0]
+
+    def _run_torchscript(self, batch):
+        import torch
+        with torch.inference_mode():
+            return self.module(torch.from_numpy(batch)).numpy()
+
+    def prepare(self, waveforms):
+        """
+        Cuts or zero-pads mono waveforms, sampled at `sample_rate`, to the model input length
+
+        :return: float32 array of shape (batch, n_samples)
+        """
+        batch = np.zeros((len(waveforms), self.n_samples), dtype=np.float32)
+        for i, waveform in enumerate(waveforms):
+            waveform = np.asarray(waveform, dtype=np.float32)[:self.n_samples]
+            batch[i, :len(waveform)] = waveform
+        return batch
+
+    def predict(self, waveforms):
+        """
+        :param waveforms: Sequence of mono waveforms sampled at `sample_rate`, or an array prepared with `prepare`.
+        :return: Array of shape (batch, emotions) of class probabilities.
+        """
+        if not (isinstance(waveforms, np.ndarray) and waveforms.ndim == 2 and waveforms.shape[1] == self.n_samples):
+            waveforms = self.prepare(waveforms)
+        return self._run(np.ascontiguousarray(waveforms, dtype=np.float32))
+
+
+def read_wav(path):
+    """
+    Reads a 16-bit PCM wav file as a mono waveform in [-1, 1], like torchaudio.load followed by a channel mean
+
+    :return: Tuple (waveform, sample_rate)
+    """
+    try:
+        with wave.open(str(path), 'rb') as handle:
+            if handle.getsampwidth() != 2:
+                raise wave.Error('sample width of {} bytes'.format(handle.getsampwidth()))
+            channels, sample_rate = handle.getnchannels(), handle.getframerate()
+            frames = np.frombuffer(handle.readframes(handle.getnframes()), dtype='<i2')
+    except wave.Error as error:
+        raise ValueError('{}: only 16-bit PCM wav files are supported, use predict.py ({}).'.format(path, error))
+    waveform = frames.reshape(-1, channels).astype(np.float32).mean(1) / 32768
+    return waveform, sample_rate
+
+
+def main(args):
+    recognizer = EmotionRecognizer(args.model, num_threads=args.threads)
+    for start in range(0, len(args.files), args.batch_size):
+        paths = args.files[start:start + args.batch_size]
+        waveforms = []
+        for path in paths:
+            waveform, sample_rate = read_wav(path)
+            if sample_rate != recognizer.sample_rate:
+                raise ValueError('{}: sampled at {} Hz instead of {} Hz, use predict.py to resample it.'.format(
+                    path, sample_rate, recognizer.sample_rate))
+            waveforms.append(waveform)
+        for path, probabilities in zip(paths, recognizer.predict(waveforms)):
+            sys.stdout.write(json.dumps({'path': path, 'prediction': int(probabilities.argmax()),
+                                         'probabilities': probabilities.tolist()}) + '\n')
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description='Scores wav files with an exported model')
+    args.add_argument('model', type=str, help='exported model path (.onnx or .pt)')
+    args.add_argument('files', type=str, nargs='+', help='16-bit PCM wav files sampled at the model sample rate')
+    args.add_argument('--batch_size', default=32, type=int)
+    args.add_argument('--threads', default=None, type=int, help='intra-op threads (default: backend default)')
+    main(args.parse_args())
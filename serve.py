@@ -0,0 +1,257 @@
+import io
+import os
+import json
+import time
+import asyncio
+import argparse
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import torch
+import torchaudio
+from torch.utils.data.dataloader import default_collate
+import datasets.transforms as module_transforms
+import model.model as module_arch
+from data_loader import pad_collate
+from parse_config import ConfigParser
+from utils import load_checkpoint
+
+
+class MicroBatcher:
+    """
+    Merges concurrent requests into batches, flushed when max_batch_size requests are queued or when the oldest
+    queued request waited max_wait_ms
+    """
+    def __init__(self, predict_batch, max_batch_size, max_wait_ms, executor):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.executor = executor
+        self.queue = None
+        self.batch_sizes = collections.Counter()
+
+    def start(self):
+        """
+        Creates the queue and starts batching, from within the running event loop: before Python 3.10, a queue
+        created outside of it is bound to the default loop instead
+        """
+        self.queue = asyncio.Queue()
+        return asyncio.create_task(self.run())
+
+    async def submit(self, features):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((features, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # requests cancelled while queued, e.g. by a client disconnecting, are dropped
+            batch = [(features, future) for features, future in batch if not future.done()]
+            if not batch:
+                continue
+            self.batch_sizes[len(batch)] += 1
+            features, futures = zip(*batch)
+            try:
+                results = await loop.run_in_executor(self.executor, self.predict_batch, list(features))
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for future, result in zip(futures, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+class InferenceServer:
+    """
+    Minimal HTTP/1.1 server answering emotion predictions
+
+    POST /predict with an audio file as body returns its prediction and class probabilities,
+    GET /metrics returns latency percentiles and the batch size histogram. Bodies larger than max_body_bytes are
+    refused without being read.
+    """
+    def __init__(self, model, transforms, device, max_batch_size=32, max_wait_ms=10, feature_threads=None,
+                 max_body_bytes=16 * 2 ** 20):
+        self.model = model
+        self.max_body_bytes = max_body_bytes
+        self.device = device
+        self.transforms, self.batch_transforms = module_transforms.split_transforms(transforms)
+        if self.batch_transforms is not None:
+            self.batch_transforms = self.batch_transforms.to(device)
+        self.collate_fn = pad_collate if getattr(self.transforms, 'variable_length', False) else default_collate
+
+        self.feature_executor = ThreadPoolExecutor(feature_threads)
+        # a single thread runs the model, one batch at a time
+        self.model_executor = ThreadPoolExecutor(1)
+        self.batcher = MicroBatcher(self.predict_batch, max_batch_size, max_wait_ms, self.model_executor)
+
+        self.latencies = collections.deque(maxlen=10000)
+        self.n_requests = 0
+        self.n_errors = 0
+
+    def featurize(self, body):
+        data, sample_rate = torchaudio.load(io.BytesIO(body))
+        data = torch.mean(data, 0)
+        if self.transforms is not None:
+            data = self.transforms(data, sample_rate)
+        return torch.unsqueeze(data, 0)
+
+    def predict_batch(self, features):
+        batch = self.collate_fn([(x, 0) for x in features])
+        data, lengths = batch[0].to(self.device), None
+        if len(batch) == 3:
+            lengths = batch[1].to(self.device)
+        with torch.inference_mode():
+            if self.batch_transforms is not None:
+                data = self.batch_transforms(data)
+            return torch.exp(self.model(data, lengths)).cpu().tolist()
+
+    async def predict(self, body):
+        loop = asyncio.get_running_loop()
+        try:
+            features = await loop.run_in_executor(self.feature_executor, self.featurize, body)
+        except RuntimeError:
+            return 400, {'error': 'audio could not be decoded'}
+        probabilities = await self.batcher.submit(features)
+        return 200, {'prediction': int(np.argmax(probabilities)), 'probabilities': probabilities}
+
+    def metrics(self):
+        latencies = np.array(self.latencies) * 1000
+        return {
+            'requests': self.n_requests,
+            'errors': self.n_errors,
+            'latency_ms': {
+                'p50': float(np.percentile(latencies, 50)) if len(latencies) else None,
+                'p99': float(np.percentile(latencies, 99)) if len(latencies) else None
+            },
+            'batch_size_histogram': {str(k): v for k, v in sorted(self.batcher.batch_sizes.items())}
+        }
+
+    async def route(self, method, target, body):
+        if method == 'POST' and target == '/predict':
+            start = time.perf_counter()
+            status, payload = await self.predict(body)
+            self.n_requests += 1
+            if status == 200:
+                self.latencies.append(time.perf_counter() - start)
+            else:
+                self.n_errors += 1
+            return status, payload
+        elif method == 'GET' and target == '/metrics':
+            return 200, self.metrics()
+        elif method == 'GET' and target == '/health':
+            return 200, {'status': 'ok'}
+        return 404, {'error': 'not found'}
+
+    async def handle(self, reader, writer):
+        reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large',
+                   500: 'Internal Server Error'}
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, value = line.decode('latin-1').split(':', 1)
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                if length > self.max_body_bytes:
+                    # the body is left unread, so the connection cannot be reused
+                    status, payload = 413, {'error': 'body larger than {} bytes'.format(self.max_body_bytes)}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length)
+                    try:
+                        status, payload = await self.route(method, target, body)
+                    except Exception as e:
+                        status, payload = 500, {'error': str(e)}
+
+                content = json.dumps(payload).encode()
+                writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n'
+                             'Connection: {}\r\n\r\n'.format(status, reasons[status], len(content),
+                                                             'keep-alive' if keep_alive else 'close').encode())
+                writer.write(content)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        batcher = self.batcher.start()
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+        batcher.cancel()
+
+
+def main(config, args):
+    logger = config.get_logger('serve')
+
+    # build model architecture
+    model = config.init_obj('arch', module_arch)
+
+    logger.info('Loading checkpoint: {} ...'.format(config.resume))
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    checkpoint = load_checkpoint(config.resume, map_location=device)
+    state_dict = checkpoint['state_dict']
+    if config['n_gpu'] > 1:
+        model = torch.nn.DataParallel(model)
+    model.load_state_dict(state_dict)
+    model = model.to(device)
+    model.eval()
+
+    transforms = config.init_obj('transforms', module_transforms)
+    server = InferenceServer(model, transforms, device,
+                             max_batch_size=args.max_batch_size,
+                             max_wait_ms=args.max_wait_ms,
+                             feature_threads=args.feature_threads,
+                             max_body_bytes=int(args.max_body_mb * 2 ** 20))
+    logger.info('Serving on http://{}:{}'.format(args.host, args.port))
+    asyncio.run(server.serve(args.host, args.port))
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description='PyTorch Template')
+    args.add_argument('-c', '--config', default=None, type=str,
+                      help='config file path (default: None)')
+    args.add_argument('-r', '--resume', default=None, type=str,
+                      help='path to checkpoint (default: None)')
+    args.add_argument('-d', '--device', default=None, type=str,
+                      help='indices of GPUs to enable (default: all)')
+    args.add_argument('--host', default='127.0.0.1', type=str,
+                      help='address to listen on (default: 127.0.0.1)')
+    args.add_argument('--port', default=8000, type=int,
+                      help='port to listen on (default: 8000)')
+    args.add_argument('--max_batch_size', default=32, type=int,
+                      help='maximum number of requests per batch (default: 32)')
+    args.add_argument('--max_wait_ms', default=10.0, type=float,
+                      help='maximum time a request waits for its batch to fill (default: 10)')
+    args.add_argument('--feature_threads', default=os.cpu_count(), type=int,
+                      help='number of feature extraction threads (default: number of CPUs)')
+    args.add_argument('--max_body_mb', default=16.0, type=float,
+                      help='largest accepted request body, in megabytes (default: 16)')
+
+    config = ConfigParser.from_args(args)
+    main(config, args.parse_args())
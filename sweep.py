@@ -0,0 +1,255 @@
+import os
+import math
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+import datasets.transforms as module_transforms
+import datasets.datasets as module_data
+import datasets.audio_store as module_audio_store
+import datasets.cache as module_cache
+from parse_config import ConfigParser
+from train import SEED, build_trainer
+from utils import read_json, write_json
+
+# config blocks which, when swept, give every trial a dataset of its own
+DATA_KEYS = ['transforms', 'dataset', 'audio_store', 'feature_cache']
+
+
+def sample_space(space, n_trials, seed=0):
+    """
+    Draws the values of the trials from a search space mapping config key paths (e.g. 'optimizer;args;lr') to
+    distributions: {"type": "uniform"|"loguniform", "low": a, "high": b}, {"type": "int", "low": a, "high": b}
+    (bounds included) or {"type": "choice", "values": [...]}
+
+    :return: List of one dict of key path to value for each trial.
+    """
+    rng = np.random.default_rng(seed)
+    trials = []
+    for _ in range(n_trials):
+        params = {}
+        for key, spec in space.items():
+            if spec['type'] == 'uniform':
+                value = float(rng.uniform(spec['low'], spec['high']))
+            elif spec['type'] == 'loguniform':
+                value = float(math.exp(rng.uniform(math.log(spec['low']), math.log(spec['high']))))
+            elif spec['type'] == 'int':
+                value = int(rng.integers(spec['low'], spec['high'] + 1))
+            elif spec['type'] == 'choice':
+                value = spec['values'][int(rng.integers(len(spec['values'])))]
+            else:
+                raise ValueError("Unknown distribution '{}' of '{}'.".format(spec['type'], key))
+            params[key] = value
+        trials.append(params)
+    return trials
+
+
+def rung_epochs(min_epochs, eta, max_epochs):
+    """
+    Epochs at which trials are compared: min_epochs, min_epochs * eta, min_epochs * eta^2, ... below max_epochs
+    """
+    rungs = []
+    epoch = min_epochs
+    while epoch < max_epochs:
+        rungs.append(epoch)
+        epoch *= eta
+    return rungs
+
+
+class ASHAPruner:
+    """
+    Asynchronous successive halving: a trial reaching a rung goes on only if its score is among the best 1 / eta
+    of the scores recorded at that rung so far, by any trial. Trials never wait for each other, so the first ones
+    to reach a rung are always promoted.
+
+    :param rungs: Shared dict of rung epoch to the scores recorded at it.
+    :param lock: Shared lock guarding the rungs.
+    :param epochs: Epochs of the rungs.
+    :param eta: Reduction factor, 1 / eta of the trials are promoted at every rung.
+    :param metric: Monitored metric, in the epoch log.
+    :param mode: 'min' or 'max', whether lower or higher scores are better.
+    """
+    def __init__(self, rungs, lock, epochs, eta, metric, mode):
+        self.rungs = rungs
+        self.lock = lock
+        self.epochs = set(epochs)
+        self.eta = eta
+        self.metric = metric
+        self.mode = mode
+        self.pruned_at = None
+
+    def __call__(self, epoch, log):
+        if epoch not in self.epochs or self.metric not in log:
+            return False
+        score = log[self.metric] if self.mode == 'min' else -log[self.metric]
+        # diverged trials rank last
+        score = math.inf if math.isnan(score) else score
+        with self.lock:
+            # lists in a shared dict are copies, the new one replaces the old one
+            scores = self.rungs.get(epoch, []) + [score]
+            self.rungs[epoch] = scores
+        n_promoted = len(scores) // self.eta
+        if n_promoted == 0:
+            return False
+        if score > sorted(scores)[n_promoted - 1]:
+            self.pruned_at = epoch
+            return True
+        return False
+
+
+def setup_dataset(config):
+    """
+    Builds the dataset of the config once, decoded and feature-cached if configured, to be shared by every trial
+
+    :return: Tuple (dataset, batch_transforms)
+    """
+    transforms = config.init_obj('transforms', module_transforms)
+    transforms, batch_transforms = module_transforms.split_transforms(transforms)
+    dataset = config.init_obj('dataset', module_data, transforms=transforms)
+    if config.get('audio_store') is not None:
+        dataset = config.init_obj('audio_store', module_audio_store, dataset)
+    if config.get('feature_cache') is not None:
+        dataset = config.init_obj('feature_cache', module_cache, dataset, config['transforms'])
+    return dataset, batch_transforms
+
+
+def _init_worker(threads):
+    torch.set_num_threads(threads)
+
+
+def run_trial(config, run_id, trial, params, pruner, dataset=None, batch_transforms=None):
+    """
+    Trains the config with the values of the trial, until it ends or is pruned
+
+    :return: Dict with the values, the best score, the number of epochs and the best checkpoint of the trial.
+    """
+    # every trial gets the same initialization and validation split, only its values differ
+    torch.manual_seed(SEED)
+    np.random.seed(SEED)
+    config = ConfigParser(config, modification=params, run_id=run_id)
+    logger = config.get_logger('sweep')
+    logger.info('Trial {}: {}'.format(trial, params))
+
+    trainer = build_trainer(config, dataset=dataset, batch_transforms=batch_transforms)
+    epochs = []
+    trainer.epoch_callbacks.append(lambda epoch, log: epochs.append(epoch))
+    trainer.epoch_callbacks.append(pruner)
+    trainer.train()
+
+    best_path = config.save_dir / 'model_best.pth'
+    # a monitored metric which never improved, e.g. a NaN loss after diverging, leaves no score
+    score = float(trainer.mnt_best) if math.isfinite(trainer.mnt_best) else None
+    if score is None:
+        status = 'failed'
+    elif pruner.pruned_at is not None:
+        status = 'pruned'
+    elif epochs and epochs[-1] < trainer.epochs:
+        status = 'early stopped'
+    else:
+        status = 'completed'
+    return {
+        'trial': trial,
+        'params': params,
+        'score': score,
+        'epochs': epochs[-1] if epochs else 0,
+        'status': status,
+        'checkpoint': str(best_path) if best_path.is_file() else None
+    }
+
+
+def rank_results(results, mode):
+    """
+    Sorts the results of the trials, best score first, failed trials without a score last
+    """
+    def key(result):
+        if result['score'] is None:
+            return 1, 0.0
+        return 0, result['score'] if mode == 'min' else -result['score']
+    return sorted(results, key=key)
+
+
+def _format_score(score):
+    return '{:.6f}'.format(score) if score is not None else '-'
+
+
+def main(config, args):
+    logger = config.get_logger('sweep')
+    monitor = config['trainer'].get('monitor', 'off')
+    assert monitor != 'off', 'the sweep needs a monitored metric, set trainer;monitor in the config.'
+    mode, metric = monitor.split()
+
+    space = read_json(args.space)
+    trials = sample_space(space, args.trials, args.seed)
+    rungs = rung_epochs(args.min_epochs, args.eta, config['trainer']['epochs'])
+    jobs = min(args.jobs if args.jobs is not None else os.cpu_count(), len(trials))
+    threads = args.threads if args.threads is not None else max(1, os.cpu_count() // jobs)
+    logger.info('{} trials, {} at a time with {} threads each, compared on {} at epochs {}'.format(
+        len(trials), jobs, threads, metric, rungs))
+
+    # the data is loaded once for all the trials, unless they sweep over it
+    dataset, batch_transforms = None, None
+    if not any(key.split(';')[0] in DATA_KEYS for key in space):
+        dataset, batch_transforms = setup_dataset(config)
+
+    # every trial is a run of its own, in a subdirectory of this one
+    run_id = config.save_dir.name
+    results = []
+    context = mp.get_context('spawn')
+    with context.Manager() as manager:
+        shared_rungs, lock = manager.dict(), manager.Lock()
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=context, initializer=_init_worker,
+                                 initargs=(threads,)) as executor:
+            futures = []
+            for trial, params in enumerate(trials):
+                pruner = ASHAPruner(shared_rungs, lock, rungs, args.eta, metric, mode)
+                futures.append(executor.submit(run_trial, config.config, os.path.join(run_id, 'trial{}'.format(trial)),
+                                               trial, params, pruner, dataset, batch_transforms))
+            for future in as_completed(futures):
+                result = future.result()
+                logger.info('Trial {} {} after {} epochs: {} {}'.format(
+                    result['trial'], result['status'], result['epochs'], metric, _format_score(result['score'])))
+                results.append(result)
+
+    results = rank_results(results, mode)
+    leaderboard = {'metric': metric, 'mode': mode, 'rungs': rungs, 'eta': args.eta, 'trials': results}
+    write_json(leaderboard, config.save_dir / 'leaderboard.json')
+
+    epochs_run = sum(result['epochs'] for result in results)
+    logger.info('{} epochs trained out of {} without pruning'.format(
+        epochs_run, len(results) * config['trainer']['epochs']))
+    logger.info('    {:>5s} {:>12s} {:>6s} {:14s} {}'.format('trial', metric, 'epochs', 'status', 'values'))
+    for result in results:
+        logger.info('    {:>5d} {:>12s} {:>6d} {:14s} {}'.format(
+            result['trial'], _format_score(result['score']), result['epochs'], result['status'],
+            ', '.join('{}={}'.format(key.split(';')[-1], '{:.4g}'.format(value) if isinstance(value, float) else value)
+                      for key, value in result['params'].items())))
+    logger.info('Best checkpoint: {}'.format(results[0]['checkpoint']))
+    logger.info('Leaderboard saved to {}'.format(config.save_dir / 'leaderboard.json'))
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description='PyTorch Template')
+    args.add_argument('-c', '--config', default=None, type=str,
+                      help='config file path (default: None)')
+    args.add_argument('-r', '--resume', default=None, type=str,
+                      help='path to a checkpoint whose config is used, trials are trained from scratch (default: None)')
+    args.add_argument('-d', '--device', default=None, type=str,
+                      help='indices of GPUs to enable (default: all)')
+    args.add_argument('-s', '--space', default='sweep_space.json', type=str,
+                      help='search space file path (default: sweep_space.json)')
+    args.add_argument('--trials', default=16, type=int,
+                      help='number of sampled trials (default: 16)')
+    args.add_argument('--min_epochs', default=2, type=int,
+                      help='epochs of the first rung, where trials are first compared (default: 2)')
+    args.add_argument('--eta', default=3, type=int,
+                      help='reduction factor, 1/eta of the trials are promoted at every rung (default: 3)')
+    args.add_argument('--seed', default=0, type=int,
+                      help='seed of the sampling of the trials (default: 0)')
+    args.add_argument('--jobs', default=None, type=int,
+                      help='number of trials run at the same time (default: number of CPUs)')
+    args.add_argument('--threads', default=None, type=int,
+                      help='torch threads of every trial (default: number of CPUs / jobs)')
+
+    config = ConfigParser.from_args(args)
+    main(config, args.parse_args())
@@ -1,75 +1,249 @@
+import os
+import re
+import glob
+import json
 import argparse
+from pathlib import Path
 import torch
 from tqdm import tqdm
 import datasets.transforms as module_transforms
 import datasets.datasets as module_data
+import datasets.audio_store as module_audio_store
+import datasets.cache as module_cache
 import model.loss as module_loss
 import model.metric as module_metric
 import model.model as module_arch
-from data_loader import DataLoader
+import model.quantization as module_quantization
+from data_loader import DataLoader, unpack_batch
 from parse_config import ConfigParser
+from utils import MetricTracker, StepProfiler, read_json, write_json, load_checkpoint
 
+# config blocks that checkpoints must share to be evaluated on the same batches
+SHARED_KEYS = ['dataset', 'transforms', 'audio_store', 'feature_cache', 'loss', 'metrics']
 
-def main(config):
-    logger = config.get_logger('test')
 
-    # setup dataset
+def setup_data_loader(config, batch_size=16):
+    """
+    Builds the loader of the test split and the transforms to be run on its batches, if any
+    """
     transforms = config.init_obj('transforms', module_transforms)
+    transforms, batch_transforms = module_transforms.split_transforms(transforms)
+    # the test split, with the other arguments of the dataset, e.g. its manifest
+    dataset_args = {key: value for key, value in config['dataset']['args'].items()
+                    if key not in ['root_dir', 'training']}
     dataset = getattr(module_data, config['dataset']['type'])(
         config['dataset']['args']['root_dir'],
         transforms=transforms,
-        training=False
+        training=False,
+        **dataset_args
     )
+    if config.get('audio_store') is not None:
+        dataset = config.init_obj('audio_store', module_audio_store, dataset)
+    if config.get('feature_cache') is not None:
+        dataset = config.init_obj('feature_cache', module_cache, dataset, config['transforms'])
+    assert batch_transforms is None or not config['data_loader'].get('bucketing', False), \
+        'bucketing needs per-clip transforms with "variable_length": true, batch transforms pad every clip.'
 
-    # setup data_loader instances
     data_loader = DataLoader(
         dataset=dataset,
-        batch_size=16,
+        batch_size=batch_size,
         shuffle=False,
-        validation_split=0.0
+        validation_split=0.0,
+        bucketing=config['data_loader'].get('bucketing', False)
     )
+    return data_loader, batch_transforms
+
+
+def evaluate(model, data_loader, loss_fn, metric_fns, device, batch_transforms=None, profiler=None):
+    """
+    Average loss and metrics of the model over the data loader, along with per-class precision, recall and F1
+
+    :param profiler: Optional StepProfiler recording the time spent in every stage of the loop.
+    :return: Tuple (log, class_log)
+    """
+    return evaluate_models([model], data_loader, loss_fn, metric_fns, device, batch_transforms, profiler)[0]
+
+
+def evaluate_models(models, data_loader, loss_fn, metric_fns, device, batch_transforms=None, profiler=None):
+    """
+    Evaluates several models in a single pass over the data loader, every batch being loaded and transformed
+    once and then fed to each model in turn
+
+    :return: List of (log, class_log) tuples, one for each model.
+    """
+    if batch_transforms is not None:
+        batch_transforms = batch_transforms.to(device)
+    if profiler is None:
+        profiler = StepProfiler(device)
+
+    trackers = [None] * len(models)
+    profiler.start()
+    with torch.no_grad():
+        for i, batch in enumerate(tqdm(data_loader)):
+            profiler.mark('data')
+            data, target, lengths = unpack_batch(batch, device)
+            profiler.mark('to_device')
+            if batch_transforms is not None:
+                data = batch_transforms(data)
+                profiler.mark('transform')
+            batch_size = data.shape[0]
+
+            for j, model in enumerate(models):
+                output = model(data, lengths)
+                profiler.mark('forward')
 
-    # build model architecture
+                if trackers[j] is None:
+                    trackers[j] = MetricTracker('loss', *[met.__name__ for met in metric_fns],
+                                                n_classes=output.shape[1], device=output.device)
+                metrics = trackers[j]
+
+                # computing loss, metrics on test set
+                loss = loss_fn(output, target)
+                profiler.mark('loss')
+                metrics.update('loss', loss, n=batch_size)
+                for met in metric_fns:
+                    metrics.update(met.__name__, met(output, target), n=batch_size)
+                metrics.update_confusion(output, target)
+                profiler.mark('metrics')
+            profiler.step()
+    profiler.stop()
+
+    # the trackers are created with the first batch, which gives the number of classes
+    if trackers[0] is None:
+        raise ValueError('The test data loader is empty, there is nothing to evaluate.')
+    return [(metrics.result(), metrics.class_result()) for metrics in trackers]
+
+
+def log_class_result(logger, class_log):
+    logger.info('    {:>5s} {:>10s} {:>10s} {:>10s}'.format('class', 'precision', 'recall', 'f1'))
+    for i, scores in enumerate(zip(class_log['precision'], class_log['recall'], class_log['f1'])):
+        logger.info('    {:>5d} {:>10.4f} {:>10.4f} {:>10.4f}'.format(i, *scores))
+
+
+def load_model(config, checkpoint_path, device):
+    """
+    Builds the model of the config and loads the weights of the checkpoint, quantized ones on CPU
+
+    :return: Tuple (model, device), ready for evaluation.
+    """
     model = config.init_obj('arch', module_arch)
-    logger.info(model)
+    checkpoint = load_checkpoint(checkpoint_path)
+    state_dict = checkpoint['state_dict']
+    if checkpoint.get('quantized', False):
+        # int8 kernels only run on CPU
+        model = module_quantization.load_quantized(model, checkpoint, checkpoint['backend'])
+        device = torch.device('cpu')
+    else:
+        if config['n_gpu'] > 1:
+            model = torch.nn.DataParallel(model)
+        model.load_state_dict(state_dict)
+    model = model.to(device)
+    model.eval()
+    return model, device
+
+
+def main(config):
+    logger = config.get_logger('test')
+
+    # setup data_loader instances
+    data_loader, batch_transforms = setup_data_loader(config)
 
     # get function handles of loss and metrics
     loss_fn = getattr(module_loss, config['loss'])
     metric_fns = [getattr(module_metric, met) for met in config['metrics']]
 
     logger.info('Loading checkpoint: {} ...'.format(config.resume))
-    checkpoint = torch.load(config.resume)
-    state_dict = checkpoint['state_dict']
-    if config['n_gpu'] > 1:
-        model = torch.nn.DataParallel(model)
-    model.load_state_dict(state_dict)
-
-    # prepare model for testing
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    model = model.to(device)
-    model.eval()
+    model, device = load_model(config, config.resume, device)
+    logger.info(model)
 
-    total_loss = 0.0
-    total_metrics = torch.zeros(len(metric_fns))
+    profiler = StepProfiler(device)
+    log, class_log = evaluate(model, data_loader, loss_fn, metric_fns, device, batch_transforms, profiler)
+    logger.info(log)
+    log_class_result(logger, class_log)
+    logger.info('Time per step: {}'.format(profiler.summary()))
 
-    with torch.no_grad():
-        for i, (data, target) in enumerate(tqdm(data_loader)):
-            data, target = data.to(device), target.to(device)
-            output = model(data)
 
-            # computing loss, metrics on test set
-            loss = loss_fn(output, target)
-            batch_size = data.shape[0]
-            total_loss += loss.item() * batch_size
-            for i, metric in enumerate(metric_fns):
-                total_metrics[i] += metric(output, target) * batch_size
-
-    n_samples = len(data_loader.sampler)
-    log = {'loss': total_loss / n_samples}
-    log.update({
-        met.__name__: total_metrics[i].item() / n_samples for i, met in enumerate(metric_fns)
-    })
-    logger.info(log)
+def _natural_key(path):
+    # checkpoint-epoch10 after checkpoint-epoch9
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', str(path))]
+
+
+def expand_checkpoints(patterns):
+    """
+    Paths of the checkpoints matching the given paths or glob patterns, in natural order and without duplicates
+    """
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern), key=_natural_key) if glob.has_magic(pattern) else [pattern]
+        assert matches, "No checkpoint matches '{}'.".format(pattern)
+        paths.extend(Path(match) for match in matches if Path(match) not in paths)
+    return paths
+
+
+def group_checkpoints(paths, config=None):
+    """
+    Groups the checkpoints whose configs share the data, transforms, loss and metrics, and whether they are
+    quantized (and then evaluated on CPU), so that the models of a group can be evaluated on the same batches
+
+    :param config: Config dict used for every checkpoint, instead of the config.json of its run.
+    :return: List of (config dict, checkpoint paths) tuples.
+    """
+    groups = {}
+    for path in paths:
+        checkpoint_config = config if config is not None else read_json(path.parent / 'config.json')
+        # the flag load_model goes by, memory-mapped so that the weights are not read
+        quantized = load_checkpoint(path, mmap=True).get('quantized', False)
+        bucketing = checkpoint_config['data_loader'].get('bucketing', False)
+        key = json.dumps([checkpoint_config.get(name) for name in SHARED_KEYS] + [bucketing, quantized],
+                         sort_keys=True)
+        groups.setdefault(key, (checkpoint_config, []))[1].append(path)
+    return list(groups.values())
+
+
+def main_multi(config, args):
+    """
+    Evaluates every checkpoint matching the patterns, loading and transforming the test data once per group of
+    checkpoints sharing the same data config, with at most `max_models` models loaded at a time
+    """
+    logger = config.get_logger('test')
+    paths = expand_checkpoints(args.checkpoints)
+    groups = group_checkpoints(paths, read_json(args.config) if args.config is not None else None)
+    logger.info('{} checkpoints in {} groups sharing their test data'.format(len(paths), len(groups)))
+
+    save_dir = config.save_dir
+    results = []
+    for i, (group_config, group_paths) in enumerate(groups):
+        # the first group is described by the config of the test run, the others get a run of their own
+        if i > 0:
+            config = ConfigParser(group_config, run_id=os.path.join(save_dir.name, 'group{}'.format(i)))
+        data_loader, batch_transforms = setup_data_loader(config)
+        loss_fn = getattr(module_loss, config['loss'])
+        metric_fns = [getattr(module_metric, met) for met in config['metrics']]
+
+        # one pass over the data for every `max_models` checkpoints, only those are in memory at once
+        for start in range(0, len(group_paths), args.max_models):
+            chunk = group_paths[start:start + args.max_models]
+            logger.info('Group {}: evaluating {}'.format(i, ', '.join(str(path) for path in chunk)))
+            device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+            models = []
+            for path in chunk:
+                model, device = load_model(config, path, device)
+                models.append(model)
+            for path, (log, class_log) in zip(chunk, evaluate_models(models, data_loader, loss_fn, metric_fns,
+                                                                      device, batch_transforms)):
+                results.append({'checkpoint': str(path), 'group': i, 'test': log, 'test_class': class_log})
+            del models
+
+    output = Path(args.output) if args.output is not None else save_dir / 'evaluation.json'
+    write_json(results, output)
+
+    keys = list(results[0]['test'])
+    logger.info('    {:60s} {}'.format('checkpoint', ' '.join('{:>12s}'.format(key) for key in keys)))
+    for result in results:
+        logger.info('    {:60s} {}'.format(result['checkpoint'][-60:], ' '.join(
+            '{:>12.4f}'.format(result['test'][key]) for key in keys)))
+    logger.info('Results saved to {}'.format(output))
 
 
 if __name__ == '__main__':
@@ -80,6 +254,22 @@ if __name__ == '__main__':
                       help='path to latest checkpoint (default: None)')
     args.add_argument('-d', '--device', default=None, type=str,
                       help='indices of GPUs to enable (default: all)')
+    args.add_argument('--checkpoints', default=None, type=str, nargs='+',
+                      help='checkpoint paths or glob patterns evaluated in a single pass over the test data, '
+                           'instead of --resume (default: None)')
+    args.add_argument('--max_models', default=4, type=int,
+                      help='largest number of models loaded at once with --checkpoints (default: 4)')
+    args.add_argument('-o', '--output', default=None, type=str,
+                      help='results file with --checkpoints (default: evaluation.json in the run directory)')
 
-    config = ConfigParser.from_args(args)
-    main(config)
+    parsed_args = args.parse_args()
+    if parsed_args.checkpoints is not None:
+        if parsed_args.device is not None:
+            os.environ['CUDA_VISIBLE_DEVICES'] = parsed_args.device
+        # the run is described by the config of the first checkpoint, unless one is given
+        first = expand_checkpoints(parsed_args.checkpoints)[0]
+        config_path = parsed_args.config if parsed_args.config is not None else first.parent / 'config.json'
+        main_multi(ConfigParser(read_json(config_path)), parsed_args)
+    else:
+        config = ConfigParser.from_args(args)
+        main(config)
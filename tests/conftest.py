@@ -0,0 +1,16 @@
+import os
+import sys
+import pytest
+
+# the tests import the modules of the repository root, as the scripts do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpora import make_emodb
+
+
+@pytest.fixture
+def emodb_dir(tmp_path):
+    """
+    Small synthetic EMO-DB corpus, with clips of different lengths
+    """
+    return str(make_emodb(tmp_path / 'emodb', n_clips=20, durations=(0.5, 1.5)))
@@ -0,0 +1,43 @@
+import os
+import pytest
+import torch
+import datasets.audio_store as module_audio_store
+from datasets.datasets import EMODB
+from datasets.audio_store import SharedAudioStore
+
+
+def test_store_matches_dataset(emodb_dir, tmp_path):
+    dataset = EMODB(emodb_dir, training=True)
+    store = SharedAudioStore(dataset, path=tmp_path / 'store', num_workers=1)
+    assert len(store) == len(dataset)
+    for idx in range(len(dataset)):
+        assert torch.equal(store[idx][0], dataset[idx][0])
+        assert store[idx][1] == dataset[idx][1]
+    assert store.get_speaker(0) == dataset.get_speaker(0)
+
+
+def test_stored_file_is_reused(emodb_dir, tmp_path, monkeypatch):
+    dataset = EMODB(emodb_dir, training=True)
+    SharedAudioStore(dataset, path=tmp_path / 'store', num_workers=1)
+
+    def fail(*args):
+        raise AssertionError('the clips were decoded again')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(module_audio_store, '_load_all', fail)
+        store = SharedAudioStore(dataset, path=tmp_path / 'store', num_workers=1)
+        assert torch.equal(store[0][0], dataset[0][0])
+
+    # a changed clip invalidates the file
+    os.utime(dataset.get_path(0), ns=(0, 0))
+    monkeypatch.setattr(module_audio_store, '_load_all', fail)
+    with pytest.raises(AssertionError):
+        SharedAudioStore(dataset, path=tmp_path / 'store', num_workers=1)
+
+
+def test_only_main_process_writes(emodb_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(module_audio_store, 'is_main_process', lambda: False)
+    dataset = EMODB(emodb_dir, training=True)
+    store = SharedAudioStore(dataset, path=tmp_path / 'store', num_workers=1)
+    assert not (tmp_path / 'store.npy').exists()
+    assert torch.equal(store[0][0], dataset[0][0])
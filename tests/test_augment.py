@@ -0,0 +1,61 @@
+import torch
+from datasets.transforms import BatchAugment
+
+
+def padded_batch():
+    # two clips of 10 and 40 frames, padded to 40 frames with silence
+    data = torch.randn(2, 1, 8, 40) * 10 - 30
+    data[0, ..., 10:] = -100.0
+    return data, torch.tensor([0, 1]), torch.tensor([10, 40])
+
+
+def test_time_masks_stay_within_clips():
+    torch.manual_seed(0)
+    augment = BatchAugment(time_masks=3, time_mask_width=30)
+    for _ in range(50):
+        data, target, lengths = padded_batch()
+        augmented, new_lengths, mix = augment(data, target, lengths)
+        assert torch.equal(new_lengths, lengths)
+        assert mix is None
+        # padding untouched, masks filled with the mean of the frames of the clip
+        assert (augmented[0, ..., 10:] == -100.0).all()
+        masked = augmented[0] != data[0]
+        if masked.any():
+            assert torch.allclose(augmented[0][masked], data[0, ..., :10].mean().expand(int(masked.sum())))
+
+
+def test_time_warp_keeps_padding():
+    torch.manual_seed(0)
+    augment = BatchAugment(time_warp=5)
+    for _ in range(50):
+        data, target, lengths = padded_batch()
+        augmented, _, _ = augment(data, target, lengths)
+        assert torch.allclose(augmented[0, ..., 10:], data[0, ..., 10:])
+        # the ends of the clips stay in place
+        assert torch.allclose(augmented[:, ..., 0], data[:, ..., 0], atol=1e-4)
+        assert torch.allclose(augmented[0, ..., 9], data[0, ..., 9], atol=1e-4)
+
+
+def test_noise_only_on_clip_frames():
+    torch.manual_seed(0)
+    data, target, lengths = padded_batch()
+    augmented, _, _ = BatchAugment(noise_p=1.0, noise_snr=(0, 0))(data, target, lengths)
+    assert torch.allclose(augmented[0, ..., 10:], data[0, ..., 10:], atol=1e-3)
+    assert (augmented[0, ..., :10] > data[0, ..., :10]).all()
+
+
+def test_mixup_takes_longest_length():
+    torch.manual_seed(0)
+    data, target, lengths = padded_batch()
+    augmented, new_lengths, mix = BatchAugment(mixup_alpha=1.0)(data, target, lengths)
+    mixed_target, weight = mix
+    # mixed up with itself or with the other clip
+    assert new_lengths.tolist() in ([10, 40], [40, 40])
+    assert (new_lengths == torch.maximum(lengths, lengths[mixed_target])).all()
+
+
+def test_without_lengths():
+    data, target, _ = padded_batch()
+    augmented, lengths, _ = BatchAugment(time_warp=5, freq_masks=2, time_masks=2, noise_p=0.5)(data, target)
+    assert augmented.shape == data.shape
+    assert lengths is None
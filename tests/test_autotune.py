@@ -0,0 +1,11 @@
+import torch
+from torch.utils.data import TensorDataset
+from data_loader.autotune import autotune_loader
+
+
+def test_autotune_returns_a_candidate():
+    dataset = TensorDataset(torch.zeros(64, 1, 8), torch.zeros(64, dtype=torch.long))
+    loader_args = {'batch_size': 4, 'shuffle': True, 'validation_split': 0.0}
+    best = autotune_loader(dataset, loader_args, n_batches=20, warmup=2, worker_counts=[0, 1],
+                           prefetch_factors=(2,))
+    assert best in [{'num_workers': 0}, {'num_workers': 1, 'persistent_workers': True, 'prefetch_factor': 2}]
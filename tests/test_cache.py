@@ -0,0 +1,53 @@
+import os
+import torch
+from datasets.datasets import EMODB
+from datasets.cache import FeatureCache
+from datasets.transforms import LogMelSpectrogram
+
+TRANSFORMS = {'type': 'LogMelSpectrogram',
+              'args': {'sample_rate': 16000, 'audio_length': 8, 'n_fft': 512, 'hop_length': 256,
+                       'variable_length': True}}
+
+
+def make_dataset(root_dir):
+    return EMODB(root_dir, transforms=LogMelSpectrogram(**TRANSFORMS['args']), training=True)
+
+
+def test_variable_length_clips(emodb_dir, tmp_path):
+    dataset = make_dataset(emodb_dir)
+    cache = FeatureCache(dataset, TRANSFORMS, tmp_path / 'cache', num_workers=1)
+
+    shapes = set()
+    for idx in range(len(dataset)):
+        data, label = cache[idx]
+        expected, expected_label = dataset[idx]
+        shapes.add(data.shape)
+        assert torch.equal(data, expected)
+        assert label == expected_label
+    assert len(shapes) > 1
+    assert cache.get_duration(0) == dataset.get_duration(0)
+    assert cache.get_speaker(0) == dataset.get_speaker(0)
+
+
+def test_changed_clips_are_recomputed(emodb_dir, tmp_path):
+    dataset = make_dataset(emodb_dir)
+    FeatureCache(dataset, TRANSFORMS, tmp_path / 'cache', num_workers=1)
+
+    # the first clip replaced by a longer one, the others are read from the cache
+    path = dataset.get_path(0)
+    with open(dataset.get_path(1), 'rb') as handle:
+        audio = handle.read()
+    with open(path, 'wb') as handle:
+        handle.write(audio)
+    os.utime(path, ns=(0, 0))
+
+    cache = FeatureCache(make_dataset(emodb_dir), TRANSFORMS, tmp_path / 'cache', num_workers=1)
+    for idx in range(len(dataset)):
+        assert torch.equal(cache[idx][0], dataset[idx][0])
+
+
+def test_key_includes_transforms_version(emodb_dir, tmp_path, monkeypatch):
+    first = FeatureCache(make_dataset(emodb_dir), TRANSFORMS, tmp_path / 'cache', num_workers=1)
+    monkeypatch.setattr(LogMelSpectrogram, 'version', LogMelSpectrogram.version + 1)
+    second = FeatureCache(make_dataset(emodb_dir), TRANSFORMS, tmp_path / 'cache', num_workers=1)
+    assert first.cache_dir != second.cache_dir
@@ -0,0 +1,46 @@
+from pathlib import Path
+import torch
+from parse_config import ConfigParser
+from utils import CheckpointWriter, read_json
+
+
+def test_retention_covers_earlier_checkpoints(tmp_path):
+    # left by a previous run in the same directory, epoch 2 being the best one
+    for epoch, score in [(1, 0.9), (2, 0.1), (3, 0.5)]:
+        torch.save({'epoch': epoch, 'score': score}, str(tmp_path / 'checkpoint-epoch{}.pth'.format(epoch)))
+
+    writer = CheckpointWriter(tmp_path, keep_last=2, keep_best=1, mode='min')
+    writer.save({'epoch': 4, 'score': 0.7}, 4, score=0.7)
+    writer.close()
+
+    assert sorted(path.name for path in tmp_path.glob('checkpoint-epoch*.pth')) == \
+        ['checkpoint-epoch2.pth', 'checkpoint-epoch3.pth', 'checkpoint-epoch4.pth']
+
+
+def test_best_checkpoint_is_linked(tmp_path):
+    writer = CheckpointWriter(tmp_path, keep_last=1)
+    writer.save({'weights': torch.ones(2)}, 1, score=1.0, best=True)
+    writer.save({'weights': torch.zeros(2)}, 2, score=2.0)
+    writer.close()
+
+    assert not (tmp_path / 'checkpoint-epoch1.pth').exists()
+    assert torch.equal(torch.load(str(tmp_path / 'model_best.pth'))['weights'], torch.ones(2))
+
+
+def test_trained_checkpoint_loads(emodb_dir, tmp_path):
+    # imported here, as train.py seeds the random generators when imported
+    from train import build_trainer
+    from test import load_model
+
+    config = read_json(Path(__file__).resolve().parents[1] / 'emodb_config.json')
+    config['dataset']['args']['root_dir'] = emodb_dir
+    config['data_loader']['batch_size'] = 8
+    config['trainer'].update({'epochs': 1, 'save_dir': str(tmp_path), 'verbosity': 0})
+    config = ConfigParser(config, run_id='test')
+    build_trainer(config).train()
+
+    path = config.save_dir / 'checkpoint-epoch1.pth'
+    # nothing but tensors and plain python objects, as torch.load expects by default from torch 2.6
+    assert torch.load(str(path), weights_only=True)['config']['arch'] == config['arch']
+    model, _ = load_model(config, path, torch.device('cpu'))
+    assert not model.training
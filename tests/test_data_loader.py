@@ -0,0 +1,67 @@
+import torch
+from data_loader import DataLoader, pad_collate
+from data_loader.data_loader import BucketBatchSampler
+
+
+def test_pad_collate_pads_with_silence():
+    short, long = torch.full((1, 4, 3), -80.0), torch.zeros(1, 4, 5)
+    short[..., 0] = -20.0
+    data, lengths, target = pad_collate([(short, 0), (long, 1)])
+    assert data.shape == (2, 1, 4, 5)
+    assert lengths.tolist() == [3, 5]
+    assert target.tolist() == [0, 1]
+    assert torch.equal(data[0, ..., :3], short)
+    assert (data[0, ..., 3:] == -80.0).all()
+
+
+def test_bucket_batches():
+    durations = [3.0, 1.0, 2.0, 5.0, 4.0, 6.0, 0.5]
+    sampler = BucketBatchSampler(durations, 2, shuffle=False)
+    assert list(sampler) == [[6, 1], [2, 0], [4, 3], [5]]
+    assert len(sampler) == 4
+
+    sampler = BucketBatchSampler(durations, 2, shuffle=True)
+    batches = list(sampler)
+    assert sorted(idx for batch in batches for idx in batch) == list(range(len(durations)))
+
+
+class Clips(torch.utils.data.Dataset):
+    def __init__(self, durations):
+        self.durations = durations
+
+    def __len__(self):
+        return len(self.durations)
+
+    def __getitem__(self, idx):
+        return torch.zeros(1, 2, int(self.durations[idx])), 0
+
+    def get_duration(self, idx):
+        return self.durations[idx]
+
+
+def test_bucketing_follows_shuffle():
+    data_loader = DataLoader(Clips([3, 1, 2, 5, 4, 6]), batch_size=2, shuffle=False, validation_split=0.0,
+                             bucketing=True)
+    assert [lengths.tolist() for _, lengths, _ in data_loader] == [[1, 2], [3, 4], [5, 6]]
+
+
+def test_distributed_buckets_are_resharded_every_epoch():
+    durations = list(range(20))
+    samplers = [BucketBatchSampler(durations, 3, shuffle=True, num_replicas=2, rank=rank) for rank in range(2)]
+    shards = []
+    for epoch in range(2):
+        for sampler in samplers:
+            sampler.set_epoch(epoch)
+        epoch_shards = [sorted(idx for batch in sampler for idx in batch) for sampler in samplers]
+        assert len(samplers[0]) == len(samplers[1])
+        assert sorted(epoch_shards[0] + epoch_shards[1]) == list(range(20))
+        shards.append(epoch_shards[0])
+    assert shards[0] != shards[1]
+
+
+def test_distributed_validation_buckets_are_exact():
+    samplers = [BucketBatchSampler(list(range(7)), 2, shuffle=False, num_replicas=2, rank=rank, pad=False)
+                for rank in range(2)]
+    batches = [list(sampler) for sampler in samplers]
+    assert sorted(idx for rank in batches for batch in rank for idx in batch) == list(range(7))
+    assert [len(sampler) for sampler in samplers] == [2, 2]
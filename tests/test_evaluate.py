@@ -0,0 +1,26 @@
+import pytest
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+from model.loss import nll_loss
+from model.metric import accuracy
+from test import group_checkpoints, evaluate_models
+
+CONFIG = {'dataset': {'type': 'EMODB'}, 'transforms': {'type': 'LogMelSpectrogram'}, 'data_loader': {},
+          'loss': 'nll_loss', 'metrics': ['accuracy']}
+
+
+def test_checkpoints_are_grouped_by_quantized_flag(tmp_path):
+    # the names do not tell which checkpoint is quantized
+    paths = [tmp_path / 'a.pth', tmp_path / 'b.pth', tmp_path / 'c-int8.pth']
+    for path, quantized in zip(paths, [False, True, False]):
+        torch.save({'state_dict': {}, 'quantized': quantized}, str(path))
+
+    groups = group_checkpoints(paths, CONFIG)
+    assert sorted([path.name for path in group] for _, group in groups) == [['a.pth', 'c-int8.pth'], ['b.pth']]
+
+
+def test_empty_loader_is_reported():
+    data_loader = DataLoader(TensorDataset(torch.zeros(0, 4), torch.zeros(0, dtype=torch.long)), batch_size=2)
+    model = lambda data, lengths: torch.log_softmax(data, 1)
+    with pytest.raises(ValueError, match='empty'):
+        evaluate_models([model], data_loader, nll_loss, [accuracy], torch.device('cpu'))
@@ -0,0 +1,39 @@
+import os
+import shutil
+import datasets.manifest as module_manifest
+from datasets.datasets import EMODB
+from datasets.manifest import Manifest, MANIFEST_NAME
+
+
+def test_manifest_is_updated_incrementally(emodb_dir):
+    manifest, n_probed = Manifest.build(emodb_dir, EMODB.parse, num_workers=1)
+    assert n_probed == len(manifest) == 20
+    assert os.path.isfile(os.path.join(emodb_dir, MANIFEST_NAME))
+
+    # one clip removed, one added, the others are not probed again
+    paths = sorted(str(path) for path in manifest['path'])
+    os.remove(os.path.join(emodb_dir, paths[0]))
+    shutil.copyfile(os.path.join(emodb_dir, paths[1]), os.path.join(emodb_dir, '16b10Wz.wav'))
+    manifest, n_probed = Manifest.build(emodb_dir, EMODB.parse, num_workers=1)
+    assert n_probed == 1
+    assert len(manifest) == 20
+    assert '16b10Wz.wav' in manifest['path'] and paths[0] not in manifest['path']
+    assert not [name for name in os.listdir(emodb_dir) if name.endswith('.tmp')]
+
+
+def test_dataset_reads_the_manifest(emodb_dir):
+    training, validation = EMODB(emodb_dir, training=True), EMODB(emodb_dir, training=False)
+    assert len(training) + len(validation) == 20
+    assert not set(map(training.get_path, range(len(training)))) & \
+        set(map(validation.get_path, range(len(validation))))
+
+
+def test_read_only_corpus(emodb_dir, tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    # the tests may run as root, which can write anywhere
+    monkeypatch.setattr(module_manifest.os, 'access', lambda path, mode: False)
+    dataset = EMODB(emodb_dir, training=None)
+    assert len(dataset) == 20
+    assert not os.path.exists(os.path.join(emodb_dir, MANIFEST_NAME))
+    assert module_manifest.default_path(emodb_dir).is_file()
+    assert str(tmp_path / 'cache') in str(module_manifest.default_path(emodb_dir))
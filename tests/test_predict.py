@@ -0,0 +1,16 @@
+import pytest
+import torch
+from predict import PredictionWriter
+
+
+@pytest.mark.parametrize('suffix', ['.jsonl', '.csv'])
+def test_failed_files_are_retried(tmp_path, suffix):
+    fname = tmp_path / ('predictions' + suffix)
+    writer = PredictionWriter(fname, 3)
+    writer.write('a.wav', torch.tensor([0.1, 0.7, 0.2]))
+    writer.write('b.wav', error='decoding failed')
+    writer.close()
+
+    writer = PredictionWriter(fname, 3)
+    assert writer.done == {'a.wav'}
+    writer.close()
@@ -0,0 +1,79 @@
+import io
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import torch
+import torchaudio
+from model.model import SpeechEmotionModel
+from datasets.transforms import LogMelSpectrogram
+from serve import MicroBatcher, InferenceServer
+
+
+def test_cancelled_requests_are_skipped():
+    async def scenario():
+        batcher = MicroBatcher(lambda features: [x * 2 for x in features], 8, 50, ThreadPoolExecutor(1))
+        runner = batcher.start()
+        cancelled = asyncio.create_task(batcher.submit(1))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        results = await asyncio.wait_for(asyncio.gather(batcher.submit(2), batcher.submit(3)), 5)
+        # the batcher is still running after the cancellation
+        later = await asyncio.wait_for(batcher.submit(4), 5)
+        runner.cancel()
+        return results, later
+
+    assert asyncio.run(scenario()) == ([4, 6], 8)
+
+
+def test_large_bodies_are_refused():
+    server = InferenceServer(SpeechEmotionModel(emotions=7).eval(), LogMelSpectrogram(16000, 1, 512, 128),
+                             torch.device('cpu'), max_body_bytes=100)
+
+    async def scenario():
+        listener = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'POST /predict HTTP/1.1\r\nContent-Length: 1000\r\n\r\n' + b'0' * 1000)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        listener.close()
+        return response
+
+    assert asyncio.run(scenario()).startswith(b'HTTP/1.1 413')
+
+
+def test_requests_are_batched():
+    # built outside of the event loop, as by main
+    server = InferenceServer(SpeechEmotionModel(emotions=7).eval(), LogMelSpectrogram(16000, 1, 512, 128),
+                             torch.device('cpu'), max_wait_ms=50)
+    body = io.BytesIO()
+    torchaudio.save(body, torch.randn(1, 8000) * 0.1, 16000, format='wav')
+
+    async def request(port, method, target, body=b''):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write('{} {} HTTP/1.1\r\nContent-Length: {}\r\nConnection: close\r\n\r\n'.format(
+            method, target, len(body)).encode() + body)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        return response.split(b'\r\n\r\n', 1)
+
+    async def scenario():
+        batcher = server.batcher.start()
+        listener = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        predictions = await asyncio.wait_for(asyncio.gather(
+            *[request(port, 'POST', '/predict', body.getvalue()) for _ in range(3)]), 30)
+        metrics = await asyncio.wait_for(request(port, 'GET', '/metrics'), 5)
+        listener.close()
+        batcher.cancel()
+        return predictions, metrics
+
+    predictions, metrics = asyncio.run(scenario())
+    for head, content in predictions:
+        assert head.startswith(b'HTTP/1.1 200')
+        assert len(json.loads(content)['probabilities']) == 7
+    metrics = json.loads(metrics[1])
+    assert metrics['requests'] == 3
+    assert sum(int(size) * count for size, count in metrics['batch_size_histogram'].items()) == 3
@@ -0,0 +1,168 @@
+import json
+import types
+import hashlib
+import pytest
+import torch
+import datasets.shards as module_shards
+from datasets.datasets import EMODB
+from datasets.shards import ShardedDataset, write_shards, INDEX_NAME
+from datasets.transforms import FixedLengthWaveform
+from data_loader import DataLoader
+from parse_config import ConfigParser
+from test import setup_data_loader
+from utils import inf_loop, set_loader_epoch
+
+
+@pytest.fixture
+def shards_dir(emodb_dir, tmp_path):
+    """
+    Shards of at most 4 clips of the training and validation splits of the corpus
+    """
+    output_dir = tmp_path / 'shards'
+    index = {'dataset': 'EMODB', 'splits': {}}
+    for split, training in [('train', True), ('valid', False)]:
+        index['splits'][split] = write_shards(EMODB(emodb_dir, training=training), output_dir, split, shard_size=4)
+    with open(output_dir / INDEX_NAME, 'wt') as handle:
+        json.dump(index, handle)
+    return str(output_dir)
+
+
+def clip_keys(clips):
+    return [hashlib.sha1(data.numpy().tobytes()).hexdigest() for data, _ in clips]
+
+
+def run_as(monkeypatch, rank=0, world_size=1, worker=0, n_workers=1):
+    """
+    Simulates the given worker of the given process of a distributed run
+    """
+    monkeypatch.setattr(module_shards, '_is_distributed', lambda: world_size > 1)
+    monkeypatch.setattr(module_shards, 'dist', types.SimpleNamespace(get_rank=lambda: rank,
+                                                                     get_world_size=lambda: world_size))
+    monkeypatch.setattr(module_shards, 'get_worker_info',
+                        lambda: types.SimpleNamespace(id=worker, num_workers=n_workers) if n_workers > 1 else None)
+
+
+def read_as(monkeypatch, dataset, rank=0, world_size=1, worker=0, n_workers=1):
+    """
+    Clips yielded by the given worker of the given process of a (simulated) distributed run
+    """
+    run_as(monkeypatch, rank, world_size, worker, n_workers)
+    return clip_keys(dataset)
+
+
+def test_every_clip_once_per_epoch(shards_dir):
+    dataset = ShardedDataset(shards_dir, shuffle_buffer=8)
+    first, second = clip_keys(dataset), clip_keys(dataset)
+    assert len(first) == len(dataset) == 16
+    assert len(set(first)) == 16
+    assert sorted(first) == sorted(second)
+    # the shards and the clips are reshuffled at every epoch
+    assert first != second
+
+
+@pytest.mark.parametrize('n_workers', [2, 5, 7])
+def test_workers_split_the_clips(shards_dir, monkeypatch, n_workers):
+    # 4 training shards, so that 5 and 7 workers split the clips of some shards
+    dataset = ShardedDataset(shards_dir, shuffle_buffer=8)
+    clips = []
+    for worker in range(n_workers):
+        dataset.set_epoch(1)
+        worker_clips = read_as(monkeypatch, dataset, worker=worker, n_workers=n_workers)
+        assert worker_clips
+        clips.extend(worker_clips)
+    assert len(clips) == len(set(clips)) == 16
+
+
+@pytest.mark.parametrize('world_size,n_workers', [(2, 1), (2, 2), (3, 2)])
+def test_distributed_processes_stay_in_step(shards_dir, monkeypatch, world_size, n_workers):
+    dataset = ShardedDataset(shards_dir, shuffle_buffer=8)
+    clips = []
+    for rank in range(world_size):
+        rank_clips = []
+        for worker in range(n_workers):
+            dataset.set_epoch(1)
+            rank_clips.extend(read_as(monkeypatch, dataset, rank, world_size, worker, n_workers))
+        assert len(rank_clips) == 16 // world_size
+        clips.extend(rank_clips)
+    # without repeats when the clips split evenly between the readers
+    if 16 % (world_size * n_workers) == 0:
+        assert len(set(clips)) == 16
+
+
+def test_single_shard_is_split_between_processes(emodb_dir, tmp_path, monkeypatch):
+    output_dir = tmp_path / 'shards'
+    index = {'dataset': 'EMODB', 'splits': {'valid': []}}
+    index['splits']['train'] = write_shards(EMODB(emodb_dir, training=True), output_dir, 'train', shard_size=100)
+    with open(output_dir / INDEX_NAME, 'wt') as handle:
+        json.dump(index, handle)
+
+    dataset = ShardedDataset(str(output_dir), shuffle_buffer=8)
+    ranks = []
+    for rank in range(2):
+        dataset.set_epoch(1)
+        ranks.append(read_as(monkeypatch, dataset, rank, world_size=2))
+    assert len(ranks[0]) == len(ranks[1]) == 8
+    assert not set(ranks[0]) & set(ranks[1])
+
+
+@pytest.fixture
+def uneven_shards_dir(emodb_dir, tmp_path):
+    """
+    Training shards of 5, 5, 5 and 1 clips
+    """
+    output_dir = tmp_path / 'uneven'
+    index = {'dataset': 'EMODB', 'splits': {'valid': []}}
+    index['splits']['train'] = write_shards(EMODB(emodb_dir, training=True), output_dir, 'train', shard_size=5)
+    with open(output_dir / INDEX_NAME, 'wt') as handle:
+        json.dump(index, handle)
+    return str(output_dir)
+
+
+def test_length_counts_the_batches_of_every_worker(uneven_shards_dir):
+    dataset = ShardedDataset(uneven_shards_dir, transforms=FixedLengthWaveform(16000, 1), shuffle_buffer=8)
+    data_loader = DataLoader(dataset, batch_size=4, shuffle=False, validation_split=0.0, num_workers=3)
+    for epoch in range(1, 4):
+        set_loader_epoch(data_loader, epoch)
+        # every worker ends with a partial batch of its own
+        assert len(data_loader) > -(-len(dataset) // 4)
+        batches = list(data_loader)
+        assert len(batches) == len(data_loader)
+        assert sum(len(target) for _, target in batches) == 16
+
+
+@pytest.mark.parametrize('world_size', [2, 3])
+def test_length_counts_the_batches_of_every_distributed_worker(uneven_shards_dir, monkeypatch, world_size):
+    dataset = ShardedDataset(uneven_shards_dir, shuffle_buffer=8)
+    for rank in range(world_size):
+        run_as(monkeypatch, rank, world_size)
+        dataset.set_epoch(1)
+        lengths = dataset.worker_lengths(3)
+        for worker in range(3):
+            dataset.set_epoch(1)
+            assert len(read_as(monkeypatch, dataset, rank, world_size, worker, n_workers=3)) == lengths[worker]
+
+
+@pytest.mark.parametrize('num_workers', [0, 1])
+def test_inf_loop_reshuffles_every_pass(shards_dir, num_workers):
+    # worker copies of the dataset are made anew at every pass, from the one of the main process
+    dataset = ShardedDataset(shards_dir, transforms=FixedLengthWaveform(16000, 1), shuffle_buffer=8)
+    data_loader = DataLoader(dataset, batch_size=4, shuffle=False, validation_split=0.0, num_workers=num_workers)
+    batches = inf_loop(data_loader)
+    first = [next(batches)[0] for _ in range(4)]
+    second = [next(batches)[0] for _ in range(4)]
+    assert not all(torch.equal(a, b) for a, b in zip(first, second))
+
+
+def test_test_split_of_a_shards_config(shards_dir, tmp_path):
+    config = ConfigParser({
+        'name': 'shards',
+        'transforms': {'type': 'LogMelSpectrogram',
+                       'args': {'sample_rate': 16000, 'audio_length': 1, 'n_fft': 512, 'hop_length': 256}},
+        'dataset': {'type': 'ShardedDataset', 'args': {'root_dir': shards_dir, 'training': True,
+                                                       'shuffle_buffer': 8}},
+        'data_loader': {'batch_size': 4, 'shuffle': True, 'validation_split': 0.1},
+        'trainer': {'save_dir': str(tmp_path / 'saved')}
+    })
+    data_loader, batch_transforms = setup_data_loader(config, batch_size=4)
+    assert batch_transforms is None
+    assert sum(len(target) for _, target in data_loader) == 4
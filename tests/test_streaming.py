@@ -0,0 +1,20 @@
+import torch
+from model.model import SpeechEmotionModel
+from model.streaming import StreamingEmotionRecognizer
+from datasets.transforms import LogMelSpectrogram
+
+
+def test_frames_match_training_spectrogram():
+    torch.manual_seed(0)
+    waveform = torch.randn(16000)
+    model = SpeechEmotionModel(emotions=7)
+    streamer = StreamingEmotionRecognizer(model, 16000, n_fft=512, hop_length=128,
+                                          window_frames=1000 * model.time_reduction)
+    # chunks shorter than the STFT padding, then uneven ones
+    for start, end in [(0, 100), (100, 250), (250, 4000), (4000, 16000)]:
+        streamer.process(waveform[start:end])
+
+    expected = LogMelSpectrogram(16000, 1, 512, 128, variable_length=True)(waveform)
+    n_frames = streamer.frames.shape[1]
+    assert n_frames > 0
+    assert torch.allclose(streamer.frames, expected[:, :n_frames], atol=1e-3)
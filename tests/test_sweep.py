@@ -0,0 +1,10 @@
+import json
+from sweep import rank_results
+
+
+def test_failed_trials_rank_last():
+    results = [{'trial': 0, 'score': 0.5}, {'trial': 1, 'score': None}, {'trial': 2, 'score': 0.2}]
+    assert [result['trial'] for result in rank_results(results, 'min')] == [2, 0, 1]
+    assert [result['trial'] for result in rank_results(results, 'max')] == [0, 2, 1]
+    # the leaderboard stays valid JSON
+    json.dumps(rank_results(results, 'min'), allow_nan=False)
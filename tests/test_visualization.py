@@ -0,0 +1,31 @@
+import logging
+import pytest
+from logger.visualization import TensorboardWriter
+
+pytest.importorskip('torch.utils.tensorboard')
+
+
+def test_failing_summary_does_not_stop_the_writer(tmp_path, caplog):
+    writer = TensorboardWriter(tmp_path, logging.getLogger('test'), True)
+    writer.set_step(1)
+
+    def fail():
+        raise ValueError('broken image')
+
+    writer.add_image('input', fail)
+    writer.add_scalar('loss', 1.0)
+    writer.close()
+
+    assert "'input/train' could not be written: broken image" in caplog.text
+    assert list(tmp_path.glob('events.out.tfevents.*'))
+
+
+def test_close_returns_when_the_thread_is_gone(tmp_path):
+    writer = TensorboardWriter(tmp_path, logging.getLogger('test'), True, max_queue=2, close_timeout=1)
+    writer.queue.put(None)
+    writer.thread.join()
+    writer.set_step(1)
+    for step in range(5):
+        writer.add_scalar('loss', float(step))
+    writer.close()
+    assert writer.dropped > 0
@@ -4,13 +4,17 @@ import torch
 import numpy as np
 import datasets.transforms as module_transforms
 import datasets.datasets as module_data
+import datasets.audio_store as module_audio_store
+import datasets.cache as module_cache
 import model.loss as module_loss
 import model.metric as module_metric
 import model.model as module_arch
 from data_loader import DataLoader
+from data_loader.autotune import autotune_loader
 from parse_config import ConfigParser
 from trainer import Trainer
-from utils import prepare_device
+from utils import prepare_device, write_json, is_distributed, is_main_process, init_distributed, \
+    cleanup_distributed, main_process_first, broadcast_object
 
 
 # fix random seeds for reproducibility
@@ -20,12 +24,45 @@ torch.backends.cudnn.deterministic = True
 torch.backends.cudnn.benchmark = False
 np.random.seed(SEED)
 
-def main(config):
+def build_trainer(config, autotune=False, dataset=None, batch_transforms=None):
+    """
+    Builds the dataset, data loaders, model, optimizer and trainer described by the config
+
+    :param dataset: Dataset to train on instead of the one of the config, along with its batch transforms.
+    """
     logger = config.get_logger('train')
 
+    # join the other processes when launched by torchrun
+    distributed = is_distributed()
+    if distributed:
+        device = init_distributed(config['n_gpu'])
+
     # setup dataset
-    transforms = config.init_obj('transforms', module_transforms)
-    dataset = config.init_obj('dataset', module_data, transforms=transforms)
+    if dataset is None:
+        transforms = config.init_obj('transforms', module_transforms)
+        transforms, batch_transforms = module_transforms.split_transforms(transforms)
+        # the first process of every machine builds the manifest, which may be on a disk of that machine, then the
+        # main process builds the audio store and the feature cache, the others then read them
+        with main_process_first(local=True):
+            dataset = config.init_obj('dataset', module_data, transforms=transforms)
+        with main_process_first():
+            if config.get('audio_store') is not None:
+                dataset = config.init_obj('audio_store', module_audio_store, dataset)
+            if config.get('feature_cache') is not None:
+                dataset = config.init_obj('feature_cache', module_cache, dataset, config['transforms'])
+    assert batch_transforms is None or not config['data_loader'].get('bucketing', False), \
+        'bucketing needs per-clip transforms with "variable_length": true, batch transforms pad every clip.'
+
+    # time the data loader settings on this machine, and save the fastest ones
+    if autotune:
+        # timed by the main process only, the others wait for its settings
+        settings = None
+        if is_main_process():
+            logger.info('Autotuning data loader settings...')
+            settings = autotune_loader(dataset, config['data_loader'], logger=logger)
+        config['data_loader'].update(broadcast_object(settings))
+        if is_main_process():
+            write_json(config.config, config.save_dir / 'config.json')
 
     # setup data_loader instances
     data_loader = DataLoader(dataset=dataset, **config['data_loader'])
@@ -35,11 +72,17 @@ def main(config):
     model = config.init_obj('arch', module_arch)
     logger.info(model)
 
-    # prepare for (multi-device) GPU training
-    device, device_ids = prepare_device(config['n_gpu'])
-    model = model.to(device)
-    if len(device_ids) > 1:
-        model = torch.nn.DataParallel(model, device_ids=device_ids)
+    if distributed:
+        # one process per device (or per CPU socket), gradients are averaged over the processes
+        model = model.to(device)
+        device_ids = [device.index] if device.type == 'cuda' else None
+        model = torch.nn.parallel.DistributedDataParallel(model, device_ids=device_ids)
+    else:
+        # prepare for (multi-device) GPU training
+        device, device_ids = prepare_device(config['n_gpu'])
+        model = model.to(device)
+        if len(device_ids) > 1:
+            model = torch.nn.DataParallel(model, device_ids=device_ids)
 
     # get function handles of loss and metrics
     criterion = getattr(module_loss, config['loss'])
@@ -50,14 +93,24 @@ def main(config):
     optimizer = config.init_obj('optimizer', torch.optim, trainable_params)
     lr_scheduler = config.init_obj('lr_scheduler', torch.optim.lr_scheduler, optimizer)
 
+    # augmentations of the training batches, if configured
+    augment = config.init_obj('augment', module_transforms) if config.get('augment') is not None else None
+
     trainer = Trainer(model, criterion, metrics, optimizer,
                       config=config,
                       device=device,
                       data_loader=data_loader,
                       valid_data_loader=valid_data_loader,
-                      lr_scheduler=lr_scheduler)
+                      lr_scheduler=lr_scheduler,
+                      batch_transforms=batch_transforms,
+                      augment=augment)
+    return trainer
+
 
+def main(config, autotune=False):
+    trainer = build_trainer(config, autotune)
     trainer.train()
+    cleanup_distributed()
 
 
 if __name__ == '__main__':
@@ -68,12 +121,14 @@ if __name__ == '__main__':
                       help='path to latest checkpoint (default: None)')
     args.add_argument('-d', '--device', default=None, type=str,
                       help='indices of GPUs to enable (default: all)')
+    args.add_argument('--autotune-loader', action='store_true',
+                      help='time data loader worker/prefetch settings and use the fastest (default: off)')
 
     # custom cli options to modify configuration from default values given in json file.
     CustomArgs = collections.namedtuple('CustomArgs', 'flags type target')
     options = [
         CustomArgs(['--lr', '--learning_rate'], type=float, target='optimizer;args;lr'),
-        CustomArgs(['--bs', '--batch_size'], type=int, target='data_loader;args;batch_size')
+        CustomArgs(['--bs', '--batch_size'], type=int, target='data_loader;batch_size')
     ]
     config = ConfigParser.from_args(args, options)
-    main(config)
+    main(config, autotune=args.parse_args().autotune_loader)
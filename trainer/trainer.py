@@ -1,8 +1,17 @@
 import numpy as np
 import torch
-from torchvision.utils import make_grid
+from torch.utils.data import IterableDataset
 from base import BaseTrainer
-from utils import inf_loop, MetricTracker
+from data_loader import unpack_batch
+from utils import inf_loop, set_loader_epoch, MetricTracker, StepProfiler, unwrap_model, is_main_process
+
+
+def input_grid(data):
+    """
+    Grid of the input batch for tensorboard, torchvision being imported only once images are logged
+    """
+    from torchvision.utils import make_grid
+    return make_grid(data.cpu(), nrow=8, normalize=True)
 
 
 class Trainer(BaseTrainer):
@@ -10,13 +19,14 @@ class Trainer(BaseTrainer):
     Trainer class
     """
     def __init__(self, model, criterion, metric_ftns, optimizer, config, device,
-                 data_loader, valid_data_loader=None, lr_scheduler=None, len_epoch=None):
+                 data_loader, valid_data_loader=None, lr_scheduler=None, len_epoch=None,
+                 batch_transforms=None, augment=None):
         super().__init__(model, criterion, metric_ftns, optimizer, config)
         self.config = config
         self.device = device
         self.data_loader = data_loader
-        if len_epoch is None:
-            # epoch-based training
+        self.epoch_based = len_epoch is None
+        if self.epoch_based:
             self.len_epoch = len(self.data_loader)
         else:
             # iteration-based training
@@ -25,10 +35,24 @@ class Trainer(BaseTrainer):
         self.valid_data_loader = valid_data_loader
         self.do_validation = self.valid_data_loader is not None
         self.lr_scheduler = lr_scheduler
-        self.log_step = int(np.sqrt(data_loader.batch_size))
-
-        self.train_metrics = MetricTracker('loss', *[m.__name__ for m in self.metric_ftns], writer=self.writer)
-        self.valid_metrics = MetricTracker('loss', *[m.__name__ for m in self.metric_ftns], writer=self.writer)
+        self.batch_transforms = batch_transforms
+        if self.batch_transforms is not None:
+            self.batch_transforms = self.batch_transforms.to(self.device)
+        # batch augmentations, of the training batches only
+        self.augment = augment
+        self.log_step = int(np.sqrt(data_loader.batch_sampler.batch_size))
+
+        self.train_metrics = MetricTracker('loss', *[m.__name__ for m in self.metric_ftns], writer=self.writer,
+                                           device=self.device)
+        self.valid_metrics = MetricTracker('loss', *[m.__name__ for m in self.metric_ftns], writer=self.writer,
+                                           device=self.device)
+
+        # wall time per stage of the loops, and optional torch.profiler trace of a few training steps
+        cfg_profiler = config['trainer'].get('profiler', {})
+        trace_dir = config.log_dir / 'trace' if is_main_process() else None
+        self.train_profiler = StepProfiler(self.device, sync=cfg_profiler.get('sync', False),
+                                           trace=cfg_profiler.get('trace'), trace_dir=trace_dir)
+        self.valid_profiler = StepProfiler(self.device, sync=cfg_profiler.get('sync', False))
 
     def _train_epoch(self, epoch):
         """
@@ -39,30 +63,69 @@ class Trainer(BaseTrainer):
         """
         self.model.train()
         self.train_metrics.reset()
-        for batch_idx, (data, target) in enumerate(self.data_loader):
-            data, target = data.to(self.device), target.to(self.device)
+        self.writer.set_epoch(epoch)
+        # reshuffle the shards of a distributed run or of a streamed dataset, inf_loop does it at every pass
+        set_loader_epoch(self.data_loader, epoch)
+        if self.epoch_based:
+            # the batches of a streamed dataset split between workers may differ in number from epoch to epoch
+            self.len_epoch = len(self.data_loader)
+        profiler = self.train_profiler
+        profiler.start(epoch)
+        for batch_idx, batch in enumerate(self.data_loader):
+            profiler.mark('data')
+            data, target, lengths = unpack_batch(batch, self.device)
+            profiler.mark('to_device')
+            if self.batch_transforms is not None:
+                data = self.batch_transforms(data)
+                profiler.mark('transform')
+            mix = None
+            if self.augment is not None:
+                data, lengths, mix = self.augment(data, target, lengths)
+                profiler.mark('augment')
 
             self.optimizer.zero_grad()
-            output = self.model(data)
-            loss = self.criterion(output, target)
-            loss.backward()
-            self.optimizer.step()
+            with self._autocast():
+                output = self.model(data, lengths)
+                profiler.mark('forward')
+                loss = self.criterion(output, target)
+                if mix is not None:
+                    # mixup, the mixed in targets weigh as much as their share of the inputs
+                    mixed_target, weight = mix
+                    loss = weight * loss + (1 - weight) * self.criterion(output, mixed_target)
+            profiler.mark('loss')
+            if self.scaler is not None:
+                self.scaler.scale(loss).backward()
+                profiler.mark('backward')
+                self.scaler.step(self.optimizer)
+                self.scaler.update()
+            else:
+                loss.backward()
+                profiler.mark('backward')
+                self.optimizer.step()
+            profiler.mark('step')
 
             self.writer.set_step((epoch - 1) * self.len_epoch + batch_idx)
-            self.train_metrics.update('loss', loss.item())
+            self.train_metrics.update('loss', loss)
             for met in self.metric_ftns:
                 self.train_metrics.update(met.__name__, met(output, target))
+            profiler.mark('metrics')
 
             if batch_idx % self.log_step == 0:
                 self.logger.debug('Train Epoch: {} {} Loss: {:.6f}'.format(
                     epoch,
                     self._progress(batch_idx),
                     loss.item()))
-                self.writer.add_image('input', make_grid(data.cpu(), nrow=8, normalize=True))
+            # the grid is only made, in the writer thread, when the images are due
+            self.writer.add_image('input', lambda data=data: input_grid(data))
+            profiler.mark('logging')
+            profiler.step()
 
-            if batch_idx == self.len_epoch:
+            # epoch-based training goes through the whole data loader
+            if not self.epoch_based and batch_idx == self.len_epoch:
                 break
+        profiler.stop()
         log = self.train_metrics.result()
+        self._log_stages('Train', profiler)
 
         if self.do_validation:
             val_log = self._valid_epoch(epoch)
@@ -81,28 +144,55 @@ class Trainer(BaseTrainer):
         """
         self.model.eval()
         self.valid_metrics.reset()
+        # the shards of the validation split may differ in size, so the processes must not synchronize
+        model = unwrap_model(self.model)
+        profiler = self.valid_profiler
+        profiler.start()
         with torch.no_grad():
-            for batch_idx, (data, target) in enumerate(self.valid_data_loader):
-                data, target = data.to(self.device), target.to(self.device)
-
-                output = self.model(data)
-                loss = self.criterion(output, target)
+            for batch_idx, batch in enumerate(self.valid_data_loader):
+                profiler.mark('data')
+                data, target, lengths = unpack_batch(batch, self.device)
+                profiler.mark('to_device')
+                if self.batch_transforms is not None:
+                    data = self.batch_transforms(data)
+                    profiler.mark('transform')
+
+                with self._autocast():
+                    output = model(data, lengths)
+                    profiler.mark('forward')
+                    loss = self.criterion(output, target)
+                profiler.mark('loss')
 
                 self.writer.set_step((epoch - 1) * len(self.valid_data_loader) + batch_idx, 'valid')
-                self.valid_metrics.update('loss', loss.item())
+                self.valid_metrics.update('loss', loss)
                 for met in self.metric_ftns:
                     self.valid_metrics.update(met.__name__, met(output, target))
-                self.writer.add_image('input', make_grid(data.cpu(), nrow=8, normalize=True))
-
-        # add histogram of model parameters to the tensorboard
+                profiler.mark('metrics')
+                self.writer.add_image('input', lambda data=data: input_grid(data))
+                profiler.mark('logging')
+                profiler.step()
+        profiler.stop()
+        self._log_stages('Valid', profiler)
+
+        # add histogram of model parameters to the tensorboard, copied as training goes on updating them
         for name, p in self.model.named_parameters():
-            self.writer.add_histogram(name, p, bins='auto')
+            if self.writer.due(name, 'histogram'):
+                self.writer.add_histogram(name, p.detach().clone(), bins='auto')
         return self.valid_metrics.result()
 
+    def _log_stages(self, name, profiler):
+        self.logger.info('{} time per step: {}'.format(name, profiler.summary()))
+        for stage, seconds in profiler.result().items():
+            self.writer.add_scalar('stage_time/{}'.format(stage), seconds)
+
+    def _autocast(self):
+        return torch.autocast(self.device.type, dtype=self.amp_dtype, enabled=self.amp_dtype is not None)
+
     def _progress(self, batch_idx):
         base = '[{}/{} ({:.0f}%)]'
-        if hasattr(self.data_loader, 'n_samples'):
-            current = batch_idx * self.data_loader.batch_size
+        # streamed datasets are counted in batches, as every worker ends with a partial batch of its own
+        if hasattr(self.data_loader, 'n_samples') and not isinstance(self.data_loader.dataset, IterableDataset):
+            current = batch_idx * self.data_loader.batch_sampler.batch_size
             total = self.data_loader.n_samples
         else:
             current = batch_idx
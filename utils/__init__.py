@@ -1 +1,4 @@
 from .util import *
+from .distributed import *
+from .checkpoint import *
+from .profiler import *
@@ -0,0 +1,149 @@
+import os
+import re
+import queue
+import shutil
+import threading
+from pathlib import Path
+import torch
+
+
+def snapshot(state):
+    """
+    copy of a checkpoint state where every tensor is detached and copied to CPU memory,
+    so that training can go on updating the originals while the copy is written
+    """
+    if torch.is_tensor(state):
+        return state.detach().to('cpu', copy=True)
+    if isinstance(state, dict):
+        return type(state)((k, snapshot(v)) for k, v in state.items())
+    if isinstance(state, (list, tuple)):
+        return type(state)(snapshot(v) for v in state)
+    return state
+
+
+def load_checkpoint(path, map_location='cpu', mmap=False):
+    """
+    loads a checkpoint written by the trainer or by quantize.py. `weights_only` is turned off explicitly, as it is
+    on by default from torch 2.6 and refuses the quantized tensors of int8 checkpoints: only load checkpoints of
+    trusted runs
+
+    :param mmap: Memory-maps the file, so that the tensors are only read when used.
+    """
+    return torch.load(str(path), map_location=map_location, mmap=mmap, weights_only=False)
+
+
+class CheckpointWriter:
+    """
+    Writes checkpoints from a background thread, atomically, and deletes the ones
+    falling out of the retention policy. Checkpoints already in the directory, e.g. when resuming a run in it,
+    fall under the policy too, ranked by the 'score' they were saved with
+
+    :param checkpoint_dir: Directory of the checkpoints.
+    :param keep_last: Number of most recent checkpoints to keep, None keeps all of them.
+    :param keep_best: Number of best scoring checkpoints to keep on top of the most recent ones.
+    :param mode: 'min' or 'max', whether lower or higher scores are better.
+    :param max_pending: Number of snapshots waiting to be written before `save` blocks.
+    """
+    def __init__(self, checkpoint_dir, keep_last=None, keep_best=0, mode='min', logger=None, max_pending=2):
+        self.checkpoint_dir = Path(checkpoint_dir)
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        self.mode = mode
+        self.logger = logger
+        self.saved = self._scan() if keep_last is not None else []  # (epoch, path, score) of the checkpoints on disk
+        self.error = None
+
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self._run, name='checkpoint-writer', daemon=True)
+        self.thread.start()
+
+    def save(self, state, epoch, score=None, best=False):
+        """
+        Snapshots the state to CPU memory and queues it to be written as checkpoint-epoch<epoch>.pth,
+        linked to model_best.pth if it is the best one
+        """
+        self._raise_error()
+        self.queue.put((snapshot(state), epoch, score, best))
+
+    def close(self):
+        """
+        Waits for the pending checkpoints to be written
+        """
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError('Checkpoint writer failed') from error
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue
+            try:
+                self._write(*item)
+            except Exception as error:
+                self.error = error
+
+    def _scan(self):
+        """
+        (epoch, path, score) of the checkpoints already in the directory, scores being read only if needed
+        """
+        saved = []
+        for path in self.checkpoint_dir.glob('checkpoint-epoch*.pth'):
+            match = re.fullmatch(r'checkpoint-epoch(\d+)\.pth', path.name)
+            if match is None:
+                continue
+            score = None
+            if self.keep_best > 0:
+                # memory-mapped, so that the weights are not read
+                score = load_checkpoint(path, mmap=True).get('score')
+            saved.append((int(match.group(1)), path, score))
+        return sorted(saved)
+
+    def _write(self, state, epoch, score, best):
+        path = self.checkpoint_dir / 'checkpoint-epoch{}.pth'.format(epoch)
+        tmp_path = path.with_name(path.name + '.tmp')
+        torch.save(state, str(tmp_path))
+        os.replace(str(tmp_path), str(path))
+        self._log("Saving checkpoint: {} ...".format(path))
+
+        if best:
+            # same file under another name, instead of serializing the state again
+            best_path = self.checkpoint_dir / 'model_best.pth'
+            tmp_path = best_path.with_name(best_path.name + '.tmp')
+            if tmp_path.exists():
+                tmp_path.unlink()
+            try:
+                os.link(str(path), str(tmp_path))
+            except OSError:
+                shutil.copyfile(str(path), str(tmp_path))
+            os.replace(str(tmp_path), str(best_path))
+            self._log("Saving current best: model_best.pth ...")
+
+        self.saved = [entry for entry in self.saved if entry[0] != epoch] + [(epoch, path, score)]
+        self._apply_retention()
+
+    def _apply_retention(self):
+        if self.keep_last is None:
+            return
+        keep = {epoch for epoch, _, _ in sorted(self.saved)[-self.keep_last:]} if self.keep_last > 0 else set()
+        scored = [entry for entry in self.saved if entry[2] is not None]
+        scored.sort(key=lambda entry: entry[2], reverse=self.mode == 'max')
+        keep.update(epoch for epoch, _, _ in scored[:self.keep_best])
+
+        for epoch, path, score in list(self.saved):
+            if epoch not in keep:
+                # model_best.pth is a separate link, and outlives the epoch checkpoint it came from
+                path.unlink(missing_ok=True)
+                self.saved.remove((epoch, path, score))
+
+    def _log(self, message):
+        if self.logger is not None:
+            self.logger.info(message)
@@ -0,0 +1,92 @@
+import os
+from contextlib import contextmanager
+import torch
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+
+
+def get_rank():
+    """
+    rank of this process, as set by torchrun. 0 when not running distributed
+    """
+    return int(os.environ.get('RANK', 0))
+
+def get_world_size():
+    return int(os.environ.get('WORLD_SIZE', 1))
+
+def is_distributed():
+    return get_world_size() > 1
+
+def is_main_process():
+    return get_rank() == 0
+
+def is_local_main_process():
+    """
+    whether this process is the first one of its machine
+    """
+    return int(os.environ.get('LOCAL_RANK', 0)) == 0
+
+def init_distributed(n_gpu_use):
+    """
+    join the process group set up by torchrun: nccl with one GPU per process if GPUs are configured
+    and available, gloo on CPU otherwise. returns the device of this process
+    """
+    local_rank = int(os.environ.get('LOCAL_RANK', 0))
+    if n_gpu_use > 0 and torch.cuda.is_available():
+        device = torch.device('cuda', local_rank)
+        torch.cuda.set_device(device)
+        backend = 'nccl'
+    else:
+        device = torch.device('cpu')
+        backend = 'gloo'
+    if not dist.is_initialized():
+        dist.init_process_group(backend)
+    return device
+
+def cleanup_distributed():
+    if dist.is_available() and dist.is_initialized():
+        # wait for the main process to finish writing before tearing the group down
+        dist.barrier()
+        dist.destroy_process_group()
+
+def all_reduce_sum(tensor):
+    """
+    sum of the tensor over every process, the tensor itself when not running distributed
+    """
+    if not (dist.is_available() and dist.is_initialized()):
+        return tensor
+    # nccl only reduces GPU tensors
+    device = torch.device('cuda', torch.cuda.current_device()) if dist.get_backend() == 'nccl' else tensor.device
+    reduced = tensor.to(device)
+    dist.all_reduce(reduced)
+    return reduced.to(tensor.device)
+
+def broadcast_object(obj):
+    """
+    the object of the main process, in every process. the object itself when not running distributed
+    """
+    if not (dist.is_available() and dist.is_initialized()):
+        return obj
+    objects = [obj]
+    dist.broadcast_object_list(objects, src=0)
+    return objects[0]
+
+@contextmanager
+def main_process_first(local=False):
+    """
+    let the main process run the block (e.g. building a cache) before the others. with `local`, the first process
+    of every machine runs it, for files written to a disk of the machine
+    """
+    first = is_local_main_process() if local else is_main_process()
+    wait = dist.is_available() and dist.is_initialized()
+    if wait and not first:
+        dist.barrier()
+    yield
+    if wait and first:
+        dist.barrier()
+
+def unwrap_model(model):
+    """
+    the model wrapped by DistributedDataParallel, so that checkpoints do not depend on the number of processes
+    """
+    return model.module if isinstance(model, DistributedDataParallel) else model
@@ -0,0 +1,86 @@
+import time
+from pathlib import Path
+import torch
+
+
+class StepProfiler:
+    """
+    Wall time spent in each stage of a loop, accumulated over an epoch by marking the end of every stage
+
+        profiler.start(epoch)
+        for batch in data_loader:
+            profiler.mark('data')
+            ...
+            profiler.mark('forward')
+            profiler.step()
+        profiler.stop()
+
+    :param device: Device the loop runs on.
+    :param sync: Whether to wait for the device at every mark, so that asynchronous GPU work is counted in the
+        stage which launched it rather than in the next one waiting for it. Adds a little overhead.
+    :param trace: Optional dict with the `epoch` and the `start` and `end` steps of a torch.profiler trace.
+    :param trace_dir: Directory the trace is saved to, readable by TensorBoard.
+    """
+    def __init__(self, device='cpu', sync=False, trace=None, trace_dir=None):
+        self.device = torch.device(device)
+        self.sync = sync and self.device.type == 'cuda'
+        self.trace = trace
+        self.trace_dir = trace_dir
+        self.tracer = None
+        self.totals = {}
+        self.steps = 0
+        self._last = None
+
+    def start(self, epoch=None):
+        self.totals = {}
+        self.steps = 0
+        if self.trace is not None and self.trace_dir is not None and epoch == self.trace.get('epoch', 1):
+            self.tracer = self._make_tracer()
+            self.tracer.start()
+        self._last = time.perf_counter()
+
+    def mark(self, stage):
+        """
+        Counts the time since the previous mark towards the stage
+        """
+        if self.sync:
+            torch.cuda.synchronize(self.device)
+        now = time.perf_counter()
+        self.totals[stage] = self.totals.get(stage, 0.0) + now - self._last
+        self._last = now
+
+    def step(self):
+        self.steps += 1
+        if self.tracer is not None:
+            self.tracer.step()
+
+    def stop(self):
+        if self.tracer is not None:
+            self.tracer.stop()
+            self.tracer = None
+        return self.result()
+
+    def result(self):
+        return dict(self.totals)
+
+    def summary(self):
+        """
+        One line with the mean time per step of every stage, and its share of the total
+        """
+        total = sum(self.totals.values())
+        steps = max(self.steps, 1)
+        return ' | '.join('{} {:.1f}ms ({:.0%})'.format(stage, 1000 * seconds / steps, seconds / total if total else 0)
+                          for stage, seconds in self.totals.items())
+
+    def _make_tracer(self):
+        start, end = self.trace['start'], self.trace['end']
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if self.device.type == 'cuda':
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        return torch.profiler.profile(
+            activities=activities,
+            schedule=torch.profiler.schedule(wait=max(start - 1, 0), warmup=min(start, 1), active=end - start,
+                                             repeat=1),
+            on_trace_ready=torch.profiler.tensorboard_trace_handler(str(Path(self.trace_dir))),
+            record_shapes=True
+        )
@@ -1,9 +1,9 @@
 import json
 import torch
-import pandas as pd
 from pathlib import Path
-from itertools import repeat
+from itertools import count
 from collections import OrderedDict
+from .distributed import all_reduce_sum
 
 
 def ensure_dir(dirname):
@@ -21,10 +21,17 @@ def write_json(content, fname):
     with fname.open('wt') as handle:
         json.dump(content, handle, indent=4, sort_keys=False)
 
+def set_loader_epoch(data_loader, epoch):
+    ''' lets the sampler, batch sampler and dataset of the data loader that support it reshuffle for the epoch. '''
+    for obj in [getattr(data_loader, name, None) for name in ['sampler', 'batch_sampler', 'dataset']]:
+        if hasattr(obj, 'set_epoch'):
+            obj.set_epoch(epoch)
+
 def inf_loop(data_loader):
-    ''' wrapper function for endless data loader. '''
-    for loader in repeat(data_loader):
-        yield from loader
+    ''' wrapper function for endless data loader, reshuffling its samplers and dataset at every pass. '''
+    for epoch in count(1):
+        set_loader_epoch(data_loader, epoch)
+        yield from data_loader
 
 def prepare_device(n_gpu_use):
     """
@@ -44,24 +51,62 @@ def prepare_device(n_gpu_use):
     return device, list_ids
 
 class MetricTracker:
-    def __init__(self, *keys, writer=None):
+    """
+    Running averages of metrics, and optionally a confusion matrix, accumulated as tensors on the device the
+    values are computed on, so that updates never wait for the device. Python numbers are only produced by
+    `result` and `class_result`, at the end of an epoch.
+    """
+    def __init__(self, *keys, writer=None, n_classes=None, device='cpu'):
         self.writer = writer
-        self._data = pd.DataFrame(index=keys, columns=['total', 'counts', 'average'])
+        self.keys = {key: i for i, key in enumerate(keys)}
+        self.n_classes = n_classes
+        self.device = torch.device(device)
         self.reset()
 
     def reset(self):
-        for col in self._data.columns:
-            self._data[col].values[:] = 0
+        self._total = torch.zeros(len(self.keys), dtype=torch.float64, device=self.device)
+        self._counts = [0] * len(self.keys)
+        self._confusion = None
+        if self.n_classes is not None:
+            self._confusion = torch.zeros(self.n_classes, self.n_classes, dtype=torch.int64, device=self.device)
 
     def update(self, key, value, n=1):
         if self.writer is not None:
             self.writer.add_scalar(key, value)
-        self._data.total[key] += value * n
-        self._data.counts[key] += n
-        self._data.average[key] = self._data.total[key] / self._data.counts[key]
+        if torch.is_tensor(value):
+            value = value.detach()
+        i = self.keys[key]
+        self._total[i] += value * n
+        self._counts[i] += n
+
+    def update_confusion(self, output, target):
+        """
+        adds the predictions of a batch to the confusion matrix, rows are targets and columns predictions
+        """
+        pred = torch.argmax(output.detach(), dim=1)
+        # index_add_, unlike bincount, does not read the maximum index back from the device
+        cells = target * self.n_classes + pred
+        self._confusion.view(-1).index_add_(0, cells, torch.ones_like(cells))
 
     def avg(self, key):
-        return self._data.average[key]
+        return self.result()[key]
 
     def result(self):
-        return dict(self._data.average)
+        # single transfer from the device, averages over every process when running distributed
+        counts = torch.tensor(self._counts, dtype=torch.float64, device=self.device)
+        total, counts = all_reduce_sum(torch.stack([self._total, counts])).tolist()
+        return {key: total[i] / counts[i] if counts[i] else 0.0 for key, i in self.keys.items()}
+
+    def confusion(self):
+        return all_reduce_sum(self._confusion).cpu()
+
+    def class_result(self):
+        """
+        per-class precision, recall and F1 score, from the confusion matrix
+        """
+        confusion = self.confusion().double()
+        correct = confusion.diag()
+        precision = correct / confusion.sum(0).clamp(min=1)
+        recall = correct / confusion.sum(1).clamp(min=1)
+        f1 = 2 * precision * recall / (precision + recall).clamp(min=1e-12)
+        return {'precision': precision.tolist(), 'recall': recall.tolist(), 'f1': f1.tolist()}